@@ -0,0 +1,228 @@
+import argparse
+import random
+from pathlib import Path
+
+from src.modelling.autotune import (
+    TUNABLE_SETTINGS,
+    parse_setting,
+    pick_best,
+    save_profile,
+    tune,
+)
+from src.modelling.fake import add_fake_backend_args, fake_backend_kwargs
+from src.utils.json import load_json
+from renal_biopsy.qa import (
+    RenalBiopsyFakeQA,
+    RenalBiopsyLlamaCppQA,
+    RenalBiopsyLlamaServerQA,
+    RenalBiopsyOllamaQA,
+)
+
+# Finds the fastest performance settings for a backend and model on this host,
+# and saves them as a profile for rb_script.py --profile. Example usage:
+# python rb_autotune_script.py --backend llamacpp --root_dir src/renal_biopsy
+# --model_name models/Phi-3.5-mini-instruct-Q5_K_M.gguf --n_sample 8
+# --n_threads 4 8 --n_batch 256 512 --n_workers 1 2
+# python rb_autotune_script.py --backend ollama --root_dir src/renal_biopsy
+# --model_name qwen2.5:1.5b-instruct-fp16 --num_ctx default 4096 --concurrency 1 2 4
+# then: python rb_script.py ... --profile src/renal_biopsy/data/profiles/<profile>.json
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backend",
+        help="Model backend (ollama, llamacpp, llamaserver for a llama.cpp HTTP "
+        "server, or fake for load tests without a model)",
+        choices=["ollama", "llamacpp", "llamaserver", "fake"],
+        required=True,
+    )
+    parser.add_argument(
+        "--root_dir", help="Root directory for data modality", required=True, type=str
+    )
+    parser.add_argument("--model_name", help="LLM to use", required=True, type=str)
+    parser.add_argument(
+        "--n_shots",
+        help="Number of few-shot samples to use in prompt",
+        default=2,
+        type=int,
+    )
+    parser.add_argument(
+        "--include_guidelines",
+        help="Include entity guidelines in prompt?",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--input_file",
+        help="Input reports sampled for calibration (created by rb_script.py)",
+        default="real_input.json",
+        type=str,
+    )
+    parser.add_argument(
+        "--n_sample",
+        help="Number of reports measured per combination of settings",
+        default=8,
+        type=int,
+    )
+    parser.add_argument("--seed", help="Seed of the report sample", default=0, type=int)
+    parser.add_argument(
+        "--timeout",
+        help="Per-request timeout in seconds (Ollama and llama.cpp server only)",
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--max_p95",
+        help="Only pick settings whose p95 call latency is within this many seconds",
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--server_url",
+        help="URL of the llama.cpp server (llamaserver only)",
+        default="http://127.0.0.1:8080",
+        type=str,
+    )
+    parser.add_argument(
+        "--output",
+        help="Profile file (default: <root_dir>/data/profiles/<backend>_<model>.json)",
+        default=None,
+        type=str,
+    )
+    # Grid values; 'default' leaves the backend's default
+    parser.add_argument(
+        "--concurrency",
+        help="Concurrent requests to try (ollama, llamaserver and fake; Ollama "
+        "serves at most OLLAMA_NUM_PARALLEL of them at once)",
+        nargs="+",
+        default=[1, 2, 4],
+        type=int,
+    )
+    parser.add_argument(
+        "--num_thread",
+        help="Ollama num_thread values to try",
+        nargs="+",
+        default=[None],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--num_ctx",
+        help="Ollama num_ctx values to try",
+        nargs="+",
+        default=[None],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--num_batch",
+        help="Ollama num_batch values to try",
+        nargs="+",
+        default=[None],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--n_threads",
+        help="llama.cpp threads per worker to try",
+        nargs="+",
+        default=[None],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--n_batch",
+        help="llama.cpp n_batch values to try",
+        nargs="+",
+        default=[None, 512, 1024],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--use_mmap",
+        help="llama.cpp use_mmap values to try (true/false)",
+        nargs="+",
+        default=[True],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--n_ctx",
+        help="llama.cpp context sizes to try ('auto' sizes it from the longest prompt)",
+        nargs="+",
+        default=["auto"],
+        type=parse_setting,
+    )
+    parser.add_argument(
+        "--n_workers",
+        help="llama.cpp worker processes to try",
+        nargs="+",
+        default=[1, 2],
+        type=int,
+    )
+    add_fake_backend_args(parser)
+    args = parser.parse_args()
+
+    if args.backend == "llamacpp" and None in args.n_ctx:
+        raise ValueError("--n_ctx values must be 'auto' or a context size.")
+
+    root_dir = Path(args.root_dir)
+    input_path = root_dir / "data" / args.input_file
+    if not input_path.exists():
+        raise FileNotFoundError(
+            f"Input reports not found: {input_path} "
+            "(run rb_script.py once to create it)"
+        )
+    input_json = load_json(input_path)
+    reports = random.Random(args.seed).sample(
+        input_json, min(args.n_sample, len(input_json))
+    )
+
+    model_class = {
+        "ollama": RenalBiopsyOllamaQA,
+        "llamacpp": RenalBiopsyLlamaCppQA,
+        "llamaserver": RenalBiopsyLlamaServerQA,
+        "fake": RenalBiopsyFakeQA,
+    }[args.backend]
+    model_kwargs = {}
+    if args.backend == "fake":
+        model_kwargs.update(fake_backend_kwargs(args))
+    if args.backend == "llamaserver":
+        model_kwargs["base_url"] = args.server_url
+
+    grid = {name: getattr(args, name) for name in TUNABLE_SETTINGS[args.backend]}
+    print(f"Calibrating {args.model_name} on {len(reports)} reports over {grid}")
+    results = tune(
+        model_class,
+        args.model_name,
+        args.root_dir,
+        reports,
+        grid,
+        n_shots=args.n_shots,
+        include_guidelines=args.include_guidelines,
+        timeout=args.timeout,
+        model_kwargs=model_kwargs,
+    )
+
+    print("\nAutotune results:")
+    print("=" * 100)
+    print(f"{'Reports/s':12} {'p50 (s)':12} {'p95 (s)':12} Settings")
+    print("-" * 100)
+    for result in results:
+        if "error" in result:
+            print(f"{'error':12} {'':12} {'':12} {result['settings']}")
+            continue
+        print(
+            f"{result['reports_per_second']:<12} {str(result['p50_seconds']):<12} "
+            f"{str(result['p95_seconds']):<12} {result['settings']}"
+        )
+
+    best = pick_best(results, args.max_p95)
+    if best is None:
+        raise RuntimeError("Every combination of settings failed; no profile saved.")
+
+    model_label = Path(args.model_name).name.replace(".gguf", "").replace(":", "_")
+    output_path = args.output or (
+        root_dir / "data" / "profiles" / f"{args.backend}_{model_label}.json"
+    )
+    save_profile(output_path, args.backend, args.model_name, best, results)
+    print(f"\nBest settings: {best['settings']}")
+    if args.backend == "ollama" and best["settings"]["concurrency"] > 1:
+        print(
+            f"Serve with OLLAMA_NUM_PARALLEL>={best['settings']['concurrency']} "
+            "so that concurrent requests are not queued"
+        )
+    print(f"Profile saved to {output_path}")
@@ -0,0 +1,224 @@
+import argparse
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src.preprocessing.guidelines import EntityGuidelines
+from src.renal_biopsy.preprocessor import RenalBiopsyProcessor
+from src.utils.json import load_json, parse_failure_rate, save_json
+from renal_biopsy.qa import RenalBiopsyOllamaQA, RenalBiopsyLlamaCppQA
+
+# Compares extraction variants on the same reports, reporting accuracy and
+# throughput for each. Example usage:
+# python rb_benchmark_script.py --backend ollama --root_dir src/renal_biopsy
+# --model_name qwen2.5:1.5b-instruct-fp16 --n_shots 2 --n_prototype 2
+# --include_guidelines --pack_sizes 1 2 --compare_structured_output
+# --compare_normalised_prompts
+
+
+def run_extraction(model, backend: str, input_json: list, args, pack_size: int):
+    """
+    Run one extraction variant.
+
+    Returns:
+        Tuple of predictions and the raw-answer parse failure rate (Ollama
+        only, None for llama.cpp whose answers are always schema-constrained)
+    """
+    extraction_kwargs = {
+        "n_shots": args.n_shots,
+        "n_prototype": args.n_prototype,
+        "include_guidelines": args.include_guidelines,
+    }
+    if pack_size > 1:
+        extraction_kwargs["pack_size"] = pack_size
+    extract = (
+        model.extract_packed if pack_size > 1 else model.extract_with_known_entities
+    )
+
+    if backend == "ollama":
+        generated_answers = extract(
+            input_json, concurrency=args.concurrency, **extraction_kwargs
+        )
+        predicted_json = model.convert_generated_answers_to_json(
+            generated_answers=generated_answers,
+            input_json=input_json,
+            n_prototype=args.n_prototype,
+        )
+        return predicted_json, parse_failure_rate(generated_answers)
+    return extract(input_json, **extraction_kwargs), None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backend",
+        help="Model backend (ollama or llamacpp)",
+        choices=["ollama", "llamacpp"],
+        required=True,
+    )
+    parser.add_argument(
+        "--root_dir", help="Root directory for data modality", required=True, type=str
+    )
+    parser.add_argument("--model_name", help="LLM to use", required=True, type=str)
+    parser.add_argument(
+        "--n_shots",
+        help="Number of few-shot samples to use in prompt",
+        default=2,
+        type=int,
+    )
+    parser.add_argument(
+        "--n_prototype",
+        help="Number of annotated samples to run",
+        default=2,
+        type=int,
+    )
+    parser.add_argument(
+        "--include_guidelines",
+        help="Include entity guidelines in prompt?",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--raw_data",
+        help="Name of raw report data file",
+        default="synthetic_data.xlsx",
+        type=str,
+    )
+    parser.add_argument(
+        "--annotated_reports",
+        help="Name of annotated reports file",
+        default="synthetic_annotations.json",
+        type=str,
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of concurrent Ollama requests",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--pack_sizes",
+        help="Reports per LLM call to compare (1 is one report per call)",
+        nargs="+",
+        default=[1, 4],
+        type=int,
+    )
+    parser.add_argument(
+        "--compare_normalised_prompts",
+        help="Also run each variant with whitespace-normalised prompts",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compare_structured_output",
+        help="Also run each pack size with schema-constrained Ollama output",
+        action="store_true",
+    )
+    args = parser.parse_args()
+
+    root_dir = Path(args.root_dir)
+    required_files = {
+        "guidelines": root_dir / "data" / "guidelines.xlsx",
+        "raw_data": root_dir / "data" / args.raw_data,
+        "annotated_reports": root_dir / "data" / args.annotated_reports,
+    }
+
+    for file_path in required_files.values():
+        if not file_path.exists():
+            raise FileNotFoundError(f"Required file not found: {file_path}")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_dir = root_dir / "data" / "runs" / f"benchmark_{timestamp}"
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    eg = EntityGuidelines(required_files["guidelines"])
+    processor = RenalBiopsyProcessor(guidelines=eg)
+    input_json = processor.create_input_json(
+        data_path=required_files["raw_data"], full=True
+    )
+    annotated_json = load_json(required_files["annotated_reports"])
+    args.n_prototype = min(args.n_prototype, len(annotated_json), len(input_json))
+
+    model_class = (
+        RenalBiopsyOllamaQA if args.backend == "ollama" else RenalBiopsyLlamaCppQA
+    )
+    model = model_class(model_path=args.model_name, root_dir=args.root_dir)
+
+    variants = [
+        {"pack_size": pack_size, "structured_output": False, "normalise_prompts": False}
+        for pack_size in args.pack_sizes
+    ]
+    if args.backend == "ollama" and args.compare_structured_output:
+        variants += [
+            {
+                "pack_size": pack_size,
+                "structured_output": True,
+                "normalise_prompts": False,
+            }
+            for pack_size in args.pack_sizes
+        ]
+    if args.compare_normalised_prompts:
+        variants += [
+            {**variant, "normalise_prompts": True}
+            for variant in variants
+            if not variant["normalise_prompts"]
+        ]
+
+    # Prompt tokens per report with and without normalisation
+    prompt_tokens = model.compare_prompt_tokens(
+        input_json, args.n_shots, args.n_prototype, args.include_guidelines
+    )
+
+    results = []
+    for variant in variants:
+        print(f"\nRunning {variant}")
+        pack_size = variant["pack_size"]
+        model.normalise_prompts = variant["normalise_prompts"]
+        if args.backend == "ollama":
+            model.structured_output = variant["structured_output"]
+        start_time = time.perf_counter()
+        predicted_json, failure_rate = run_extraction(
+            model, args.backend, input_json, args, pack_size
+        )
+        elapsed = time.perf_counter() - start_time
+
+        _, score_per_report, final_score = model.evaluate(
+            annotated_json, predicted_json, n_prototypes=args.n_prototype
+        )
+        suffix = "_structured" if variant["structured_output"] else ""
+        suffix += "_normalised" if variant["normalise_prompts"] else ""
+        save_json(
+            predicted_json, results_dir / f"predicted_pack{pack_size}{suffix}.json"
+        )
+        token_key = (
+            "tokens_normalised" if variant["normalise_prompts"] else "tokens_raw"
+        )
+        results.append(
+            {
+                **variant,
+                "n_reports": args.n_prototype,
+                "prompt_tokens": sum(counts[token_key] for counts in prompt_tokens),
+                "seconds": round(elapsed, 2),
+                "reports_per_second": round(args.n_prototype / elapsed, 3),
+                "n_requeried": model.n_requeried if pack_size > 1 else 0,
+                "parse_failure_rate": failure_rate,
+                "score_per_report": score_per_report,
+                "final_score": final_score,
+            }
+        )
+
+    print("\nBenchmark results:")
+    print("=" * 112)
+    print(
+        f"{'Pack size':12} {'Structured':12} {'Normalised':12} {'Prompt tok':12} "
+        f"{'Reports/s':12} {'Re-queried':12} {'Parse fails':12} {'Final score':12}"
+    )
+    print("-" * 112)
+    for result in results:
+        print(
+            f"{result['pack_size']:<12} {str(result['structured_output']):<12} "
+            f"{str(result['normalise_prompts']):<12} {result['prompt_tokens']:<12} "
+            f"{result['reports_per_second']:<12} {result['n_requeried']:<12} "
+            f"{str(result['parse_failure_rate']):<12} {result['final_score']:<12}"
+        )
+
+    save_json(results, results_dir / "benchmark_results.json")
+    print(f"Results saved to {results_dir}")
@@ -5,16 +5,21 @@ from pathlib import Path
 
 from src.preprocessing.guidelines import EntityGuidelines
 from src.renal_biopsy.preprocessor import RenalBiopsyProcessor
-from src.utils.json import save_json
+from src.utils.json import save_json, save_jsonl
 from src.utils.general import write_metadata_file
+from src.utils.checkpoint import RunCheckpoint
+from src.modelling.cache import ResponseCache
+from src.modelling.fake import add_fake_backend_args, fake_backend_kwargs
+from src.modelling.scheduler import ModelScheduler
+from src.evaluate.laaj import DEFAULT_JUDGE_MODEL
 from automated_annotation.disagreement import DisagreementAnnotator
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--backend",
-        help="Model backend (ollama or llamacpp)",
-        choices=["ollama", "llamacpp"],
+        help="Model backend (ollama, llamacpp, or fake for load tests without a model)",
+        choices=["ollama", "llamacpp", "fake"],
         required=True,
     )
     parser.add_argument(
@@ -55,6 +60,66 @@ if __name__ == "__main__":
         default="full_data.xlsx",
         type=str,
     )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of concurrent Ollama requests (match OLLAMA_NUM_PARALLEL)",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Per-request timeout in seconds (Ollama only)",
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--reuse_prefix",
+        help="Reuse the evaluated static prompt prefix (KV cache) across reports",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--schedule",
+        help="Run the two models one after another, unloading each when done "
+        "(sequential), or side by side if they fit in --memory_budget_gb (concurrent)",
+        choices=["sequential", "concurrent"],
+        default="sequential",
+    )
+    parser.add_argument(
+        "--memory_budget_gb",
+        help="Memory available for models loaded at the same time (Ollama only)",
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--judge_concurrency",
+        help="Maximum number of concurrent LLM judge requests",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--resume",
+        help="Run directory of an interrupted run to resume from its checkpoints",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="LLM response cache directory (default: <root_dir>/data/cache)",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--cache_max_mb",
+        help="Maximum response cache size in MB before LRU eviction",
+        default=1024,
+        type=float,
+    )
+    parser.add_argument(
+        "--no_cache",
+        help="Disable the LLM response cache (always off with --backend fake)",
+        action="store_true",
+    )
+    add_fake_backend_args(parser)
     args = parser.parse_args()
 
     if args.n_prototype > 2111:
@@ -71,9 +136,14 @@ if __name__ == "__main__":
         if not file_path.exists():
             raise FileNotFoundError(f"Required file not found: {file_path}")
 
-    # Create results directory
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    results_dir = root_dir / "data" / "runs" / timestamp
+    # Create results directory, or reuse the one being resumed
+    if args.resume:
+        results_dir = Path(args.resume)
+        if not results_dir.exists():
+            raise FileNotFoundError(f"Run directory not found: {results_dir}")
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        results_dir = root_dir / "data" / "runs" / timestamp
     data_dir = results_dir / "data"
     data_dir.mkdir(parents=True, exist_ok=True)
 
@@ -82,6 +152,15 @@ if __name__ == "__main__":
         if file_path.suffix == ".xlsx":
             shutil.copy2(file_path, data_dir / file_path.name)
 
+    # Response cache shared across runs; fake runs are load tests, so every
+    # request must reach the backend
+    cache = None
+    if not args.no_cache and args.backend != "fake":
+        cache = ResponseCache(
+            args.cache_dir or root_dir / "data" / "cache",
+            max_size_mb=args.cache_max_mb,
+        )
+
     # Initialise metadata
     metadata = {
         "args": vars(args),
@@ -91,6 +170,10 @@ if __name__ == "__main__":
         "disagreement_modelling_end_time": None,
         "reports_for_review": None,
         "n_reports_for_review": None,
+        "model_scheduling": None,
+        "generation": None,
+        "response_cache_hits": None,
+        "response_cache_misses": None,
     }
     write_metadata_file(results_dir / "metadata.txt", metadata)
 
@@ -114,59 +197,57 @@ if __name__ == "__main__":
             model_path_2=args.model_2_name,
             backend=args.backend,
             root_dir=str(root_dir),
+            reuse_prefix=args.reuse_prefix,
+            cache=cache,
+            model_kwargs=fake_backend_kwargs(args) if args.backend == "fake" else None,
         )
 
         metadata["total_annotation_start_time"] = datetime.now().strftime(
             "%Y-%m-%d %H:%M:%S"
         )
 
-        # Run model 1
-        if args.backend == "ollama":
-            model_1_answers = da.model_1.extract_with_known_entities(
-                input_json,
-                n_shots=args.n_shots,
-                n_prototype=args.n_prototype,
-                include_guidelines=args.include_guidelines,
-            )
-            save_json(model_1_answers, results_dir / "model_1_generated_answers.json")
-            model_1_predicted = da.model_1.convert_generated_answers_to_json(
-                generated_answers=model_1_answers,
-                input_json=input_json,
-                n_prototype=args.n_prototype,
-            )
-        else:
-            model_1_predicted = da.model_1.extract_with_known_entities(
-                input_json,
-                n_shots=args.n_shots,
-                n_prototype=args.n_prototype,
-                include_guidelines=args.include_guidelines,
-            )
-
-        save_json(model_1_predicted, results_dir / "model_1_predicted.json")
-
-        # Run model 2
-        if args.backend == "ollama":
-            model_2_answers = da.model_2.extract_with_known_entities(
-                input_json,
-                n_shots=args.n_shots,
-                n_prototype=args.n_prototype,
-                include_guidelines=args.include_guidelines,
-            )
-            save_json(model_2_answers, results_dir / "model_2_generated_answers.json")
-            model_2_predicted = da.model_2.convert_generated_answers_to_json(
-                generated_answers=model_2_answers,
-                input_json=input_json,
-                n_prototype=args.n_prototype,
-            )
-        else:
-            model_2_predicted = da.model_2.extract_with_known_entities(
-                input_json,
-                n_shots=args.n_shots,
-                n_prototype=args.n_prototype,
-                include_guidelines=args.include_guidelines,
-            )
-
-        save_json(model_2_predicted, results_dir / "model_2_predicted.json")
+        def run_model(model, name: str):
+            """Run one model over all reports and save its predictions."""
+            checkpoint = RunCheckpoint(results_dir / f"{name}_checkpoint.jsonl")
+            if args.backend in ("ollama", "fake"):
+                answers = model.extract_with_known_entities(
+                    input_json,
+                    n_shots=args.n_shots,
+                    n_prototype=args.n_prototype,
+                    include_guidelines=args.include_guidelines,
+                    concurrency=args.concurrency,
+                    timeout=args.timeout,
+                    checkpoint=checkpoint,
+                )
+                save_json(answers, results_dir / f"{name}_generated_answers.json")
+                predicted = model.convert_generated_answers_to_json(
+                    generated_answers=answers,
+                    input_json=input_json,
+                    n_prototype=args.n_prototype,
+                )
+            else:
+                predicted = model.extract_with_known_entities(
+                    input_json,
+                    n_shots=args.n_shots,
+                    n_prototype=args.n_prototype,
+                    include_guidelines=args.include_guidelines,
+                    checkpoint=checkpoint,
+                )
+            save_json(predicted, results_dir / f"{name}_predicted.json")
+            return predicted
+
+        # Run all work for one model before the next, so models are not
+        # swapped in and out of memory
+        scheduler = ModelScheduler(
+            backend=args.backend, memory_budget_gb=args.memory_budget_gb
+        )
+        model_1_predicted, model_2_predicted = scheduler.run(
+            [
+                (args.model_1_name, lambda: run_model(da.model_1, "model_1")),
+                (args.model_2_name, lambda: run_model(da.model_2, "model_2")),
+            ],
+            concurrent=args.schedule == "concurrent",
+        )
 
         metadata["total_annotation_end_time"] = datetime.now().strftime(
             "%Y-%m-%d %H:%M:%S"
@@ -182,11 +263,21 @@ if __name__ == "__main__":
             "%Y-%m-%d %H:%M:%S"
         )
 
-        entity_answers, report_counts, review_reports = da.analyse_disagreements(
-            model_1_predicted,
-            model_2_predicted,
-            disagreement_threshold=args.disagreement_threshold,
-            n_prototype=args.n_prototype,
+        # All judge comparisons run in one batch with the judge model loaded
+        [(entity_answers, report_counts, review_reports)] = scheduler.run(
+            [
+                (
+                    DEFAULT_JUDGE_MODEL,
+                    lambda: da.analyse_disagreements(
+                        model_1_predicted,
+                        model_2_predicted,
+                        disagreement_threshold=args.disagreement_threshold,
+                        n_prototype=args.n_prototype,
+                        judge_concurrency=args.judge_concurrency,
+                    ),
+                )
+            ],
+            backend="fake" if args.backend == "fake" else "ollama",
         )
 
         metadata["disagreement_modelling_end_time"] = datetime.now().strftime(
@@ -203,6 +294,19 @@ if __name__ == "__main__":
         print(f"Error during disagreement analysis: {e}")
         raise
 
+    metadata["model_scheduling"] = scheduler.summary()
+    metadata["generation"] = {
+        "model_1": da.model_1.summarise_call_stats(),
+        "model_2": da.model_2.summarise_call_stats(),
+    }
+    save_jsonl(
+        da.model_1.call_stats + da.model_2.call_stats, results_dir / "telemetry.jsonl"
+    )
+
+    if cache is not None:
+        metadata["response_cache_hits"] = cache.hits
+        metadata["response_cache_misses"] = cache.misses
+
     # Save final metadata
     write_metadata_file(results_dir / "metadata.txt", metadata)
     print(f"Results saved to {results_dir}")
@@ -1,13 +1,26 @@
 import argparse
+import math
 import shutil
+import time
 from datetime import datetime
 from pathlib import Path
 
+from src.preprocessing.dedup import group_reports
 from src.preprocessing.guidelines import EntityGuidelines
 from src.renal_biopsy.preprocessor import RenalBiopsyProcessor
-from src.utils.json import load_json, save_json
-from src.utils.general import write_metadata_file
-from renal_biopsy.qa import RenalBiopsyOllamaQA, RenalBiopsyLlamaCppQA
+from src.utils.json import load_json, parse_failure_rate, save_json, save_jsonl
+from src.utils.general import read_metadata_file, write_metadata_file
+from src.utils.checkpoint import RunCheckpoint
+from src.modelling.autotune import load_profile, profile_script_defaults
+from src.modelling.cache import ResponseCache
+from src.modelling.cascade import ModelCascade
+from src.modelling.fake import add_fake_backend_args, fake_backend_kwargs
+from renal_biopsy.qa import (
+    RenalBiopsyFakeQA,
+    RenalBiopsyLlamaCppQA,
+    RenalBiopsyLlamaServerQA,
+    RenalBiopsyOllamaQA,
+)
 
 # Example usage:
 # Ollama: python rb_script.py --backend ollama --root_dir src/renal_biopsy
@@ -19,6 +32,40 @@ from renal_biopsy.qa import RenalBiopsyOllamaQA, RenalBiopsyLlamaCppQA
 # LlamaCpp: python rb_script.py --backend llamacpp --root_dir
 # src/renal_biopsy --model_name models/Phi-3.5-mini-instruct-Q5_K_M.gguf
 # --n_shots 2 --n_prototype 1 --include_guidelines
+# LlamaCpp (4 worker processes): add --n_workers 4 to the command above
+# Cascade: add --cascade_model qwen2.5:7b-instruct-q4_K_M so that --model_name answers
+# every report and only doubtful reports are re-run on the larger model
+# Fake (no model, load tests): python rb_script.py --backend fake --root_dir
+# src/renal_biopsy --model_name fake --n_prototype 500 --concurrency 8
+# --fake_latency_ms 200 --fake_failure_rate 0.01 --fake_malformed_rate 0.05
+# llama.cpp server: llama-server -m models/Phi-3.5-mini-instruct-Q5_K_M.gguf
+# -c 16384 --parallel 4 --cont-batching, then python rb_script.py --backend
+# llamaserver --root_dir src/renal_biopsy --model_name phi-3.5 --concurrency 4
+# --n_ctx 4096 --n_shots 2 --include_guidelines
+# Tuned settings: add --profile src/renal_biopsy/data/profiles/<profile>.json saved by
+# rb_autotune_script.py (flags given explicitly still take precedence)
+
+# Arguments that change a run's predictions; --resume refuses to continue a run
+# if any of them differ from the interrupted run's
+RESUME_ARGS = (
+    "backend",
+    "root_dir",
+    "model_name",
+    "n_shots",
+    "n_prototype",
+    "include_guidelines",
+    "raw_data",
+    "annotated_reports",
+    "structured_output",
+    "normalise_prompts",
+    "n_ctx",
+    "num_ctx",
+    "dedup",
+    "dedup_threshold",
+    "fake_failure_rate",
+    "fake_malformed_rate",
+    "fake_seed",
+)
 
 if __name__ == "__main__":
     print(
@@ -29,8 +76,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--backend",
-        help="Model backend (ollama or llamacpp)",
-        choices=["ollama", "llamacpp"],
+        help="Model backend (ollama, llamacpp, llamaserver for a llama.cpp HTTP "
+        "server, or fake for load tests without a model)",
+        choices=["ollama", "llamacpp", "llamaserver", "fake"],
         required=True,
     )
     parser.add_argument(
@@ -66,10 +114,225 @@ if __name__ == "__main__":
         default="updated_output3.json",
         type=str,
     )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of concurrent Ollama or llama.cpp server requests "
+        "(match OLLAMA_NUM_PARALLEL or the server's parallel slots)",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Per-request timeout in seconds (Ollama and llama.cpp server only)",
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--reuse_prefix",
+        help="Reuse the evaluated static prompt prefix (KV cache) across reports",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pack_size",
+        help="Number of reports answered per LLM call (1 disables packing)",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--structured_output",
+        help="Constrain Ollama answers to a JSON schema built from the guidelines",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--normalise_prompts",
+        help="Strip prompt indentation/whitespace and compact few-shot JSON",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--repair_missing",
+        help="Re-query only the entities missing from each prediction",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--n_workers",
+        help="Number of llama.cpp worker processes (llamacpp only)",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--n_threads",
+        help="CPU threads per llama.cpp worker (default: CPU count / n_workers)",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--n_ctx",
+        help="llama.cpp context size, or 'auto' to size it from the longest prompt "
+        "(llamaserver: context size of one server slot, default 4096)",
+        default="auto",
+        type=str,
+    )
+    parser.add_argument(
+        "--n_batch",
+        help="llama.cpp prompt tokens evaluated per batch (llamacpp only)",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--no_mmap",
+        help="Load the GGUF into memory instead of memory-mapping it (llamacpp only)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--num_thread",
+        help="Ollama num_thread option (default: Ollama's choice)",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--num_ctx",
+        help="Ollama num_ctx option (default: the model's context size)",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--num_batch",
+        help="Ollama num_batch option",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Performance profile saved by rb_autotune_script.py; its settings replace "
+        "the defaults of the matching flags",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--server_url",
+        help="URL of the llama.cpp server (llamaserver only)",
+        default="http://127.0.0.1:8080",
+        type=str,
+    )
+    parser.add_argument(
+        "--speculative",
+        help="Speculative decoding (llamacpp only): 'prompt_lookup' to draft tokens "
+        "copied from the prompt, or the path to a small draft GGUF sharing the "
+        "model's vocabulary",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--draft_tokens",
+        help="Number of tokens drafted per speculative decoding step",
+        default=10,
+        type=int,
+    )
+    parser.add_argument(
+        "--cascade_model",
+        help="Larger model for reports the --model_name model answers invalidly "
+        "or in conflict with the spaCy rules",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--no_rule_check",
+        help="Escalate only schema-invalid answers in the cascade, not spaCy conflicts",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--rule_prefill",
+        help="Fix the entities the spaCy rules resolve unambiguously and ask the LLM "
+        "only for the rest",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--decompose",
+        help="Ask for each entity group in its own prompt with only the relevant "
+        "report sentences",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--dedup",
+        help="Extract each group of duplicate reports once: exact (normalised text) "
+        "or near (also MinHash near-duplicates with identical numbers)",
+        choices=["exact", "near"],
+        default=None,
+    )
+    parser.add_argument(
+        "--dedup_threshold",
+        help="Minimum MinHash similarity for --dedup near",
+        default=0.9,
+        type=float,
+    )
+    parser.add_argument(
+        "--resume",
+        help="Run directory of an interrupted run to resume from its checkpoint",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="LLM response cache directory (default: <root_dir>/data/cache)",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--cache_max_mb",
+        help="Maximum response cache size in MB before LRU eviction",
+        default=1024,
+        type=float,
+    )
+    parser.add_argument(
+        "--no_cache",
+        help="Disable the LLM response cache (always off with --backend fake)",
+        action="store_true",
+    )
+    add_fake_backend_args(parser)
     args = parser.parse_args()
+    profile = None
+    if args.profile:
+        # Re-parse so flags given on the command line override the profile
+        profile = load_profile(args.profile, args.backend, args.model_name)
+        parser.set_defaults(**profile_script_defaults(profile))
+        args = parser.parse_args()
+        print(f"Using profile {args.profile}: {profile['settings']}")
+    # The fake backend stands in for Ollama and takes the same code paths
+    ollama_api = args.backend in ("ollama", "fake")
 
     if args.n_prototype > 2111:
         raise ValueError("n_prototype cannot exceed 2111.")
+    if args.resume and args.pack_size > 1:
+        raise ValueError("--resume is not supported with --pack_size > 1.")
+    if args.speculative and args.backend != "llamacpp":
+        raise ValueError("--speculative requires --backend llamacpp.")
+    if args.n_workers > 1 and (args.backend != "llamacpp" or args.pack_size > 1):
+        raise ValueError(
+            "--n_workers > 1 requires --backend llamacpp and --pack_size 1."
+        )
+    if args.cascade_model and (args.pack_size > 1 or args.n_workers > 1 or args.resume):
+        raise ValueError(
+            "--cascade_model is not supported with --pack_size, --n_workers "
+            "or --resume."
+        )
+    if args.rule_prefill and (
+        args.pack_size > 1 or args.n_workers > 1 or args.resume or args.cascade_model
+    ):
+        raise ValueError(
+            "--rule_prefill is not supported with --pack_size, --n_workers, "
+            "--resume or --cascade_model."
+        )
+    if args.decompose and (
+        args.pack_size > 1
+        or args.n_workers > 1
+        or args.resume
+        or args.cascade_model
+        or args.rule_prefill
+    ):
+        raise ValueError(
+            "--decompose is not supported with --pack_size, --n_workers, --resume, "
+            "--cascade_model or --rule_prefill."
+        )
 
     # Check file existence
     root_dir = Path(args.root_dir)
@@ -83,9 +346,26 @@ if __name__ == "__main__":
         if not file_path.exists():
             raise FileNotFoundError(f"Required file not found: {file_path}")
 
-    # Create results directory with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    results_dir = root_dir / "data" / "runs" / timestamp
+    # Create results directory with timestamp, or reuse the one being resumed
+    if args.resume:
+        results_dir = Path(args.resume)
+        if not results_dir.exists():
+            raise FileNotFoundError(f"Run directory not found: {results_dir}")
+        # Results of the interrupted run are only reused for the same settings
+        saved_args = read_metadata_file(results_dir / "metadata.txt")["args"]
+        changed = [
+            f"--{name} {saved_args.get(name)!r} -> {getattr(args, name)!r}"
+            for name in RESUME_ARGS
+            if saved_args.get(name) != getattr(args, name)
+        ]
+        if changed:
+            raise ValueError(
+                f"Cannot resume {results_dir} with different settings: "
+                + ", ".join(changed)
+            )
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        results_dir = root_dir / "data" / "runs" / timestamp
     data_dir = results_dir / "data"
     data_dir.mkdir(parents=True, exist_ok=True)
 
@@ -94,6 +374,15 @@ if __name__ == "__main__":
         if file_path.suffix == ".xlsx":
             shutil.copy2(file_path, data_dir / file_path.name)
 
+    # Response cache shared across runs; fake runs are load tests, so every
+    # request must reach the backend
+    cache = None
+    if not args.no_cache and args.backend != "fake":
+        cache = ResponseCache(
+            args.cache_dir or root_dir / "data" / "cache",
+            max_size_mb=args.cache_max_mb,
+        )
+
     # Initialise metadata
     metadata = {
         "args": vars(args),
@@ -103,6 +392,25 @@ if __name__ == "__main__":
         "evaluation_end_time": None,
         "score_per_report": None,
         "final_score": None,
+        "reports_per_second": None,
+        "n_context_overflow": None,
+        "generation": None,
+        "parse_failure_rate": None,
+        "parse": None,
+        "repair": None,
+        "cascade": None,
+        "dedup": None,
+        "prefill": None,
+        "prompt_fingerprint": None,
+        "prompt_tokens": None,
+        "profile": None if profile is None else {
+            "path": args.profile,
+            "created": profile["created"],
+            "settings": profile["settings"],
+            "reports_per_second": profile["reports_per_second"],
+        },
+        "response_cache_hits": None,
+        "response_cache_misses": None,
     }
 
     # Save initial metadata
@@ -128,40 +436,231 @@ if __name__ == "__main__":
         save_json(annotated_json, results_dir / "annotated.json")
 
         # Initialise appropriate model based on backend
-        model_class = (
-            RenalBiopsyOllamaQA if args.backend == "ollama" else RenalBiopsyLlamaCppQA
+        model_class = {
+            "ollama": RenalBiopsyOllamaQA,
+            "llamacpp": RenalBiopsyLlamaCppQA,
+            "llamaserver": RenalBiopsyLlamaServerQA,
+            "fake": RenalBiopsyFakeQA,
+        }[args.backend]
+        model_kwargs = {"normalise_prompts": args.normalise_prompts}
+        if ollama_api:
+            model_kwargs["structured_output"] = args.structured_output
+            model_kwargs["options"] = {
+                name: getattr(args, name)
+                for name in ("num_thread", "num_ctx", "num_batch")
+                if getattr(args, name) is not None
+            }
+        if args.backend == "fake":
+            model_kwargs.update(fake_backend_kwargs(args))
+        if args.backend == "llamacpp":
+            model_kwargs["n_threads"] = args.n_threads
+            model_kwargs["n_ctx"] = (
+                args.n_ctx if args.n_ctx == "auto" else int(args.n_ctx)
+            )
+            model_kwargs["speculative"] = args.speculative
+            model_kwargs["num_draft_tokens"] = args.draft_tokens
+            model_kwargs["n_batch"] = args.n_batch
+            model_kwargs["use_mmap"] = not args.no_mmap
+        if args.backend == "llamaserver":
+            model_kwargs["base_url"] = args.server_url
+            if args.n_ctx != "auto":
+                model_kwargs["n_ctx"] = int(args.n_ctx)
+        model = model_class(
+            model_path=args.model_name,
+            root_dir=args.root_dir,
+            reuse_prefix=args.reuse_prefix,
+            cache=cache,
+            **model_kwargs,
         )
-        model = model_class(model_path=args.model_name, root_dir=args.root_dir)
+        if args.backend == "fake":
+            # Answer each report with its own annotation
+            model.register_reports(input_json, annotated_json)
+
+        metadata["prompt_fingerprint"] = model.compile_prompt(
+            args.n_shots, args.include_guidelines
+        ).fingerprint
+
+        if args.normalise_prompts:
+            # Counted with the model's tokenizer unless it could not be reached
+            prompt_tokens = model.compare_prompt_tokens(
+                input_json, args.n_shots, args.n_prototype, args.include_guidelines
+            )
+            save_json(prompt_tokens, results_dir / "prompt_tokens.json")
+            tokens_raw = sum(counts["tokens_raw"] for counts in prompt_tokens)
+            tokens_normalised = sum(
+                counts["tokens_normalised"] for counts in prompt_tokens
+            )
+            metadata["prompt_tokens"] = {
+                "tokenizer": "estimate" if model.tokens_estimated else "model",
+                "total_raw": tokens_raw,
+                "total_normalised": tokens_normalised,
+                "reduction": round(1 - tokens_normalised / tokens_raw, 3)
+                if tokens_raw
+                else None,
+            }
+
+        # Collapse duplicate reports so each group is extracted once
+        reports = input_json[: args.n_prototype]
+        groups = None
+        if args.dedup:
+            groups = group_reports(
+                reports,
+                near_duplicates=args.dedup == "near",
+                threshold=args.dedup_threshold,
+            )
+            reports = groups.unique(reports)
+            metadata["dedup"] = {
+                **groups.summary(),
+                "calls_saved": math.ceil(groups.n_reports / args.pack_size)
+                - math.ceil(groups.n_unique / args.pack_size),
+            }
+            print(f"Extracting {groups.n_unique}/{groups.n_reports} unique reports")
 
         # Run model
         metadata["annotation_start_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        annotation_start = time.perf_counter()
 
         # Extract entities
-        if args.backend == "ollama":
-            generated_answers = model.extract_with_known_entities(
-                input_json,
-                n_shots=args.n_shots,
-                n_prototype=args.n_prototype,
+        extraction_kwargs = {
+            "n_shots": args.n_shots,
+            "n_prototype": len(reports),
+            "include_guidelines": args.include_guidelines,
+        }
+        if args.pack_size > 1:
+            extraction_kwargs["pack_size"] = args.pack_size
+        else:
+            extraction_kwargs["checkpoint"] = RunCheckpoint(
+                results_dir / "checkpoint.jsonl", reports
+            )
+        extract = (
+            model.extract_packed
+            if args.pack_size > 1
+            else model.extract_with_known_entities
+        )
+        if args.n_workers > 1:
+            extract = model.extract_sharded
+            extraction_kwargs["n_workers"] = args.n_workers
+            extraction_kwargs["n_threads"] = args.n_threads
+        if args.backend == "llamaserver" and args.pack_size == 1:
+            # Concurrent requests fill the server's parallel slots
+            extraction_kwargs["concurrency"] = args.concurrency
+            extraction_kwargs["timeout"] = args.timeout
+
+        if args.cascade_model:
+            cascade = ModelCascade(
+                small_model=model,
+                large_model=model_class(
+                    model_path=args.cascade_model,
+                    root_dir=args.root_dir,
+                    reuse_prefix=args.reuse_prefix,
+                    cache=cache,
+                    **model_kwargs,
+                ),
+                rule_check=not args.no_rule_check,
+            )
+            del extraction_kwargs["checkpoint"]
+            if ollama_api:
+                extraction_kwargs["concurrency"] = args.concurrency
+                extraction_kwargs["timeout"] = args.timeout
+            predicted_json = cascade.extract(reports, **extraction_kwargs)
+            tiers = [
+                {"tier": tier, **cascade.escalation_reasons.get(i, {})}
+                for i, tier in enumerate(cascade.tiers)
+            ]
+            if groups is not None:
+                tiers = groups.expand(tiers)
+            save_json(
+                [{"index": i, **tier} for i, tier in enumerate(tiers)],
+                results_dir / "tiers.json",
+            )
+            metadata["cascade"] = cascade.summary()
+        elif args.rule_prefill:
+            # spaCy is only needed for this mode
+            from src.renal_biopsy.alt_models.spacy import resolve_confident_entities
+
+            prefilled = resolve_confident_entities(
+                [model.get_report_string(report) for report in reports],
+                n_prototype=len(reports),
+            )
+            save_json(prefilled, results_dir / "prefilled.json")
+            prefill_kwargs = {}
+            if ollama_api:
+                prefill_kwargs["concurrency"] = args.concurrency
+                prefill_kwargs["timeout"] = args.timeout
+            predicted_json = model.extract_with_prefill(
+                reports,
+                prefilled,
+                n_prototype=len(reports),
                 include_guidelines=args.include_guidelines,
+                **prefill_kwargs,
+            )
+            metadata["prefill"] = model.prefill_stats
+        elif args.decompose:
+            decompose_kwargs = {}
+            if ollama_api:
+                decompose_kwargs["concurrency"] = args.concurrency
+                decompose_kwargs["timeout"] = args.timeout
+            predicted_json = model.extract_by_entity_group(
+                reports,
+                n_prototype=len(reports),
+                include_guidelines=args.include_guidelines,
+                **decompose_kwargs,
+            )
+        elif ollama_api:
+            generated_answers = extract(
+                reports,
+                concurrency=args.concurrency,
+                timeout=args.timeout,
+                **extraction_kwargs,
             )
             save_json(generated_answers, results_dir / "generated_answers.json")
+            metadata["parse_failure_rate"] = parse_failure_rate(generated_answers)
 
             predicted_json = model.convert_generated_answers_to_json(
                 generated_answers=generated_answers,
-                input_json=input_json,
-                n_prototype=args.n_prototype,
+                input_json=reports,
+                n_prototype=len(reports),
             )
         else:
             # LlamaCpp version returns predictions directly
-            predicted_json = model.extract_with_known_entities(
-                input_json,
-                n_shots=args.n_shots,
-                n_prototype=args.n_prototype,
-                include_guidelines=args.include_guidelines,
+            predicted_json = extract(reports, **extraction_kwargs)
+
+            # Per-report prompt token counts and chosen context sizes
+            token_counts = [
+                {"index": index, **counts}
+                for index, counts in sorted(model.token_counts.items())
+            ]
+            save_json(token_counts, results_dir / "token_counts.json")
+            metadata["n_context_overflow"] = sum(
+                counts["n_ctx"] is None for counts in token_counts
+            )
+
+        if args.repair_missing:
+            repair_kwargs = {"include_guidelines": args.include_guidelines}
+            if ollama_api:
+                repair_kwargs["concurrency"] = args.concurrency
+                repair_kwargs["timeout"] = args.timeout
+            predicted_json = model.repair_predictions(predicted_json, **repair_kwargs)
+            metadata["repair"] = model.repair_stats
+
+        if groups is not None:
+            predicted_json = groups.expand_predictions(
+                predicted_json, input_json[: args.n_prototype]
             )
 
         save_json(predicted_json, results_dir / "predicted.json")
         metadata["annotation_end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        metadata["reports_per_second"] = round(
+            len(predicted_json) / (time.perf_counter() - annotation_start), 3
+        )
+        metadata["generation"] = model.summarise_call_stats()
+        # Answers that needed JSON repairs or could not be parsed
+        metadata["parse"] = model.parse_stats
+        # Per-call timings and token counts, labelled with the report(s) answered
+        telemetry = model.call_stats
+        if args.cascade_model:
+            telemetry = telemetry + cascade.large_model.call_stats
+        save_jsonl(telemetry, results_dir / "telemetry.jsonl")
 
     except Exception as e:
         print(f"Error during model execution: {e}")
@@ -186,6 +685,10 @@ if __name__ == "__main__":
         print(f"Error during model evaluation: {e}")
         raise
 
+    if cache is not None:
+        metadata["response_cache_hits"] = cache.hits
+        metadata["response_cache_misses"] = cache.misses
+
     # Save final metadata
     write_metadata_file(metadata_path, metadata)
     print(f"Results saved to {results_dir}")
@@ -0,0 +1,145 @@
+import argparse
+
+from src.modelling.fake import add_fake_backend_args, fake_backend_kwargs
+from src.modelling.service import ExtractionServer, ExtractionService
+from src.renal_biopsy.preprocessor import RenalBiopsyProcessor
+from renal_biopsy.qa import (
+    RenalBiopsyFakeQA,
+    RenalBiopsyLlamaCppQA,
+    RenalBiopsyLlamaServerQA,
+    RenalBiopsyOllamaQA,
+)
+
+# Example usage:
+# python rb_service_script.py --backend ollama --root_dir src/renal_biopsy
+# --model_name qwen2.5:1.5b-instruct-fp16 --n_shots 1 --include_guidelines
+# --concurrency 4 --port 8000
+# curl -X POST localhost:8000/extract -d '{"text": "MICROSCOPY: ... CONCLUSION: ..."}'
+# curl -X POST localhost:8000/extract -d '{"reports": [{"microscopy_section": "...",
+# "conclusion_section": "..."}]}'
+# curl localhost:8000/health, curl localhost:8000/metrics, curl localhost:8000/latency
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backend",
+        help="Model backend (ollama, llamacpp, llamaserver for a llama.cpp HTTP "
+        "server, or fake for load tests without a model)",
+        choices=["ollama", "llamacpp", "llamaserver", "fake"],
+        required=True,
+    )
+    parser.add_argument(
+        "--root_dir", help="Root directory for data modality", required=True, type=str
+    )
+    parser.add_argument("--model_name", help="LLM to use", required=True, type=str)
+    parser.add_argument(
+        "--n_shots",
+        help="Number of few-shot samples to use in prompt",
+        default=2,
+        type=int,
+    )
+    parser.add_argument(
+        "--include_guidelines",
+        help="Include entity guidelines in prompt?",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--host", help="Interface to serve on", default="127.0.0.1", type=str
+    )
+    parser.add_argument("--port", help="Port to serve on", default=8000, type=int)
+    parser.add_argument(
+        "--max_batch_size",
+        help="Maximum number of queued reports sent to the backend together",
+        default=8,
+        type=int,
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        help="How long a queued report waits for others to join its batch",
+        default=50,
+        type=float,
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of concurrent Ollama or llama.cpp server requests per "
+        "batch (match OLLAMA_NUM_PARALLEL or the server's parallel slots)",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--server_url",
+        help="URL of the llama.cpp server (llamaserver only)",
+        default="http://127.0.0.1:8080",
+        type=str,
+    )
+    parser.add_argument(
+        "--request_timeout",
+        help="Seconds an /extract request waits for its predictions",
+        default=300,
+        type=float,
+    )
+    parser.add_argument(
+        "--normalise_prompts",
+        help="Strip prompt indentation/whitespace and compact few-shot JSON",
+        action="store_true",
+    )
+    add_fake_backend_args(parser)
+    args = parser.parse_args()
+
+    # Keep the model warm: Ollama pins the task prompt and keeps the model
+    # loaded, llama.cpp keeps it in the process-wide model pool
+    if args.backend == "ollama":
+        model = RenalBiopsyOllamaQA(
+            model_path=args.model_name,
+            root_dir=args.root_dir,
+            reuse_prefix=True,
+            keep_alive="-1m",
+            normalise_prompts=args.normalise_prompts,
+        )
+        extraction_kwargs = {"concurrency": args.concurrency}
+    elif args.backend == "fake":
+        model = RenalBiopsyFakeQA(
+            model_path=args.model_name,
+            root_dir=args.root_dir,
+            normalise_prompts=args.normalise_prompts,
+            **fake_backend_kwargs(args),
+        )
+        extraction_kwargs = {"concurrency": args.concurrency}
+    elif args.backend == "llamaserver":
+        model = RenalBiopsyLlamaServerQA(
+            model_path=args.model_name,
+            root_dir=args.root_dir,
+            base_url=args.server_url,
+            normalise_prompts=args.normalise_prompts,
+        )
+        extraction_kwargs = {"concurrency": args.concurrency}
+    else:
+        model = RenalBiopsyLlamaCppQA(
+            model_path=args.model_name,
+            root_dir=args.root_dir,
+            reuse_prefix=True,
+            normalise_prompts=args.normalise_prompts,
+        )
+        extraction_kwargs = {}
+
+    service = ExtractionService(
+        model,
+        processor=RenalBiopsyProcessor(guidelines=model.entity_guidelines),
+        n_shots=args.n_shots,
+        include_guidelines=args.include_guidelines,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        extraction_kwargs=extraction_kwargs,
+    )
+    service.start()
+    server = ExtractionServer(
+        service, args.host, args.port, request_timeout=args.request_timeout
+    )
+    print(f"Serving {args.model_name} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
@@ -1,11 +1,17 @@
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional, Union
 from pathlib import Path
 from tqdm import tqdm
 
 from src.renal_biopsy.preprocessor import RenalBiopsyProcessor
-from renal_biopsy.qa import RenalBiopsyOllamaQA, RenalBiopsyLlamaCppQA
+from renal_biopsy.qa import (
+    RenalBiopsyOllamaQA,
+    RenalBiopsyLlamaCppQA,
+    RenalBiopsyFakeQA,
+)
 from preprocessing.guidelines import EntityGuidelines
-from src.evaluate.laaj import use_llm_to_compare
+from src.evaluate.laaj import DEFAULT_JUDGE_MODEL, compare_pairs_with_llm
+from src.utils.checkpoint import RunCheckpoint
+from src.modelling.cache import ResponseCache
 
 
 class DisagreementAnnotator:
@@ -17,6 +23,9 @@ class DisagreementAnnotator:
         model_path_2: str,
         backend: str,
         root_dir: str = "src/renal_biopsy",
+        reuse_prefix: bool = False,
+        cache: Optional[ResponseCache] = None,
+        model_kwargs: Optional[Dict[str, Any]] = None,
     ):
         """
         Initialise with model paths, backend type, and root directory.
@@ -24,29 +33,54 @@ class DisagreementAnnotator:
         Args:
             model_path_1: Path to first model
             model_path_2: Path to second model
-            backend: Model backend ('ollama' or 'llamacpp')
+            backend: Model backend ('ollama', 'llamacpp' or 'fake')
             root_dir: Root directory containing data and models
+            reuse_prefix: Reuse the evaluated static prompt prefix across reports
+            cache: Optional response cache shared by both models and the judge
+            model_kwargs: Further arguments for both models (e.g. fake
+                backend behaviour)
         """
-        if backend not in ["ollama", "llamacpp"]:
-            raise ValueError("backend must be either 'ollama' or 'llamacpp'")
+        if backend not in ["ollama", "llamacpp", "fake"]:
+            raise ValueError("backend must be 'ollama', 'llamacpp' or 'fake'")
 
         self.root_dir = Path(root_dir)
         self.guidelines = EntityGuidelines(self.root_dir / "data/guidelines.xlsx")
 
         # Select appropriate model class
-        model_class = (
-            RenalBiopsyOllamaQA if backend == "ollama" else RenalBiopsyLlamaCppQA
-        )
+        model_class = {
+            "ollama": RenalBiopsyOllamaQA,
+            "llamacpp": RenalBiopsyLlamaCppQA,
+            "fake": RenalBiopsyFakeQA,
+        }[backend]
 
         # Initialise models
-        self.model_1 = model_class(model_path=model_path_1, root_dir=root_dir)
-        self.model_2 = model_class(model_path=model_path_2, root_dir=root_dir)
+        self.cache = cache
+        self.model_1 = model_class(
+            model_path=model_path_1,
+            root_dir=root_dir,
+            reuse_prefix=reuse_prefix,
+            cache=cache,
+            **(model_kwargs or {}),
+        )
+        self.model_2 = model_class(
+            model_path=model_path_2,
+            root_dir=root_dir,
+            reuse_prefix=reuse_prefix,
+            cache=cache,
+            **(model_kwargs or {}),
+        )
 
         # Store backend type for processing
         self.backend = backend
 
     def run_automated_annotation(
-        self, n_shots: int = 3, n_prototype: int = 1, include_guidelines: bool = True
+        self,
+        n_shots: int = 3,
+        n_prototype: int = 1,
+        include_guidelines: bool = True,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+        results_dir: Optional[Union[str, Path]] = None,
     ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         Run automated annotation comparing predictions from both models.
@@ -55,10 +89,19 @@ class DisagreementAnnotator:
             n_shots: Number of examples for few-shot learning
             n_prototype: Number of prototypes to process
             include_guidelines: Whether to include guidelines in prompts
+            concurrency: Maximum concurrent requests (Ollama only)
+            timeout: Per-request timeout in seconds (Ollama only)
+            results_dir: Run directory for per-model checkpoints; calling
+                again with the same directory resumes an interrupted run
 
         Returns:
             Tuple of predictions from both models
         """
+        checkpoint_1, checkpoint_2 = None, None
+        if results_dir is not None:
+            checkpoint_1 = RunCheckpoint(Path(results_dir) / "model_1_checkpoint.jsonl")
+            checkpoint_2 = RunCheckpoint(Path(results_dir) / "model_2_checkpoint.jsonl")
+
         # Process input data
         processor = RenalBiopsyProcessor(guidelines=self.guidelines)
         input_json = processor.create_input_json(
@@ -68,19 +111,43 @@ class DisagreementAnnotator:
         )
 
         # Get predictions from both models based on backend
-        if self.backend == "ollama":
+        if self.backend in ("ollama", "fake"):
             predictions_1 = self._get_ollama_predictions(
-                self.model_1, input_json, n_shots, n_prototype, include_guidelines
+                self.model_1,
+                input_json,
+                n_shots,
+                n_prototype,
+                include_guidelines,
+                concurrency,
+                timeout,
+                checkpoint_1,
             )
             predictions_2 = self._get_ollama_predictions(
-                self.model_2, input_json, n_shots, n_prototype, include_guidelines
+                self.model_2,
+                input_json,
+                n_shots,
+                n_prototype,
+                include_guidelines,
+                concurrency,
+                timeout,
+                checkpoint_2,
             )
         else:
             predictions_1 = self._get_llamacpp_predictions(
-                self.model_1, input_json, n_shots, n_prototype, include_guidelines
+                self.model_1,
+                input_json,
+                n_shots,
+                n_prototype,
+                include_guidelines,
+                checkpoint_1,
             )
             predictions_2 = self._get_llamacpp_predictions(
-                self.model_2, input_json, n_shots, n_prototype, include_guidelines
+                self.model_2,
+                input_json,
+                n_shots,
+                n_prototype,
+                include_guidelines,
+                checkpoint_2,
             )
 
         return predictions_1, predictions_2
@@ -92,6 +159,9 @@ class DisagreementAnnotator:
         n_shots: int,
         n_prototype: int,
         include_guidelines: bool,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+        checkpoint: Optional[RunCheckpoint] = None,
     ) -> List[Dict[str, Any]]:
         """Get predictions from Ollama model."""
         answers = model.extract_with_known_entities(
@@ -99,6 +169,9 @@ class DisagreementAnnotator:
             n_shots=n_shots,
             n_prototype=n_prototype,
             include_guidelines=include_guidelines,
+            concurrency=concurrency,
+            timeout=timeout,
+            checkpoint=checkpoint,
         )
         return model.convert_generated_answers_to_json(answers, input_json, n_prototype)
 
@@ -109,6 +182,7 @@ class DisagreementAnnotator:
         n_shots: int,
         n_prototype: int,
         include_guidelines: bool,
+        checkpoint: Optional[RunCheckpoint] = None,
     ) -> List[Dict[str, Any]]:
         """Get predictions from LlamaCpp model."""
         return model.extract_with_known_entities(
@@ -116,6 +190,7 @@ class DisagreementAnnotator:
             n_shots=n_shots,
             n_prototype=n_prototype,
             include_guidelines=include_guidelines,
+            checkpoint=checkpoint,
         )
 
     def analyse_disagreements(
@@ -124,12 +199,21 @@ class DisagreementAnnotator:
         predictions_2: List[Dict[str, Any]],
         disagreement_threshold: float = 0.3,
         n_prototype: int = 1,
+        judge_concurrency: int = 1,
     ) -> Tuple[List[Dict[str, bool]], List[Dict[str, int]], List[int]]:
-        """Analyse disagreements between two sets of predictions."""
+        """
+        Analyse disagreements between two sets of predictions.
+
+        Free-text entities are compared by the LLM judge in one batch before
+        the per-report analysis, so the judge model is loaded once.
+        """
         entity_matches = []
         report_counts = []
         review_needed = []
         n_entities = len(self.guidelines.entity_to_info_map)
+        judged = self._judge_text_entities(
+            predictions_1[:n_prototype], predictions_2[:n_prototype], judge_concurrency
+        )
 
         for i, (pred1, pred2) in enumerate(
             tqdm(
@@ -142,7 +226,7 @@ class DisagreementAnnotator:
             if i == n_prototype:
                 break
 
-            matches, counts = self._compare_predictions(pred1, pred2)
+            matches, counts = self._compare_predictions(pred1, pred2, judged)
             entity_matches.append(matches)
             report_counts.append(counts)
 
@@ -156,10 +240,44 @@ class DisagreementAnnotator:
 
         return entity_matches, report_counts, review_needed
 
+    def _text_entities(self) -> List[str]:
+        """Get the entities compared by the LLM judge rather than exactly."""
+        return [
+            entity
+            for entity, (_, entity_type, _) in (
+                self.guidelines.entity_to_info_map.items()
+            )
+            if entity_type not in ["boolean", "categorical", "numerical"]
+        ]
+
+    def _judge_text_entities(
+        self,
+        predictions_1: List[Dict[str, Any]],
+        predictions_2: List[Dict[str, Any]],
+        concurrency: int = 1,
+    ) -> Dict[Tuple[Any, Any], bool]:
+        """Judge every free-text value pair of both models in one batch."""
+        pairs = [
+            (pred1.get(entity), pred2.get(entity))
+            for pred1, pred2 in zip(predictions_1, predictions_2)
+            for entity in self._text_entities()
+        ]
+        verdicts = compare_pairs_with_llm(
+            pairs,
+            DEFAULT_JUDGE_MODEL,
+            self.model_1.judge_provider,
+            self.cache,
+            concurrency,
+        )
+        return dict(zip(pairs, verdicts))
+
     def _compare_predictions(
-        self, pred1: Dict[str, Any], pred2: Dict[str, Any]
+        self,
+        pred1: Dict[str, Any],
+        pred2: Dict[str, Any],
+        judged: Dict[Tuple[Any, Any], bool],
     ) -> Tuple[Dict[str, bool], Dict[str, int]]:
-        """Compare predictions for a single report."""
+        """Compare predictions for a single report, using the judge's verdicts."""
         entity_matches = {key: False for key in self.guidelines.entity_to_info_map}
 
         for entity, (_, entity_type, _) in self.guidelines.entity_to_info_map.items():
@@ -169,9 +287,7 @@ class DisagreementAnnotator:
             if entity_type in ["boolean", "categorical", "numerical"]:
                 entity_matches[entity] = value1 == value2
             else:
-                entity_matches[entity] = use_llm_to_compare(
-                    value1, value2, "gemma2:2b-instruct-fp16", "ollama"
-                )
+                entity_matches[entity] = judged[(value1, value2)]
 
         counts = {
             "matches": sum(1 for v in entity_matches.values() if v),
@@ -1,13 +1,31 @@
-from llama_cpp import Llama
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
 import ollama
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from src.modelling.cache import ResponseCache
+from src.modelling.llama_pool import get_model_pool
+from src.modelling.speculative import get_draft_model
+
+DEFAULT_JUDGE_MODEL = "gemma2:2b-instruct-fp16"
+
 
 def use_llm_to_compare(
-    entity1: str, entity2: str, model: str = "gemma2:2b", provider: str = "ollama"
+    entity1: str,
+    entity2: str,
+    model: str = "gemma2:2b",
+    provider: str = "ollama",
+    cache: Optional[ResponseCache] = None,
+    speculative: Optional[str] = None,
 ) -> bool:
-    """Compare two medical entities using specified LLM."""
+    """
+    Compare two medical entities using specified LLM, consulting the cache first.
+
+    `speculative` enables speculative decoding on the llama-cpp judge
+    ("prompt_lookup" or the path to a draft GGUF).
+    """
 
     default_false_phrases = ["none", "None", "null", "Null", "nan", "NaN"]
     # TODO: safe option would be to go to default value for entity if any of these seen
@@ -32,31 +50,81 @@ def use_llm_to_compare(
     """
 
     if provider == "ollama":
-        response = ollama.generate(
-            model=model,
-            prompt=query,
-            options={"temperature": 0, "num_predict": 2, "num_ctx": 1024},
-        )
-        return "True" in response["response"]
+        options = {"temperature": 0, "num_predict": 2, "num_ctx": 1024}
+        key = ResponseCache.make_key(model, query, options)
+        content = cache.get(key) if cache is not None else None
+        if content is None:
+            response = ollama.generate(
+                model=model,
+                prompt=query,
+                options=options,
+            )
+            content = response["response"]
+            if cache is not None:
+                cache.set(key, content)
 
     elif provider == "llama-cpp":
+        model_path = "models/Phi-3.5-mini-instruct-Q5_K_M.gguf"
         messages = [{"role": "user", "content": query}]
-        llm = Llama(
-            model_path="models/Phi-3.5-mini-instruct-Q5_K_M.gguf",
-            chat_format="chatml",
-            verbose=False,
-            n_ctx=250,
-        )
-        answer = llm.create_chat_completion(
-            messages=messages,
-            max_tokens=2,
-            temperature=0,
-        )
-        return "True" in answer["choices"][0]["message"]["content"]
+        key = ResponseCache.make_key(model_path, messages, {"max_tokens": 2})
+        content = cache.get(key) if cache is not None else None
+        if content is None:
+            llama_kwargs = {}
+            if speculative is not None:
+                llama_kwargs["draft_model"] = get_draft_model(speculative)
+            with get_model_pool().acquire(
+                model_path,
+                n_ctx=250,
+                chat_format="chatml",
+                **llama_kwargs,
+            ) as llm:
+                answer = llm.create_chat_completion(
+                    messages=messages,
+                    max_tokens=2,
+                    temperature=0,
+                )
+            content = answer["choices"][0]["message"]["content"]
+            if cache is not None:
+                cache.set(key, content)
+
+    elif provider == "fake":
+        # Deterministic stand-in for load tests: word overlap, no judge call
+        words1, words2 = set(entity1.split()), set(entity2.split())
+        content = str(len(words1 & words2) >= 0.5 * len(words1 | words2))
 
     else:
         raise ValueError(f"Unsupported provider: {provider}")
 
+    return "True" in content
+
+
+def compare_pairs_with_llm(
+    pairs: List[Tuple[str, str]],
+    model: str = DEFAULT_JUDGE_MODEL,
+    provider: str = "ollama",
+    cache: Optional[ResponseCache] = None,
+    concurrency: int = 1,
+    speculative: Optional[str] = None,
+) -> List[bool]:
+    """
+    Compare many entity pairs in one batch, so the judge model is loaded once.
+
+    Repeated pairs are only judged once; with concurrency > 1 (Ollama) the
+    judge calls are spread over the server's parallel slots.
+    """
+    unique_pairs = list(dict.fromkeys(pairs))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        verdicts = list(
+            executor.map(
+                lambda pair: use_llm_to_compare(
+                    pair[0], pair[1], model, provider, cache, speculative
+                ),
+                unique_pairs,
+            )
+        )
+    judged = dict(zip(unique_pairs, verdicts))
+    return [judged[pair] for pair in pairs]
+
 
 def use_bert_to_compare(entity1, entity2, threshold=0.8):
     model = SentenceTransformer("bert-base-nli-mean-tokens")
@@ -1,7 +1,7 @@
 from .laaj import use_llm_to_compare
 
 
-def evaluate_report(entity_to_info_map, json_1, json_2):
+def evaluate_report(entity_to_info_map, json_1, json_2, cache=None, provider="ollama"):
     report_scores_dict = {entity: 0 for entity in entity_to_info_map.keys()}
 
     for entity, metadata in entity_to_info_map.items():
@@ -19,7 +19,7 @@ def evaluate_report(entity_to_info_map, json_1, json_2):
             #    report_scores_dict[entity] += 1
 
             if use_llm_to_compare(
-                anno_value, pred_value, "gemma2:2b-instruct-fp16", "ollama"
+                anno_value, pred_value, "gemma2:2b-instruct-fp16", provider, cache
             ):
                 report_scores_dict[entity] += 1
 
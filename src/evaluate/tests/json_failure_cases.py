@@ -0,0 +1,210 @@
+# Answers to the renal biopsy extraction prompt in the malformed shapes small
+# instruction models produce (prose and fences around the JSON, Python
+# literals, stray commas, truncation), with the values a reader takes from
+# each. "expected" is None where nothing can be recovered.
+# No raw model answers are kept in the repository, so these are written by
+# hand after those failure shapes rather than copied from runs. Failures
+# logged in a run's generated_answers.json can be added as further cases.
+
+full_answer = {
+    "cortex_present": True,
+    "medulla_present": False,
+    "n_total": 12,
+    "n_segmental": 0,
+    "n_global": 2,
+    "abnormal_glomeruli": False,
+    "chronic_change": "mild",
+    "transplant": True,
+    "diagnosis": "No rejection",
+}
+
+json_failure_cases = [
+    {
+        "name": "markdown_fence_with_trailing_note",
+        "answer": """```json
+{"cortex_present": true, "medulla_present": false, "n_total": 12, "n_segmental": 0,
+"n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection"}
+```
+Note: the medulla is not mentioned {assumed absent}.""",
+        "expected": full_answer,
+    },
+    {
+        "name": "trailing_prose_with_braces",
+        "answer": """{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection"}
+
+Explanation: the template asked for {n_total} so I counted the glomeruli (12).""",
+        "expected": full_answer,
+    },
+    {
+        "name": "leading_prose_with_braces",
+        "answer": """Filling in the {TEMPLATE} for this report:
+{"cortex_present": true, "medulla_present": false, "n_total": 12, "n_segmental": 0,
+"n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection"}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "python_dict_repr",
+        "answer": """{'cortex_present': True, 'medulla_present': False, 'n_total': 12,
+'n_segmental': 0, 'n_global': 2, 'abnormal_glomeruli': False, 'chronic_change': 'mild',
+'transplant': True, 'diagnosis': 'No rejection'}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "python_none",
+        "answer": """{"cortex_present": True, "medulla_present": None, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": False, "chronic_change": "mild",
+"transplant": True, "diagnosis": "No rejection"}""",
+        "expected": {**full_answer, "medulla_present": None},
+    },
+    {
+        "name": "trailing_comma",
+        "answer": """{
+    "cortex_present": true,
+    "medulla_present": false,
+    "n_total": 12,
+    "n_segmental": 0,
+    "n_global": 2,
+    "abnormal_glomeruli": false,
+    "chronic_change": "mild",
+    "transplant": true,
+    "diagnosis": "No rejection",
+}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "doubled_comma",
+        "answer": """{"cortex_present": true,, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection"}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "missing_commas_between_lines",
+        "answer": """{
+    "cortex_present": true
+    "medulla_present": false
+    "n_total": 12
+    "n_segmental": 0
+    "n_global": 2
+    "abnormal_glomeruli": false
+    "chronic_change": "mild"
+    "transplant": true
+    "diagnosis": "No rejection"
+}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "unquoted_keys",
+        "answer": """{cortex_present: true, medulla_present: false, n_total: 12,
+n_segmental: 0, n_global: 2, abnormal_glomeruli: false, chronic_change: "mild",
+transplant: true, diagnosis: "No rejection"}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "unquoted_values",
+        "answer": """{
+    "cortex_present": True,
+    "medulla_present": False,
+    "n_total": 12,
+    "n_segmental": 0,
+    "n_global": 2,
+    "abnormal_glomeruli": False,
+    "chronic_change": mild,
+    "transplant": True,
+    "diagnosis": No rejection
+}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "apostrophe_in_single_quoted_value",
+        "answer": """{'cortex_present': True, 'medulla_present': False, 'n_total': 12,
+'n_segmental': 0, 'n_global': 2, 'abnormal_glomeruli': True,
+'chronic_change': 'mild', 'transplant': True,
+'diagnosis': 'Thickening of Bowman's capsule, no rejection'}""",
+        "expected": {
+            **full_answer,
+            "abnormal_glomeruli": True,
+            "diagnosis": "Thickening of Bowman's capsule, no rejection",
+        },
+    },
+    {
+        "name": "unescaped_inner_quotes",
+        "answer": """{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection ("borderline" changes only)"}""",
+        "expected": {
+            **full_answer,
+            "diagnosis": 'No rejection ("borderline" changes only)',
+        },
+    },
+    {
+        "name": "truncated_mid_value",
+        "answer": """{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rej""",
+        "expected": {
+            key: value for key, value in full_answer.items() if key != "diagnosis"
+        },
+    },
+    {
+        "name": "truncated_after_comma",
+        "answer": """{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true,""",
+        "expected": {
+            key: value for key, value in full_answer.items() if key != "diagnosis"
+        },
+    },
+    {
+        "name": "truncated_in_first_value",
+        "answer": """{"cortex_present": tr""",
+        "expected": None,
+    },
+    {
+        "name": "truncated_after_opening_brace",
+        "answer": """```json
+{""",
+        "expected": None,
+    },
+    {
+        "name": "answer_repeated",
+        "answer": """{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection"}
+{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection"}""",
+        "expected": full_answer,
+    },
+    {
+        "name": "nested_explanation_object",
+        "answer": """{"cortex_present": true, "medulla_present": false, "n_total": 12,
+"n_segmental": 0, "n_global": 2, "abnormal_glomeruli": false, "chronic_change": "mild",
+"transplant": true, "diagnosis": "No rejection",
+"reasoning": {"n_total": "12 glomeruli are seen",
+"medulla_present": "not mentioned"}}""",
+        "expected": {
+            **full_answer,
+            "reasoning": {
+                "n_total": "12 glomeruli are seen",
+                "medulla_present": "not mentioned",
+            },
+        },
+    },
+    {
+        "name": "no_json",
+        "answer": (
+            "I'm sorry, but the report does not contain enough information to answer."
+        ),
+        "expected": None,
+    },
+    {
+        "name": "template_echo_only",
+        "answer": "TEMPLATE: {n_total} glomeruli, see {diagnosis}",
+        "expected": None,
+    },
+]
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of parse_tolerant_json against parse_json_string.
+Run from the repository root:
+python -m src.evaluate.tests.json_parse_benchmark
+"""
+
+import json
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+from src.utils.json import parse_json_string
+from src.utils.tolerant_json import parse_tolerant_json
+
+from .json_failure_cases import full_answer, json_failure_cases
+
+
+def current_parser(answer: str) -> Optional[Dict[str, Any]]:
+    """parse_json_string, with failures as None."""
+    try:
+        return parse_json_string(answer)
+    except ValueError:
+        return None
+
+
+def tolerant_parser(answer: str) -> Optional[Dict[str, Any]]:
+    """parse_tolerant_json, with failures as None."""
+    result = parse_tolerant_json(answer, expect=dict)
+    return result.value if result.ok else None
+
+
+def parse_yield(cases: List[Dict[str, Any]], parse_fn: Callable) -> Dict[str, float]:
+    """Get the fraction of answers parsed, and parsed to the expected values."""
+    parsed = [parse_fn(case["answer"]) for case in cases]
+    recoverable = [case for case in cases if case["expected"] is not None]
+    return {
+        "parsed": sum(value is not None for value in parsed) / len(recoverable),
+        "correct": sum(
+            value == case["expected"]
+            for value, case in zip(parsed, cases)
+            if case["expected"] is not None
+        )
+        / len(recoverable),
+    }
+
+
+def microseconds_per_answer(
+    answers: List[str], parse_fn: Callable, repeat: int = 5, number: int = 200
+) -> float:
+    """Get the best mean time to parse one answer over several repeats."""
+    timer = timeit.Timer(lambda: [parse_fn(answer) for answer in answers])
+    return min(timer.repeat(repeat=repeat, number=number)) / number / len(answers) * 1e6
+
+
+if __name__ == "__main__":
+    valid_answers = [
+        json.dumps(full_answer),
+        json.dumps(full_answer, indent=4),
+        f"```json\n{json.dumps(full_answer)}\n```",
+    ]
+    failure_answers = [case["answer"] for case in json_failure_cases]
+
+    print(
+        f"{'Parser':22} {'Parsed':10} {'Correct':10} "
+        f"{'Valid (us)':12} {'Failures (us)':14}"
+    )
+    print("-" * 70)
+    for name, parse_fn in [
+        ("parse_json_string", current_parser),
+        ("parse_tolerant_json", tolerant_parser),
+    ]:
+        scores = parse_yield(json_failure_cases, parse_fn)
+        print(
+            f"{name:22} {scores['parsed']:<10.2f} {scores['correct']:<10.2f} "
+            f"{microseconds_per_answer(valid_answers, parse_fn):<12.1f} "
+            f"{microseconds_per_answer(failure_answers, parse_fn):<14.1f}"
+        )
+
+    print("\nRepairs per failure case:")
+    for case in json_failure_cases:
+        result = parse_tolerant_json(case["answer"], expect=dict)
+        outcome = ", ".join(result.repairs) if result.ok else f"error: {result.error}"
+        print(f"{case['name']:36} {outcome or 'valid JSON'}")
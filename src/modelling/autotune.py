@@ -0,0 +1,272 @@
+"""
+Calibration of backend performance settings.
+Thread counts, batch and context sizes and request concurrency that suit one
+host and model are slow on another, so a sample of reports is run under each
+combination in a grid and the fastest is saved as a profile that rb_script.py
+loads with --profile.
+"""
+
+import itertools
+import time
+from math import inf
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from src.modelling.llama_pool import get_model_pool
+from src.modelling.qa_base import QABase
+from src.utils.general import percentile
+from src.utils.json import load_json, save_json
+
+# Settings tuned per backend. Ollama's server-side parallelism
+# (OLLAMA_NUM_PARALLEL) is fixed when the server starts, so only the client's
+# concurrency can be varied
+TUNABLE_SETTINGS = {
+    "ollama": ("num_thread", "num_ctx", "num_batch", "concurrency"),
+    "llamacpp": ("n_threads", "n_batch", "use_mmap", "n_ctx", "n_workers"),
+    "llamaserver": ("concurrency",),
+    "fake": ("concurrency",),
+}
+OLLAMA_OPTIONS = ("num_thread", "num_ctx", "num_batch")
+
+
+def parse_setting(text: str) -> Union[int, bool, str, None]:
+    """
+    Parse a grid value given on the command line.
+
+    "default" leaves the backend's default, "auto" is kept as is, "true" and
+    "false" are booleans, and anything else is an integer.
+    """
+    lowered = text.lower()
+    if lowered == "default":
+        return None
+    if lowered == "auto":
+        return "auto"
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    return int(text)
+
+
+def settings_grid(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Get every combination of the grid's values."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def model_kwargs_for(backend: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the model constructor arguments of a combination of settings."""
+    if backend == "ollama":
+        options = {
+            name: settings[name]
+            for name in OLLAMA_OPTIONS
+            if settings.get(name) is not None
+        }
+        return {"options": options}
+    if backend == "llamacpp":
+        return {
+            "n_threads": settings["n_threads"],
+            "n_batch": settings["n_batch"],
+            "use_mmap": settings["use_mmap"],
+            "n_ctx": settings["n_ctx"],
+        }
+    return {}
+
+
+def measure(
+    model: QABase,
+    reports: List[Dict[str, Any]],
+    settings: Dict[str, Any],
+    n_shots: int = 0,
+    include_guidelines: bool = True,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Time extraction of the sample reports under one combination of settings.
+
+    One report is extracted first and not timed, so model loading is not
+    counted (llama.cpp worker processes still load their own copies).
+
+    Returns:
+        Reports per second, p50/p95 call latency and generation stats
+    """
+    extraction_kwargs = {
+        "n_shots": n_shots,
+        "n_prototype": len(reports),
+        "include_guidelines": include_guidelines,
+    }
+    n_workers = settings.get("n_workers") or 1
+    if model.backend == "llamacpp":
+        if n_workers > 1:
+            extract = model.extract_sharded
+            extraction_kwargs["n_workers"] = n_workers
+            extraction_kwargs["n_threads"] = settings["n_threads"]
+        else:
+            extract = model.extract_with_known_entities
+    else:
+        extract = model.extract_with_known_entities
+        extraction_kwargs["concurrency"] = settings["concurrency"]
+        extraction_kwargs["timeout"] = timeout
+
+    if n_workers == 1:
+        model.extract_with_known_entities(reports[:1], n_shots, 1, include_guidelines)
+    model.call_stats.clear()
+
+    start_time = time.perf_counter()
+    extract(reports, **extraction_kwargs)
+    elapsed = time.perf_counter() - start_time
+
+    seconds = [stats["seconds"] or 0 for stats in model.call_stats]
+    return {
+        "n_reports": len(reports),
+        "seconds": round(elapsed, 2),
+        "reports_per_second": round(len(reports) / elapsed, 3),
+        "p50_seconds": round(percentile(seconds, 50), 3) if seconds else None,
+        "p95_seconds": round(percentile(seconds, 95), 3) if seconds else None,
+        "generation": model.summarise_call_stats(),
+    }
+
+
+def tune(
+    model_class: type,
+    model_path: str,
+    root_dir: str,
+    reports: List[Dict[str, Any]],
+    grid: Dict[str, Sequence[Any]],
+    n_shots: int = 0,
+    include_guidelines: bool = True,
+    timeout: Optional[float] = None,
+    model_kwargs: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Measure every combination of settings in a grid.
+
+    A combination that fails (e.g. a context too small for the prompt, or
+    out of memory) is recorded with its error and the others still run.
+
+    Args:
+        model_class: QA model class of the backend
+        model_path: Model name or GGUF path
+        root_dir: Root directory for data modality
+        reports: Sample of input reports
+        grid: Values to try for each of the backend's TUNABLE_SETTINGS
+        n_shots: Number of few-shot examples in the prompt
+        include_guidelines: Whether to include guidelines in the prompt
+        timeout: Per-request timeout in seconds (HTTP backends only)
+        model_kwargs: Fixed model arguments (e.g. fake backend behaviour)
+
+    Returns:
+        Settings and measurements of each combination, in grid order
+    """
+    results = []
+    combinations = settings_grid(grid)
+    for i, settings in enumerate(combinations):
+        print(f"\n[{i + 1}/{len(combinations)}] Measuring {settings}")
+        try:
+            # No response cache: every combination must do the work
+            model = model_class(
+                model_path=model_path,
+                root_dir=root_dir,
+                cache=None,
+                **(model_kwargs or {}),
+                **model_kwargs_for(model_class.backend, settings),
+            )
+            measurements = measure(
+                model, reports, settings, n_shots, include_guidelines, timeout
+            )
+            result = {"settings": settings, **measurements}
+            print(
+                f"{result['reports_per_second']} reports/s, "
+                f"p95 {result['p95_seconds']}s"
+            )
+        except Exception as e:
+            print(f"Error measuring {settings}: {e}")
+            result = {"settings": settings, "error": str(e)}
+        finally:
+            if model_class.backend == "llamacpp":
+                # Free this combination's models before loading the next
+                get_model_pool().clear()
+        results.append(result)
+    return results
+
+
+def pick_best(
+    results: List[Dict[str, Any]], max_p95_seconds: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Get the result with the most reports per second (lower p95 breaks ties).
+
+    Results over max_p95_seconds are passed over, unless none is within it.
+    A result with no p95 (no calls were timed) counts as infinitely slow.
+    """
+
+    def p95(result: Dict[str, Any]) -> float:
+        return result["p95_seconds"] if result["p95_seconds"] is not None else inf
+
+    measured = [result for result in results if "error" not in result]
+    if max_p95_seconds is not None:
+        within = [result for result in measured if p95(result) <= max_p95_seconds]
+        if not within and measured:
+            print(f"No settings have p95 latency within {max_p95_seconds}s")
+        measured = within or measured
+    if not measured:
+        return None
+    return max(
+        measured, key=lambda result: (result["reports_per_second"], -p95(result))
+    )
+
+
+def save_profile(
+    path: Union[str, Path],
+    backend: str,
+    model_name: str,
+    best: Dict[str, Any],
+    results: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Save the best settings, with every measurement, as a profile."""
+    profile = {
+        "backend": backend,
+        "model_name": model_name,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "settings": best["settings"],
+        "reports_per_second": best["reports_per_second"],
+        "p95_seconds": best["p95_seconds"],
+        "results": results,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    save_json(profile, path)
+    return profile
+
+
+def load_profile(
+    path: Union[str, Path], backend: str, model_name: str
+) -> Dict[str, Any]:
+    """
+    Load a profile saved by save_profile.
+
+    Raises:
+        ValueError: If the profile was tuned for another backend
+    """
+    profile = load_json(path)
+    if profile["backend"] != backend:
+        raise ValueError(
+            f"Profile {path} was tuned for backend {profile['backend']}, not {backend}"
+        )
+    if profile["model_name"] != model_name:
+        print(
+            f"Warning: profile {path} was tuned for {profile['model_name']}, "
+            f"not {model_name}"
+        )
+    return profile
+
+
+def profile_script_defaults(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Get rb_script.py argument defaults from a profile's settings."""
+    defaults = {}
+    for name, value in profile["settings"].items():
+        if name == "use_mmap":
+            defaults["no_mmap"] = not value
+        elif name == "n_ctx" and profile["backend"] == "llamacpp":
+            defaults["n_ctx"] = str(value)
+        elif value is not None:
+            defaults[name] = value
+    return defaults
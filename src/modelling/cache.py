@@ -0,0 +1,115 @@
+"""
+Content-addressed on-disk cache for LLM responses.
+Generation runs at temperature 0, so a (model, prompt, options) triple always
+yields the same answer and can be served from disk on later runs.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of LLM responses stored as one JSON file per key."""
+
+    def __init__(self, cache_dir: Union[str, Path], max_size_mb: float = 1024):
+        """
+        Initialise the cache, creating its directory if needed.
+
+        Args:
+            cache_dir: Directory holding cached responses
+            max_size_mb: Total size above which least recently used entries
+                are evicted
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size_bytes = sum(path.stat().st_size for path in self._entries())
+
+    @staticmethod
+    def make_key(model: str, prompt: Any, options: Optional[Dict[str, Any]]) -> str:
+        """
+        Hash a model name, fully rendered prompt and generation options.
+
+        Args:
+            model: Model name or path
+            prompt: Rendered prompt (string, chat messages or request arguments)
+            options: Generation options that affect the output
+
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = json.dumps(
+            {"model": str(model), "prompt": prompt, "options": options},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached response, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a response, evicting least recently used entries if needed."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+
+        with self._lock:
+            # An overwritten entry's old size no longer counts
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._size_bytes += path.stat().st_size - old_size
+            if self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit and miss counts for this process."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        return self.cache_dir.glob("*/*.json")
+
+    def _evict(self) -> None:
+        """Delete the oldest entries until the cache is back under 90% of its limit."""
+        entries = sorted(
+            ((path.stat().st_mtime, path) for path in self._entries()),
+            key=lambda entry: entry[0],
+        )
+        self._size_bytes = sum(path.stat().st_size for _, path in entries)
+        target = int(self.max_size_bytes * 0.9)
+        for _, path in entries:
+            if self._size_bytes <= target:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self._size_bytes -= size
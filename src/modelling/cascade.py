@@ -0,0 +1,197 @@
+"""
+Two-tier model cascade.
+A small model annotates every report and only reports whose answers are
+schema-invalid or contradict the rule-based spaCy extractor are sent on to a
+larger model, so most reports never pay for the large model.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.modelling.qa_base import QABase
+
+# Entities the spaCy rules extract reliably enough to second-guess an LLM
+RULE_CHECKED_ENTITIES = (
+    "medulla_present",
+    "n_total",
+    "n_segmental",
+    "n_global",
+    "transplant",
+)
+
+_INTEGER = re.compile(r"^-?\d+$")
+
+
+class ModelCascade:
+    """Runs a small model on every report and escalates doubtful ones."""
+
+    def __init__(
+        self,
+        small_model: QABase,
+        large_model: QABase,
+        rule_check: bool = True,
+        rule_entities: Sequence[str] = RULE_CHECKED_ENTITIES,
+    ):
+        """
+        Initialise cascade.
+
+        Args:
+            small_model: Cheap model that answers every report
+            large_model: Model that answers escalated reports, same backend
+            rule_check: Escalate reports that conflict with the spaCy rules
+            rule_entities: Entities compared against the spaCy rules
+        """
+        self.small_model = small_model
+        self.large_model = large_model
+        self.rule_check = rule_check
+        self.rule_entities = list(rule_entities)
+        self.tiers: List[str] = []
+        self.escalation_reasons: Dict[int, Dict[str, List[str]]] = {}
+
+    def extract(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        **extraction_kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract entities with the small model, re-running doubtful reports on
+        the large model.
+
+        Args:
+            input_json: Input report templates
+            n_shots: Number of few-shot examples in the prompt
+            n_prototype: Number of reports to process
+            include_guidelines: Whether to include guidelines in the prompt
+            **extraction_kwargs: Backend options (e.g. concurrency, timeout)
+
+        Returns:
+            Predictions in input order; `tiers` records which model answered each
+        """
+        reports = input_json[:n_prototype]
+        predictions = self.small_model.extract_predictions(
+            reports, n_shots, len(reports), include_guidelines, **extraction_kwargs
+        )
+
+        self.escalation_reasons = {}
+        for i, prediction in enumerate(predictions):
+            invalid = self.find_invalid_entities(prediction)
+            if invalid:
+                self.escalation_reasons[i] = {"invalid": invalid}
+        if self.rule_check:
+            for i, conflicts in self.find_rule_conflicts(reports, predictions).items():
+                self.escalation_reasons.setdefault(i, {})["rule_conflict"] = conflicts
+
+        self.tiers = ["small"] * len(reports)
+        escalated = sorted(self.escalation_reasons)
+        if escalated:
+            print(
+                f"Escalating {len(escalated)}/{len(reports)} reports to the large model"
+            )
+            large_predictions = self.large_model.extract_predictions(
+                [reports[i] for i in escalated],
+                n_shots,
+                len(escalated),
+                include_guidelines,
+                **extraction_kwargs,
+            )
+            for i, prediction in zip(escalated, large_predictions):
+                predictions[i] = prediction
+                self.tiers[i] = "large"
+
+        return predictions
+
+    def find_invalid_entities(self, prediction: Dict[str, Any]) -> List[str]:
+        """
+        Find the entities whose value is missing or does not match its type.
+
+        A free-text answer of "none" is kept, as it can be a genuine value (e.g.
+        a diagnosis); for booleans and numericals it fails the type check.
+        Reports skipped for not fitting the context are escalated as a whole.
+        """
+        e2i_map = self.small_model.entity_guidelines.entity_to_info_map
+        if prediction.get("context_overflow"):
+            return list(e2i_map)
+        invalid = []
+        for code, info in e2i_map.items():
+            value = prediction.get(code)
+            value = "" if value is None else str(value).strip()
+            entity_type = info[1]
+            if value == "":
+                invalid.append(code)
+            elif entity_type == "boolean" and value.lower() not in ("true", "false"):
+                invalid.append(code)
+            elif entity_type == "numerical" and not _INTEGER.match(value):
+                invalid.append(code)
+        return invalid
+
+    def find_rule_conflicts(
+        self,
+        reports: List[Dict[str, Any]],
+        predictions: List[Dict[str, Any]],
+    ) -> Dict[int, List[str]]:
+        """
+        Compare predictions with the spaCy rule-based extractor.
+
+        Only values the rules actually found are compared: a rule default
+        (0, False or None) is absence of evidence, not a conflict.
+
+        Returns:
+            Dictionary mapping report position to its conflicting entity codes
+        """
+        rule_results = self._run_rules(reports)
+        if rule_results is None:
+            return {}
+
+        conflicts = {}
+        for i, (rules, prediction) in enumerate(zip(rule_results, predictions)):
+            codes = [
+                code
+                for code in self.rule_entities
+                if rules.get(code)
+                and str(prediction.get(code, "")).strip().lower()
+                != str(rules[code]).lower()
+            ]
+            if codes:
+                conflicts[i] = codes
+        return conflicts
+
+    def _run_rules(
+        self, reports: List[Dict[str, Any]]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Run the spaCy rules on the reports, or None if spaCy is unavailable."""
+        try:
+            from src.renal_biopsy.alt_models.spacy import process_reports
+
+            rule_results, _ = process_reports(
+                [self.small_model.get_report_string(report) for report in reports],
+                n_prototype=len(reports),
+            )
+        except (ImportError, OSError) as e:
+            print(f"Skipping spaCy rule check: {e}")
+            return None
+        return rule_results
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarise how many reports each tier answered and why reports were
+        escalated.
+        """
+        n_large = self.tiers.count("large")
+        return {
+            "n_reports": len(self.tiers),
+            "n_small": self.tiers.count("small"),
+            "n_large": n_large,
+            "n_invalid": sum(
+                "invalid" in reasons for reasons in self.escalation_reasons.values()
+            ),
+            "n_rule_conflict": sum(
+                "rule_conflict" in reasons
+                for reasons in self.escalation_reasons.values()
+            ),
+            "large_calls_saved": len(self.tiers) - n_large,
+            "small_generation": self.small_model.summarise_call_stats(),
+            "large_generation": self.large_model.summarise_call_stats(),
+        }
@@ -0,0 +1,77 @@
+"""
+Context-size planning for llama.cpp.
+Rendered prompts are tokenized with the model's own vocabulary before inference
+so a run gets the smallest context bucket that fits its largest prompt, and
+reports that cannot fit are caught up front instead of being silently
+truncated. Every llama.cpp context size is a separate loaded model, so the
+size chosen for a run only ever grows and all of its prompts share it.
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+from llama_cpp import Llama
+from llama_cpp.llama_chat_format import format_chatml
+
+CONTEXT_BUCKETS = (1024, 2048, 3072, 4096, 6144, 8192)
+
+
+class ContextPlanner:
+    """Counts prompt tokens and picks the context size a run's prompts share."""
+
+    def __init__(
+        self,
+        model_path: str,
+        buckets: Sequence[int] = CONTEXT_BUCKETS,
+        max_output_tokens: int = 512,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        Initialise planner; the vocabulary is loaded on first use.
+
+        Args:
+            model_path: Path to the GGUF file
+            buckets: Allowed context sizes (a single bucket fixes n_ctx)
+            max_output_tokens: Tokens reserved for the generated answer
+            token_counter: Counts the tokens of raw text instead of the GGUF
+                vocabulary, for models with no local GGUF
+        """
+        self.model_path = model_path
+        self.buckets = sorted(buckets)
+        self.max_output_tokens = max_output_tokens
+        self.token_counter = token_counter
+        # Largest bucket any prompt has needed so far (None before the first)
+        self.n_ctx: Optional[int] = None
+        self._tokenizer: Optional[Llama] = None
+
+    def count_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Count the tokens of chat messages rendered with the chatml template."""
+        return self.count_text_tokens(format_chatml(messages=messages).prompt)
+
+    def count_text_tokens(self, text: str) -> int:
+        """Count the tokens of raw text, including the BOS token."""
+        if self.token_counter is not None:
+            return self.token_counter(text)
+        if self._tokenizer is None:
+            self._tokenizer = Llama(
+                model_path=str(self.model_path), vocab_only=True, verbose=False
+            )
+        return len(
+            self._tokenizer.tokenize(text.encode("utf-8"), add_bos=True, special=True)
+        )
+
+    def pick_n_ctx(
+        self, n_prompt_tokens: int, n_output_tokens: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Get the context size to run a prompt with, or None if no bucket fits.
+
+        This is the smallest bucket fitting the prompt and answer, or the
+        run's current size if that is larger, so one model instance serves
+        every prompt planned so far.
+        """
+        needed = n_prompt_tokens + (n_output_tokens or self.max_output_tokens)
+        for n_ctx in self.buckets:
+            if n_ctx >= needed:
+                self.n_ctx = max(n_ctx, self.n_ctx or 0)
+                return self.n_ctx
+        return None
@@ -0,0 +1,106 @@
+"""
+Entity-group decomposition of extraction prompts.
+Each group of related entities is asked for in its own short prompt that
+carries only the report sentences relevant to that group, so small models
+answer focused questions and the groups of one report can run in parallel.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+_SENTENCE_END = re.compile(r"(?<=[.;!?])\s+|\n+")
+_WORD = re.compile(r"[a-z]+")
+_STOPWORDS = {
+    "about",
+    "answer",
+    "any",
+    "are",
+    "does",
+    "from",
+    "have",
+    "how",
+    "many",
+    "mentioned",
+    "number",
+    "present",
+    "report",
+    "that",
+    "the",
+    "their",
+    "there",
+    "these",
+    "this",
+    "using",
+    "what",
+    "which",
+    "with",
+}
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split report text into sentences."""
+    return [
+        sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()
+    ]
+
+
+def question_keywords(questions: Iterable[str], min_length: int = 4) -> List[str]:
+    """Get the content words of entity questions, for lexical sentence scoring."""
+    keywords = []
+    for question in questions:
+        for word in _WORD.findall(question.lower()):
+            if (
+                len(word) >= min_length
+                and word not in _STOPWORDS
+                and word not in keywords
+            ):
+                keywords.append(word)
+    return keywords
+
+
+def select_relevant_sentences(text: str, keywords: List[str]) -> str:
+    """
+    Keep the sentences of text that contain any keyword.
+
+    Keywords match as case-insensitive prefixes of words (e.g. "glomer"
+    matches "glomeruli"), or as substrings if they are not alphabetic (e.g. "%").
+
+    Returns:
+        Relevant sentences in their original order, or "" if none match
+    """
+    prefixes = [keyword.lower() for keyword in keywords]
+    relevant = []
+    for sentence in split_sentences(text):
+        lowered = sentence.lower()
+        words = _WORD.findall(lowered)
+        if any(
+            any(word.startswith(prefix) for word in words)
+            if prefix.isalpha()
+            else prefix in lowered
+            for prefix in prefixes
+        ):
+            relevant.append(sentence)
+    return " ".join(relevant)
+
+
+def focus_report(
+    report: Dict[str, Any],
+    keywords: Optional[List[str]],
+    text_fields: List[str],
+) -> Dict[str, Any]:
+    """
+    Reduce a report's text fields to the sentences relevant to a group.
+
+    The full report is kept if keywords is None or no sentence matches, so a
+    group is never asked about an empty report.
+    """
+    if keywords is None:
+        return report
+    focused = {
+        field: select_relevant_sentences(str(report[field]), keywords)
+        for field in text_fields
+        if report.get(field)
+    }
+    if not any(focused.values()):
+        return report
+    return {**report, **focused}
@@ -0,0 +1,337 @@
+"""
+Deterministic fake LLM backend for throughput testing.
+FakeQA goes through the same request building, concurrency, caching, parsing
+and evaluation code as OllamaQA, but its clients answer from annotated reports
+after a simulated delay, so orchestration can be load-tested without a model.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from src.modelling.cache import ResponseCache
+from src.modelling.qa_base import OllamaQA
+from src.utils.json import load_json
+
+_TEMPLATE = re.compile(r"TEMPLATE: (\{[^{}]*\})")
+_PACKED_REPORT = re.compile(
+    r"--- REAL REPORT (\d+) ---(.*?)(?=--- REAL REPORT \d+ ---|\Z)", re.S
+)
+
+
+def _squash(text: str) -> str:
+    """Collapse whitespace so report text matches however the prompt was formatted."""
+    return " ".join(text.split())
+
+
+class FakeBehaviour:
+    """Seeded latency, failure and malformed-output draws for fake calls."""
+
+    def __init__(
+        self,
+        latency_ms: float = 50,
+        latency_sigma: float = 0.5,
+        failure_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        load_ms: float = 0,
+        seed: int = 0,
+    ):
+        """
+        Initialise behaviour.
+
+        Args:
+            latency_ms: Median latency of a call
+            latency_sigma: Spread of the log-normal latency (0 for a fixed latency)
+            failure_rate: Fraction of calls that time out
+            malformed_rate: Fraction of answers that are not valid JSON
+            load_ms: Simulated model load time, added to the first call only
+            seed: Seed combined with each prompt, so a prompt always gets the
+                same draws whatever order calls are made in
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.load_ms = load_ms
+        self.seed = seed
+        self._loaded = False
+
+    def settings(self) -> Dict[str, Any]:
+        """Get the settings the draws depend on, e.g. for response cache keys."""
+        return {
+            "latency_ms": self.latency_ms,
+            "latency_sigma": self.latency_sigma,
+            "failure_rate": self.failure_rate,
+            "malformed_rate": self.malformed_rate,
+            "load_ms": self.load_ms,
+            "seed": self.seed,
+        }
+
+    def draw(self, model: str, prompt: str) -> Dict[str, Any]:
+        """Draw the latency, load time and outcome of one call."""
+        rng = random.Random(f"{self.seed}:{model}:{prompt}")
+        latency = self.latency_ms * (
+            rng.lognormvariate(0, self.latency_sigma) if self.latency_sigma else 1
+        )
+        load_ms, self._loaded = (0 if self._loaded else self.load_ms), True
+        return {
+            "seconds": (latency + load_ms) / 1000,
+            "load_seconds": load_ms / 1000,
+            "fail": rng.random() < self.failure_rate,
+            "malformed": rng.random() < self.malformed_rate,
+            "malformed_kind": rng.randrange(3),
+        }
+
+
+class FakeOllamaClient:
+    """Stands in for ollama.Client, answering generate() from annotations."""
+
+    def __init__(self, qa: "FakeQA", timeout: Optional[float] = None):
+        self.qa = qa
+        self.timeout = timeout
+
+    def generate(self, model: str, prompt: str = "", **request: Any) -> Dict[str, Any]:
+        draw = self.qa.behaviour.draw(model, request.get("system", "") + prompt)
+        if draw["fail"]:
+            time.sleep(min(draw["seconds"], self.timeout or draw["seconds"]))
+            raise httpx.ReadTimeout("Fake backend timed out")
+        time.sleep(draw["seconds"])
+        return self.qa.fake_response(model, prompt, request, draw)
+
+
+class FakeAsyncOllamaClient(FakeOllamaClient):
+    """Stands in for ollama.AsyncClient."""
+
+    async def generate(
+        self, model: str, prompt: str = "", **request: Any
+    ) -> Dict[str, Any]:
+        draw = self.qa.behaviour.draw(model, request.get("system", "") + prompt)
+        await asyncio.sleep(draw["seconds"])
+        if draw["fail"]:
+            raise asyncio.TimeoutError
+        return self.qa.fake_response(model, prompt, request, draw)
+
+
+class FakeQA(OllamaQA):
+    """OllamaQA whose answers come from annotations instead of a model."""
+
+    backend = "fake"
+    judge_provider = "fake"
+
+    def __init__(
+        self,
+        model_path: str,
+        root_dir: str,
+        system_message: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        annotations_file: str = "synthetic_annotations.json",
+        latency_ms: float = 50,
+        latency_sigma: float = 0.5,
+        failure_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        load_ms: float = 0,
+        seed: int = 0,
+        **ollama_kwargs: Any,
+    ):
+        """
+        Initialise fake QA model.
+
+        Args:
+            model_path: Name reported for the fake model (also seeds its draws)
+            root_dir: Root directory for data modality
+            system_message: Optional system message override
+            cache: Optional response cache consulted before each request
+            annotations_file: Annotations in root_dir/data answered from
+            latency_ms, latency_sigma, failure_rate, malformed_rate, load_ms,
+                seed: See FakeBehaviour
+            **ollama_kwargs: Further OllamaQA arguments (e.g. structured_output)
+        """
+        super().__init__(model_path, root_dir, system_message, cache, **ollama_kwargs)
+        self.behaviour = FakeBehaviour(
+            latency_ms, latency_sigma, failure_rate, malformed_rate, load_ms, seed
+        )
+        annotations_path = Path(root_dir) / "data" / annotations_file
+        self.annotations: List[Dict[str, Any]] = (
+            load_json(annotations_path) if annotations_path.exists() else []
+        )
+        self._answers_by_report: Dict[str, Dict[str, Any]] = {}
+
+    def register_reports(
+        self,
+        reports: List[Dict[str, Any]],
+        annotations: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Pair reports with their annotations, so each report is answered with
+        its own annotation; other reports get a deterministic pick.
+        """
+        annotations = annotations if annotations is not None else self.annotations
+        for report, annotation in zip(reports, annotations):
+            self._answers_by_report[
+                _squash(self.get_report_string(report))
+            ] = annotation
+
+    def cache_key_options(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Key cached answers by the behaviour too, so a change is not masked."""
+        return {**options, "fake_behaviour": self.behaviour.settings()}
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens the way fake responses report prompt_eval_count."""
+        return len(text) // 4
+
+    def _make_client(self, timeout: Optional[float] = None) -> FakeOllamaClient:
+        return FakeOllamaClient(self, timeout)
+
+    def _make_async_client(self) -> FakeAsyncOllamaClient:
+        return FakeAsyncOllamaClient(self)
+
+    def fake_response(
+        self,
+        model: str,
+        prompt: str,
+        request: Dict[str, Any],
+        draw: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Build an Ollama-style response for a request."""
+        full_prompt = request.get("system", "") + prompt
+        entity_codes = self._requested_codes(full_prompt, request.get("format"))
+        packed = _PACKED_REPORT.findall(prompt)
+        if packed:
+            payload: Any = [
+                {"report_id": int(report_id), **self._answer(model, text, entity_codes)}
+                for report_id, text in packed
+            ]
+        else:
+            text = prompt.rsplit("--- REAL REPORT ---", 1)[-1]
+            payload = self._answer(model, text, entity_codes)
+        answer = json.dumps(payload)
+        if draw["malformed"]:
+            answer = self._malform(answer, draw["malformed_kind"])
+
+        n_prompt_tokens = len(full_prompt) // 4
+        n_tokens = len(answer) // 4
+        total_ns = int(draw["seconds"] * 1e9)
+        load_ns = int(draw["load_seconds"] * 1e9)
+        prompt_ns = (total_ns - load_ns) // 4
+        return {
+            "model": model,
+            "response": answer,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": n_prompt_tokens,
+            "eval_count": n_tokens,
+            "load_duration": load_ns,
+            "prompt_eval_duration": prompt_ns,
+            "eval_duration": total_ns - load_ns - prompt_ns,
+            "total_duration": total_ns,
+        }
+
+    def _requested_codes(
+        self, prompt: str, format_schema: Optional[Dict[str, Any]]
+    ) -> List[str]:
+        """Get the entity codes a request asks for, from its schema or template."""
+        if format_schema is not None:
+            schema = format_schema.get("items", format_schema)
+            return [code for code in schema["properties"] if code != "report_id"]
+        templates = _TEMPLATE.findall(prompt)
+        if templates:
+            try:
+                return list(json.loads(templates[0]))
+            except json.JSONDecodeError:
+                pass
+        return self.get_entity_list()
+
+    def _answer(
+        self, model: str, report_text: str, entity_codes: List[str]
+    ) -> Dict[str, Any]:
+        """Answer for one report, typed like a schema-valid model answer."""
+        key = _squash(report_text)
+        annotation = self._answers_by_report.get(key)
+        if annotation is None:
+            for report_key, candidate in self._answers_by_report.items():
+                if report_key and report_key in key:
+                    annotation = candidate
+                    break
+        if annotation is None and self.annotations:
+            digest = hashlib.sha256(f"{model}:{key}".encode("utf-8")).hexdigest()
+            annotation = self.annotations[int(digest, 16) % len(self.annotations)]
+        annotation = annotation or {}
+
+        e2i_map = self.entity_guidelines.entity_to_info_map
+        answer = {}
+        for code in entity_codes:
+            value = str(annotation.get(code, ""))
+            entity_type = e2i_map[code][1] if code in e2i_map else ""
+            if entity_type == "boolean" and value in ("True", "False"):
+                answer[code] = value == "True"
+            elif entity_type == "numerical" and value.isdigit():
+                answer[code] = int(value)
+            else:
+                answer[code] = value
+        return answer
+
+    @staticmethod
+    def _malform(answer: str, kind: int) -> str:
+        """Break an answer the ways small models do."""
+        if kind == 0:
+            return answer[: len(answer) // 2]  # truncated
+        if kind == 1:
+            return f"Sure! Here is the answer:\n{answer.replace(chr(34), chr(39))}"
+        return answer.replace(", ", ",, ", 1)  # stray comma
+
+
+def add_fake_backend_args(parser: argparse.ArgumentParser) -> None:
+    """Add the fake backend's behaviour options to a script's parser."""
+    parser.add_argument(
+        "--fake_latency_ms",
+        help="Median latency of a fake backend call",
+        default=50,
+        type=float,
+    )
+    parser.add_argument(
+        "--fake_latency_sigma",
+        help="Spread of the fake backend's log-normal latency (0 for fixed)",
+        default=0.5,
+        type=float,
+    )
+    parser.add_argument(
+        "--fake_failure_rate",
+        help="Fraction of fake backend calls that time out",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--fake_malformed_rate",
+        help="Fraction of fake backend answers that are not valid JSON",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--fake_load_ms",
+        help="Simulated model load time of the fake backend",
+        default=0,
+        type=float,
+    )
+    parser.add_argument(
+        "--fake_seed", help="Seed of the fake backend's draws", default=0, type=int
+    )
+
+
+def fake_backend_kwargs(args: argparse.Namespace) -> Dict[str, Any]:
+    """Get FakeQA arguments from parsed script arguments."""
+    return {
+        "latency_ms": args.fake_latency_ms,
+        "latency_sigma": args.fake_latency_sigma,
+        "failure_rate": args.fake_failure_rate,
+        "malformed_rate": args.fake_malformed_rate,
+        "load_ms": args.fake_load_ms,
+        "seed": args.fake_seed,
+    }
@@ -0,0 +1,126 @@
+"""
+Process-wide pool of warm llama.cpp models.
+Each GGUF is loaded once per (model_path, n_ctx, chat_format, n_threads and any
+extra Llama arguments) and handed out to callers, with its context state reset
+when it is returned.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from llama_cpp import Llama
+
+PoolKey = Tuple[Any, ...]
+
+
+class LlamaModelPool:
+    """Keeps loaded llama.cpp models alive so reports don't pay the load cost."""
+
+    def __init__(self):
+        """Initialise an empty pool."""
+        self._idle: Dict[PoolKey, List[Llama]] = {}
+        self._n_loaded: Dict[PoolKey, int] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Bumped by clear(); instances checked out before it are not returned
+        self._generation = 0
+
+    @contextmanager
+    def acquire(
+        self,
+        model_path: str,
+        n_ctx: int,
+        chat_format: str = "chatml",
+        n_threads: Optional[int] = None,
+        **llama_kwargs: Any,
+    ) -> Iterator[Llama]:
+        """
+        Check out a warm model instance, loading it on first use.
+
+        Instances are never shared between concurrent callers; if every
+        instance for a key is checked out, a new one is loaded.
+
+        Args:
+            model_path: Path to the GGUF file
+            n_ctx: Context size
+            chat_format: Chat template name
+            n_threads: Number of CPU threads (None uses llama.cpp's default)
+            **llama_kwargs: Further Llama arguments (e.g. use_mmap), also
+                part of the pool key
+
+        Yields:
+            Llama instance with an empty context
+        """
+        key = (
+            str(model_path),
+            n_ctx,
+            chat_format,
+            n_threads,
+            *sorted(llama_kwargs.items()),
+        )
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            llm = idle.pop() if idle else None
+            generation = self._generation
+
+        if llm is None:
+            start_time = time.perf_counter()
+            llm = Llama(
+                model_path=str(model_path),
+                chat_format=chat_format,
+                verbose=False,
+                n_ctx=n_ctx,
+                n_threads=n_threads,
+                **llama_kwargs,
+            )
+            with self._lock:
+                self._n_loaded[key] = self._n_loaded.get(key, 0) + 1
+                self._load_seconds[key[0]] = (
+                    self._load_seconds.get(key[0], 0) + time.perf_counter() - start_time
+                )
+
+        try:
+            yield llm
+        finally:
+            llm.reset()
+            with self._lock:
+                # After clear() the instance is dropped instead, so it is freed
+                if generation == self._generation:
+                    self._idle.setdefault(key, []).append(llm)
+
+    def n_loaded(self) -> Dict[PoolKey, int]:
+        """Get the number of instances loaded per pool key."""
+        with self._lock:
+            return dict(self._n_loaded)
+
+    def load_seconds(self, model_path: str) -> float:
+        """Get the total time spent loading instances of a GGUF in this process."""
+        with self._lock:
+            return self._load_seconds.get(str(model_path), 0)
+
+    def discard(self, model_path: str, keep_n_ctx: int) -> None:
+        """Drop idle instances of a GGUF loaded with any other context size."""
+        with self._lock:
+            for key in list(self._idle):
+                if key[0] == str(model_path) and key[1] != keep_n_ctx:
+                    del self._idle[key]
+
+    def clear(self) -> None:
+        """
+        Drop all idle instances so their memory can be released; instances
+        checked out at the time are dropped when they are returned.
+        """
+        with self._lock:
+            self._generation += 1
+            self._idle.clear()
+            self._n_loaded.clear()
+
+
+_MODEL_POOL = LlamaModelPool()
+
+
+def get_model_pool() -> LlamaModelPool:
+    """Get the process-wide llama.cpp model pool."""
+    return _MODEL_POOL
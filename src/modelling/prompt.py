@@ -0,0 +1,122 @@
+"""
+Compiled task prompts.
+A task prompt depends only on the guidelines file, the few-shot settings and the
+backend, so it is built once per combination per process and identified by a
+fingerprint of the rendered text, which downstream caches use as their key.
+Prompts can also be normalised to drop the whitespace left by indented source
+strings.
+"""
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+# Artifacts compiled in this process, by compile key
+_ARTIFACTS: Dict[str, "PromptArtifact"] = {}
+
+# Innermost {...} blocks, i.e. flat JSON objects such as few-shot answers
+_FLAT_OBJECT = re.compile(r"\{[^{}]*\}")
+
+
+def _compact_json(match: re.Match) -> str:
+    """Re-serialise a JSON object on one line, leaving non-JSON text untouched."""
+    try:
+        return json.dumps(
+            json.loads(match.group(0)), separators=(", ", ": "), ensure_ascii=False
+        )
+    except json.JSONDecodeError:
+        return match.group(0)
+
+
+def normalise_prompt(text: str) -> str:
+    """
+    Strip the whitespace that indented triple-quoted strings leave in prompts.
+
+    Removes leading and trailing spaces from every line, collapses runs of
+    spaces and of blank lines, and puts flat JSON objects (few-shot answers,
+    templates) on a single line. Words and line breaks between them are kept.
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Normalised prompt text
+    """
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.splitlines()]
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return _FLAT_OBJECT.sub(_compact_json, text)
+
+
+def fingerprint(payload: Any) -> str:
+    """Hash any JSON-serializable payload (e.g. prompt text) to a hex digest."""
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+@dataclass(frozen=True)
+class PromptArtifact:
+    """Immutable task prompt and the pieces it was built from."""
+
+    guidelines_hash: str
+    n_shots: int
+    include_guidelines: bool
+    backend: str
+    questions: str
+    template: str
+    guidelines: str
+    task_prompt: str
+    fingerprint: str
+
+    @classmethod
+    def compile(
+        cls,
+        guidelines_hash: str,
+        n_shots: int,
+        include_guidelines: bool,
+        backend: str,
+        build: Callable[[], Dict[str, str]],
+        extra_key: Any = None,
+    ) -> "PromptArtifact":
+        """
+        Get the compiled prompt for a configuration, building it on first use.
+
+        Args:
+            guidelines_hash: Hash of the guidelines file contents
+            n_shots: Number of few-shot examples
+            include_guidelines: Whether guidelines are included
+            backend: Model backend the prompt is formatted for
+            build: Builds the questions, template, guidelines and task_prompt
+            extra_key: Any other inputs the prompt depends on (e.g. the system
+                message and few-shot examples)
+
+        Returns:
+            Prompt artifact, shared by all callers with the same configuration
+        """
+        key = fingerprint(
+            [
+                guidelines_hash,
+                n_shots,
+                include_guidelines,
+                backend,
+                extra_key,
+            ]
+        )
+        if key in _ARTIFACTS:
+            return _ARTIFACTS[key]
+
+        # Always render the prompt in a new process: the fingerprint then covers
+        # its actual text, so a wording change is never served from a stale entry
+        parts = build()
+        artifact = cls(
+            guidelines_hash=guidelines_hash,
+            n_shots=n_shots,
+            include_guidelines=include_guidelines,
+            backend=backend,
+            fingerprint=fingerprint([key, parts]),
+            **parts,
+        )
+        _ARTIFACTS[key] = artifact
+        return artifact
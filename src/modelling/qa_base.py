@@ -1,22 +1,51 @@
 """
-Medical report QA models using different LLM backends (Ollama and LlamaCpp).
+Medical report QA models using different LLM backends (Ollama, LlamaCpp and
+llama.cpp server).
 """
 
+import asyncio
+import copy
+import json
+import math
+import os
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-import pandas as pd
+from functools import partial
+from typing import Callable, List, Dict, Any, Optional, Tuple, Union
 from tqdm import tqdm
+import httpx
 import ollama
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaState
+from llama_cpp.llama_chat_format import format_chatml
 
 from src.preprocessing.guidelines import EntityGuidelines
-from src.utils.json import process_llm_batch
+from src.modelling.cache import ResponseCache
+from src.modelling.context import CONTEXT_BUCKETS, ContextPlanner
+from src.modelling.decompose import focus_report, question_keywords
+from src.modelling.llama_pool import get_model_pool
+from src.modelling.prompt import PromptArtifact, fingerprint, normalise_prompt
+from src.modelling.sharding import run_sharded_extraction
+from src.modelling.speculative import CountingDraftModel, get_draft_model
+from src.utils.json import (
+    count_parse_results,
+    process_llm_batch,
+    process_llm_response,
+    split_packed_llm_response,
+)
+from src.utils.checkpoint import RunCheckpoint
+from src.utils.concurrency import gather_bounded
+from src.utils.general import percentile
 from src.evaluate.report import evaluate_report
 
 
 class QABase(ABC):
     """Abstract base class for medical report QA models."""
     
+    # Backend name, part of a compiled prompt's identity
+    backend = ""
+    # Provider of the LLM judge comparing free-text answers in evaluate()
+    judge_provider = "ollama"
+
     DEFAULT_SYSTEM_MSG = """
     You are a biomedical expert. Answer the questions below using the JSON dictionary template only. 
     Do not mention anything that is not in the report and do not add any text beyond the JSON.
@@ -26,47 +55,332 @@ class QABase(ABC):
         self,
         model_path: str,
         root_dir: str,
-        system_message: Optional[str] = None
+        system_message: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        normalise_prompts: bool = False,
     ):
-        """Initialise base QA model."""
+        """
+        Initialise base QA model, optionally with an LLM response cache and
+        whitespace-normalised prompts.
+        """
         self.model_path = model_path
         self.root_dir = root_dir
+        self.cache = cache
+        self.normalise_prompts = normalise_prompts
         self.system_message = system_message or self.DEFAULT_SYSTEM_MSG
         self.entity_guidelines = EntityGuidelines(f"{root_dir}/data/guidelines.xlsx")
         self.max_n_few_shots = 3
+        self.call_stats: List[Dict[str, Any]] = []
+        self.repair_stats: Dict[str, int] = {}
+        self.prefill_stats: Dict[str, int] = {}
+        self.parse_stats: Dict[str, int] = {}
+        # Set once any token count in the run fell back to an estimate
+        self.tokens_estimated = False
     
     def create_task_prompt(self, n_shots: int = 0, include_guidelines: bool = True) -> str:
         """Create the task prompt with optional few-shot examples."""
+        return self.compile_prompt(n_shots, include_guidelines).task_prompt
+
+    def compile_prompt(
+        self, n_shots: int = 0, include_guidelines: bool = True
+    ) -> PromptArtifact:
+        """
+        Get the compiled task prompt, built once per (guidelines file, n_shots,
+        include_guidelines, backend) and shared by every model instance.
+        """
+        if not 0 <= n_shots <= self.max_n_few_shots:
+            raise ValueError(f"n_shots must be between 0 and {self.max_n_few_shots}")
+        return PromptArtifact.compile(
+            self.entity_guidelines.file_hash,
+            n_shots,
+            include_guidelines,
+            self.backend,
+            build=lambda: self._build_prompt_parts(n_shots, include_guidelines),
+            extra_key=[
+                self.system_message,
+                self.get_few_shot_list()[:n_shots],
+                self.normalise_prompts,
+            ],
+        )
+
+    def _build_prompt_parts(
+        self, n_shots: int, include_guidelines: bool
+    ) -> Dict[str, str]:
+        """
+        Build the task prompt and the pieces it is made of.
+        """
         questions = self.get_questions_string()
         guidelines = self.get_entity_guidelines_string() if include_guidelines else ""
+        template = self._get_format_instructions()
         few_shots = self.get_few_shot_list()
+        parts = {"questions": questions, "template": template, "guidelines": guidelines}
         
         if n_shots == 0:
             task = f"""
             Given the real report at the end of this prompt your task is to answer the following questions:
             {questions}
-            {self._get_format_instructions()}
+            {template}
 
             --- GUIDELINES ---
             {guidelines}
 
             """
-            return f"{self.system_message} {task}"
+            task_prompt = f"{self.system_message} {task}"
+            return {**parts, "task_prompt": self.finalise_prompt(task_prompt)}
         
         if 0 < n_shots <= self.max_n_few_shots:
             task = f"""
             Given the real report at the end of this prompt and the example reports with answers, your task is to answer the following questions:
             {questions}
-            {self._get_format_instructions()}
+            {template}
 
             --- GUIDELINES ---
             {guidelines}
 
             """
             shots = "\n".join(few_shots[:n_shots])
-            return f"{self.system_message} {task} {shots}"
+            task_prompt = f"{self.system_message} {task} {shots}"
+            return {**parts, "task_prompt": self.finalise_prompt(task_prompt)}
         
         raise ValueError(f"n_shots must be between 0 and {self.max_n_few_shots}")
+
+    def create_repair_prompt(
+        self, entity_codes: List[str], include_guidelines: bool = True
+    ) -> str:
+        """Create a short prompt asking only for the given entities."""
+        e2i_map = self.entity_guidelines.entity_to_info_map
+        questions = "\n".join(f"{code}: {e2i_map[code][0]}" for code in entity_codes)
+        guidelines = "\n".join(
+            f"{code} : {e2i_map[code][2]}"
+            for code in entity_codes
+            if include_guidelines and e2i_map[code][2]
+        )
+        instruction = (
+            "Given the real report at the end of this prompt your task is to answer "
+            "only the following questions:"
+        )
+        task = f"""
+            {instruction}
+            {questions}
+            {self._get_format_instructions(entity_codes)}
+
+            --- GUIDELINES ---
+            {guidelines}
+
+            """
+        return self.finalise_prompt(f"{self.system_message} {task}")
+
+    def finalise_prompt(self, prompt: str) -> str:
+        """Normalise a prompt's whitespace if normalise_prompts is set."""
+        return normalise_prompt(prompt) if self.normalise_prompts else prompt
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens in text (estimated unless a backend can tokenize)."""
+        return self.estimate_tokens(text)
+
+    def estimate_tokens(self, text: str, error: Optional[Exception] = None) -> int:
+        """
+        Estimate the number of tokens in text (about 4 characters per token).
+
+        This is the fallback for when the model cannot count them; it sets
+        tokens_estimated so saved counts are labelled as estimates.
+
+        Args:
+            text: Text to count
+            error: Why the model's count failed, reported the first time
+        """
+        if error is not None and not self.tokens_estimated:
+            print(f"Could not count tokens with the model ({error!r}); estimating")
+        self.tokens_estimated = True
+        return math.ceil(len(text) / 4)
+
+    def compare_prompt_tokens(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Count each report's prompt tokens with and without normalisation.
+
+        Returns:
+            List of {"index", "tokens_raw", "tokens_normalised", "estimated"},
+            one per report
+        """
+        normalise_prompts = self.normalise_prompts
+        counts = []
+        try:
+            prompts = {}
+            for normalised in (False, True):
+                self.normalise_prompts = normalised
+                task_prompt = self.create_task_prompt(n_shots, include_guidelines)
+                prompts[normalised] = [
+                    task_prompt + self.get_report_prompt(report)
+                    for report in input_json[:n_prototype]
+                ]
+        finally:
+            self.normalise_prompts = normalise_prompts
+
+        for i, (raw, normalised) in enumerate(zip(prompts[False], prompts[True])):
+            counts.append(
+                {
+                    "index": i,
+                    "tokens_raw": self.count_tokens(raw),
+                    "tokens_normalised": self.count_tokens(normalised),
+                    "estimated": self.tokens_estimated,
+                }
+            )
+        return counts
+
+    def find_missing_entities(
+        self, predictions: List[Dict[str, Any]]
+    ) -> Dict[int, List[str]]:
+        """
+        Find, per report, the entities still holding their empty template value.
+
+        Reports skipped for not fitting the context are left out.
+
+        Returns:
+            Dictionary mapping report position to its missing entity codes
+        """
+        entity_list = self.get_entity_list()
+        missing = {}
+        for i, prediction in enumerate(predictions):
+            if prediction.get("context_overflow"):
+                continue
+            entity_codes = [
+                code for code in entity_list if prediction.get(code, "") == ""
+            ]
+            if entity_codes:
+                missing[i] = entity_codes
+        return missing
+
+    def _record_repair_stats(
+        self,
+        missing: Dict[int, List[str]],
+        repaired: List[Dict[str, Any]],
+    ) -> None:
+        """Record how many missing entities were re-queried and recovered."""
+        self.repair_stats = {
+            "n_reports": len(missing),
+            "n_entities_requeried": sum(len(codes) for codes in missing.values()),
+            "n_entities_recovered": sum(
+                repaired[i].get(code, "") != ""
+                for i, codes in missing.items()
+                for code in codes
+            ),
+        }
+        print(
+            f"Recovered {self.repair_stats['n_entities_recovered']}/"
+            f"{self.repair_stats['n_entities_requeried']} missing entities"
+        )
+
+    def record_parse_stats(self, counts: Dict[str, int]) -> None:
+        """Add answer parsing counts (see count_parse_results) to parse_stats."""
+        for name, count in counts.items():
+            self.parse_stats[name] = self.parse_stats.get(name, 0) + count
+
+    def extract_with_prefill(
+        self,
+        input_json: List[Dict[str, Any]],
+        prefilled: List[Dict[str, Any]],
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        **repair_kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """
+        Fix entities already resolved (e.g. by rules) and ask the LLM for the rest.
+
+        Each report gets one prompt with only its unresolved questions and
+        template keys; reports resolved in full never reach the LLM.
+
+        Args:
+            input_json: Input report templates
+            prefilled: {entity code: value} for each report
+            n_prototype: Number of reports to process
+            include_guidelines: Whether to include guidelines in the prompt
+            **repair_kwargs: Backend options passed to repair_predictions
+
+        Returns:
+            Predictions in the same format as the full extraction
+        """
+        entity_list = self.get_entity_list()
+        predictions = []
+        n_prefilled = 0
+        for report, values in zip(input_json[:n_prototype], prefilled):
+            prediction = copy.deepcopy(report)
+            for code, value in values.items():
+                if code in entity_list and value is not None:
+                    prediction[code] = self.format_prefill_value(value)
+                    n_prefilled += 1
+            predictions.append(prediction)
+
+        n_unresolved = len(self.find_missing_entities(predictions))
+        self.prefill_stats = {
+            "n_reports": len(predictions),
+            "n_entities_prefilled": n_prefilled,
+            "n_reports_resolved_by_rules": len(predictions) - n_unresolved,
+        }
+        print(
+            f"Rules resolved {n_prefilled} entities and "
+            f"{self.prefill_stats['n_reports_resolved_by_rules']}/"
+            f"{len(predictions)} reports"
+        )
+        return self.repair_predictions(predictions, include_guidelines, **repair_kwargs)
+
+    def format_prefill_value(self, value: Any) -> Any:
+        """Format a pre-filled value like the backend's parsed answers."""
+        return value
+
+    def get_entity_groups(self) -> Dict[str, List[str]]:
+        """Get the entity groups asked for together by extract_by_entity_group."""
+        return self.entity_guidelines.get_entity_groups()
+
+    def get_group_keywords(self) -> Dict[str, Optional[List[str]]]:
+        """
+        Get the keywords that pick each entity group's relevant sentences.
+
+        Groups left out are scored on the words of their questions; a group
+        mapped to None always gets the full report.
+        """
+        return {}
+
+    def decompose_reports(
+        self,
+        reports: List[Dict[str, Any]],
+        include_guidelines: bool = True,
+    ) -> List[Tuple[int, List[str], str, str]]:
+        """
+        Split each report's extraction into one short prompt per entity group.
+
+        Returns:
+            List of (report position, entity codes, task prompt, user prompt)
+        """
+        e2i_map = self.entity_guidelines.entity_to_info_map
+        entity_list = self.get_entity_list()
+        group_keywords = self.get_group_keywords()
+        groups = []
+        for name, entity_codes in self.get_entity_groups().items():
+            keywords = group_keywords.get(
+                name, question_keywords(e2i_map[code][0] for code in entity_codes)
+            )
+            task_prompt = self.create_repair_prompt(entity_codes, include_guidelines)
+            groups.append((entity_codes, keywords, task_prompt))
+
+        tasks = []
+        for i, report in enumerate(reports):
+            text_fields = [
+                field
+                for field, value in report.items()
+                if field not in entity_list and isinstance(value, str)
+            ]
+            for entity_codes, keywords, task_prompt in groups:
+                focused = focus_report(report, keywords, text_fields)
+                tasks.append(
+                    (i, entity_codes, task_prompt, self.get_report_prompt(focused))
+                )
+        return tasks
     
     def evaluate(
         self,
@@ -87,7 +401,9 @@ class QABase(ABC):
         ):
             if i == n_prototypes:
                 break
-            report_scores = evaluate_report(e2i_map, anno, pred)
+            report_scores = evaluate_report(
+                e2i_map, anno, pred, cache=self.cache, provider=self.judge_provider
+            )
             all_scores.append(report_scores)
         
         # Calculate scores
@@ -143,6 +459,87 @@ class QABase(ABC):
             print(f"{entity:30} {score_str:15} {entity_type:15}")
         
         return results
+
+    def summarise_call_stats(self) -> Dict[str, Any]:
+        """
+        Summarise generation stats of the LLM calls made so far.
+
+        Prompt and generation speeds come from the calls whose backend times
+        the two separately (Ollama); llama.cpp only reports token usage.
+
+        Returns:
+            Dictionary with the number of calls, output tokens generated, how
+            many calls stopped at their output budget, call time percentiles,
+            prompt/generation tokens per second, model load time and, with
+            speculative decoding, the draft acceptance rate
+        """
+        if not self.call_stats:
+            return {"n_calls": 0}
+        completion_tokens = [
+            stats["completion_tokens"] or 0 for stats in self.call_stats
+        ]
+        seconds = [stats["seconds"] or 0 for stats in self.call_stats]
+        timed = [stats for stats in self.call_stats if stats.get("prompt_eval_seconds")]
+        prompt_seconds = sum(stats["prompt_eval_seconds"] for stats in timed)
+        eval_seconds = sum(stats.get("eval_seconds") or 0 for stats in timed)
+        return {
+            "n_calls": len(self.call_stats),
+            "max_output_tokens": self.max_output_tokens,
+            "completion_tokens_total": sum(completion_tokens),
+            "completion_tokens_mean": round(
+                sum(completion_tokens) / len(completion_tokens), 1
+            ),
+            "completion_tokens_max": max(completion_tokens),
+            "n_hit_budget": sum(stats["hit_budget"] for stats in self.call_stats),
+            "generation_seconds_total": round(sum(seconds), 2),
+            "generation_seconds_max": round(max(seconds), 2),
+            "seconds_p50": percentile(seconds, 50),
+            "seconds_p90": percentile(seconds, 90),
+            "seconds_p99": percentile(seconds, 99),
+            "prompt_tokens_total": sum(
+                stats["prompt_tokens"] or 0 for stats in self.call_stats
+            ),
+            "prompt_tokens_per_second": round(
+                sum(stats["prompt_tokens"] or 0 for stats in timed) / prompt_seconds, 1
+            )
+            if prompt_seconds
+            else None,
+            "generation_tokens_per_second": round(
+                sum(stats["completion_tokens"] or 0 for stats in timed)
+                / eval_seconds,
+                1,
+            )
+            if eval_seconds
+            else None,
+            "completion_tokens_per_second": round(
+                sum(completion_tokens) / sum(seconds), 1
+            )
+            if sum(seconds)
+            else None,
+            "load_seconds_total": round(
+                sum(stats.get("load_seconds") or 0 for stats in self.call_stats), 2
+            ),
+            # Warm models still report a few ms of load time
+            "n_calls_with_load": sum(
+                (stats.get("load_seconds") or 0) > 0.1 for stats in self.call_stats
+            ),
+            **self._summarise_draft_stats(),
+        }
+
+    def _summarise_draft_stats(self) -> Dict[str, Any]:
+        """Summarise speculative decoding drafts, if any calls used them."""
+        drafted = [stats for stats in self.call_stats if "draft_proposed" in stats]
+        if not drafted:
+            return {}
+        proposed = sum(stats["draft_proposed"] for stats in drafted)
+        accepted = sum(stats["draft_accepted"] for stats in drafted)
+        return {
+            "draft_proposed_total": proposed,
+            "draft_accepted_total": accepted,
+            "draft_acceptance_rate": (
+                round(accepted / proposed, 3) if proposed else None
+            ),
+        }
     
     def get_entity_list(self) -> List[str]:
         """Get list of entity codes."""
@@ -154,42 +551,29 @@ class QABase(ABC):
             self.entity_guidelines.prompt_df['Combined Prompt Question'].dropna()
         )
     
-    def get_output_template_string(self) -> str:
-        """Get JSON template string."""
+    def get_output_template_string(
+        self, entity_codes: Optional[List[str]] = None
+    ) -> str:
+        """Get JSON template string, optionally for a subset of entities."""
+        e2i_map = self.entity_guidelines.entity_to_info_map
         template = "{"
-        for entity, (_, entity_type, _) in self.entity_guidelines.entity_to_info_map.items():
-            template += f' "{entity}": "{entity_type}",'
+        for entity in entity_codes or e2i_map:
+            template += f' "{entity}": "{e2i_map[entity][1]}",'
         return template.rstrip(",") + "}"
     
     def get_entity_guidelines_string(self) -> str:
         """Get formatted guidelines string."""
         df = self.entity_guidelines.prompt_df
         
-        # Group entities by their guidelines
-        grouped_entities = {}
-        current_codes = []
-        current_guideline = None
-        
-        for _, row in df.iterrows():
-            guideline = row['Combined Guidelines']
-            code = row['Entity Code']
-            
-            # If we find a new non-null guideline, start a new group
-            if not pd.isna(guideline):
-                if current_guideline is not None:
-                    # Store the previous group
-                    grouped_entities[current_guideline] = current_codes
-                # Start new group
-                current_codes = [code]
-                current_guideline = guideline
-            else:
-                # Add to current group if we have one
-                if current_guideline is not None:
-                    current_codes.append(code)
-        
-        # Add the last group if exists
-        if current_guideline is not None and current_codes:
-            grouped_entities[current_guideline] = current_codes
+        # Group entities by their guidelines: each non-null guideline starts a
+        # group that the following rows with a null guideline belong to
+        group_ids = df['Combined Guidelines'].notna().cumsum()
+        in_group = group_ids > 0
+        groups = df[in_group].groupby(group_ids[in_group], sort=False).agg(
+            guideline=('Combined Guidelines', 'first'),
+            codes=('Entity Code', list),
+        )
+        grouped_entities = dict(zip(groups['guideline'], groups['codes']))
             
         # Format the output
         guidelines = []
@@ -199,8 +583,42 @@ class QABase(ABC):
             
         return "\n".join(guidelines)
     
+    def get_report_prompt(self, report: Dict[str, Any]) -> str:
+        """Get the prompt section for a single real report."""
+        return self.finalise_prompt(f"""
+            --- REAL REPORT ---
+            {self.get_report_string(report)}
+            """)
+
+    def get_packed_reports_prompt(
+        self, reports: List[Tuple[int, Dict[str, Any]]]
+    ) -> str:
+        """Get the prompt section for several real reports answered in one call."""
+        report_blocks = "\n".join(
+            f"--- REAL REPORT {report_id} ---\n{self.get_report_string(report)}"
+            for report_id, report in reports
+        )
+        return self.finalise_prompt(f"""
+            --- REAL REPORTS ---
+            There are {len(reports)} real reports below. Answer the questions for
+            each report separately. Return a JSON array of exactly {len(reports)}
+            objects in the same order as the reports. Each object must contain
+            "report_id" (the number of its report) and every template key.
+            {report_blocks}
+            """)
+
+    @staticmethod
+    def split_into_packs(
+        reports: List[Dict[str, Any]], pack_size: int
+    ) -> List[List[Tuple[int, Dict[str, Any]]]]:
+        """Split reports into packs of (report_id, report), IDs being positions."""
+        if pack_size < 1:
+            raise ValueError("pack_size must be at least 1")
+        indexed = list(enumerate(reports))
+        return [indexed[i:i + pack_size] for i in range(0, len(indexed), pack_size)]
+
     @abstractmethod
-    def _get_format_instructions(self) -> str:
+    def _get_format_instructions(self, entity_codes: Optional[List[str]] = None) -> str:
         """Get model-specific format instructions."""
         pass
     
@@ -225,13 +643,233 @@ class QABase(ABC):
         """Extract entities from reports."""
         pass
 
+    def extract_predictions(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        **extraction_kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """Extract entities from reports and return parsed predictions."""
+        return self.extract_with_known_entities(
+            input_json, n_shots, n_prototype, include_guidelines, **extraction_kwargs
+        )
+
 
 class OllamaQA(QABase):
     """QA model using Ollama backend."""
+
+    backend = "ollama"
+
+    def __init__(
+        self,
+        model_path: str,
+        root_dir: str,
+        system_message: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        host: Optional[str] = None,
+        reuse_prefix: bool = False,
+        keep_alive: str = "30m",
+        max_output_tokens: Optional[int] = None,
+        structured_output: bool = False,
+        normalise_prompts: bool = False,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Initialise Ollama QA model.
+
+        Args:
+            model_path: Ollama model name
+            root_dir: Root directory for data modality
+            system_message: Optional system message override
+            cache: Optional response cache consulted before each request
+            host: Ollama host (None uses OLLAMA_HOST or the default)
+            reuse_prefix: Send the static task prompt as a pinned system prompt
+                and keep the model loaded, so the runner's KV cache for that
+                prefix is reused across reports
+            keep_alive: How long Ollama keeps the model loaded when reuse_prefix
+            max_output_tokens: Output token budget per report (default:
+                estimated from the entity types in the guidelines)
+            structured_output: Constrain answers to a JSON schema built from
+                the guidelines via Ollama's `format` parameter
+            normalise_prompts: Strip indentation and redundant whitespace from
+                prompts and compact few-shot JSON
+            options: Further Ollama model options, e.g. num_thread, num_ctx
+                and num_batch (None keeps the model's defaults)
+        """
+        super().__init__(model_path, root_dir, system_message, cache, normalise_prompts)
+        self.host = host
+        self.structured_output = structured_output
+        self.output_schema = self.entity_guidelines.create_output_json_schema()
+        self.reuse_prefix = reuse_prefix
+        self.keep_alive = keep_alive
+        self.max_output_tokens = (
+            max_output_tokens or self.entity_guidelines.estimate_output_tokens()
+        )
+        self.options = {"temperature": 0, **(options or {})}
+        self.n_requeried = 0
     
-    def _get_format_instructions(self) -> str:
-        return f"TEMPLATE: {self.get_output_template_string()}"
+    def _get_format_instructions(self, entity_codes: Optional[List[str]] = None) -> str:
+        return f"TEMPLATE: {self.get_output_template_string(entity_codes)}"
+
+    def build_request(
+        self,
+        task_prompt: str,
+        user_prompt: str,
+        n_reports: int = 1,
+        entity_codes: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build the generate() arguments for a task prompt and its report(s).
+
+        `entity_codes` restricts the output budget and schema to a subset of
+        entities, for a single report.
+        """
+        if self.reuse_prefix:
+            request = {
+                "system": task_prompt,
+                "prompt": user_prompt,
+                "keep_alive": self.keep_alive,
+            }
+        else:
+            request = {"prompt": self.finalise_prompt(f"""
+            {task_prompt}
+            {user_prompt}
+            """)}
+        request["options"] = self.generation_options(n_reports, entity_codes)
+        if self.structured_output:
+            request["format"] = self.get_format_schema(n_reports, entity_codes)
+        return request
+
+    def get_format_schema(
+        self, n_reports: int = 1, entity_codes: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Get the JSON schema for one answer, or an array of `n_reports` answers."""
+        if entity_codes is not None:
+            return self.entity_guidelines.create_output_json_schema(entity_codes)
+        if n_reports == 1:
+            return self.output_schema
+        item_schema = copy.deepcopy(self.output_schema)
+        item_schema["properties"] = {
+            "report_id": {"type": "integer"},
+            **item_schema["properties"],
+        }
+        item_schema["required"] = ["report_id", *item_schema["required"]]
+        return {"type": "array", "items": item_schema}
+
+    def generation_options(
+        self, n_reports: int = 1, entity_codes: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Get Ollama options with an output budget for `n_reports` answers, or
+        for one answer covering only `entity_codes`.
+
+        A single free-text answer is a flat JSON object, so generation also
+        stops at the first closing brace (re-appended by _finish_answer).
+        Schema-constrained answers end when the object closes anyway.
+        """
+        max_tokens = self.max_output_tokens * n_reports
+        if entity_codes is not None:
+            max_tokens = min(
+                max_tokens,
+                self.entity_guidelines.estimate_output_tokens(
+                    entity_codes=entity_codes
+                ),
+            )
+        options = {**self.options, "num_predict": max_tokens}
+        if n_reports == 1 and not self.structured_output:
+            options["stop"] = ["}"]
+        return options
+
+    def _finish_answer(
+        self, response: Dict[str, Any], seconds: float, report_id: Any = None
+    ) -> str:
+        """
+        Record a response's telemetry and restore a stripped stop brace.
+
+        `report_id` is the report (or list of packed reports) the call answered.
+        """
+        answer = response["response"]
+        done_reason = response.get("done_reason")
+        self.call_stats.append(
+            {
+                "report": report_id,
+                "model": self.model_path,
+                "finished_at": round(time.time(), 3),
+                "prompt_tokens": response.get("prompt_eval_count"),
+                "completion_tokens": response.get("eval_count"),
+                "seconds": round(seconds, 3),
+                "prompt_eval_seconds": self._ns_to_seconds(
+                    response.get("prompt_eval_duration")
+                ),
+                "eval_seconds": self._ns_to_seconds(response.get("eval_duration")),
+                "load_seconds": self._ns_to_seconds(response.get("load_duration")) or 0,
+                "total_seconds": self._ns_to_seconds(response.get("total_duration")),
+                "done_reason": done_reason,
+                "hit_budget": done_reason == "length",
+            }
+        )
+        if (
+            done_reason == "stop"
+            and "{" in answer
+            and not answer.rstrip().endswith("}")
+        ):
+            answer = answer.rstrip() + "}"
+        return answer
+
+    @staticmethod
+    def _ns_to_seconds(duration: Optional[int]) -> Optional[float]:
+        """Convert an Ollama duration (nanoseconds) to seconds."""
+        return None if duration is None else round(duration / 1e9, 3)
+
+    def _make_client(self, timeout: Optional[float] = None) -> ollama.Client:
+        return ollama.Client(host=self.host, timeout=timeout)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens in text with the model's tokenizer.
+
+        Ollama has no tokenize endpoint, so the text is run as a raw prompt
+        generating a single token and its prompt_eval_count is read back.
+        """
+        try:
+            response = self._make_client().generate(
+                model=self.model_path,
+                prompt=text,
+                raw=True,
+                # Some runners treat num_predict=0 as no limit, so predict one
+                options={**self.options, "num_predict": 1},
+                keep_alive=self.keep_alive,
+            )
+            return response["prompt_eval_count"]
+        except Exception as e:
+            # Including a missing count, not only connection errors
+            return self.estimate_tokens(text, error=e)
+
+    def _make_async_client(self) -> ollama.AsyncClient:
+        return ollama.AsyncClient(host=self.host)
     
+    def format_prefill_value(self, value: Any) -> Any:
+        """Parsed Ollama answers hold every value as a string."""
+        return str(value)
+
+    def extract_predictions(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        **extraction_kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """Extract entities from reports and parse the raw answers."""
+        answers = self.extract_with_known_entities(
+            input_json, n_shots, n_prototype, include_guidelines, **extraction_kwargs
+        )
+        return self.convert_generated_answers_to_json(
+            generated_answers=answers, input_json=input_json, n_prototype=len(answers)
+        )
+
     def convert_generated_answers_to_json(
         self,
         generated_answers: List[str],
@@ -240,47 +878,448 @@ class OllamaQA(QABase):
     ) -> List[Dict[str, Any]]:
         """Convert generated answers to JSON format."""
         entity_list = self.get_entity_list()
-        return process_llm_batch(
+        predictions, parse_results = process_llm_batch(
             generated_answers,
             input_json,
             entity_list,
             n_prototype,
             use_llama_cpp=False
         )
+        self.record_parse_stats(count_parse_results(parse_results))
+        return predictions
     
     def extract_with_known_entities(
         self,
         input_json: List[Dict[str, Any]],
         n_shots: int = 0,
         n_prototype: int = 2,
-        include_guidelines: bool = True
+        include_guidelines: bool = True,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+        checkpoint: Optional[RunCheckpoint] = None,
     ) -> List[str]:
-        """Extract entities using Ollama."""
-        task_prompt = self.create_task_prompt(n_shots, include_guidelines)
+        """
+        Extract entities using Ollama.
+
+        With concurrency > 1, requests are sent through an async client with at
+        most `concurrency` in flight, so a server running several parallel
+        slots (OLLAMA_NUM_PARALLEL) is kept busy. Answers are returned in input
+        order either way; a request that exceeds `timeout` seconds yields "".
+
+        With a checkpoint, reports already in it are skipped and each new
+        answer is appended to it as soon as it arrives.
+        """
+        prompt = self.compile_prompt(n_shots, include_guidelines)
+        reports = input_json[:n_prototype]
+        completed = checkpoint.load() if checkpoint is not None else {}
+        pending = [i for i in range(len(reports)) if i not in completed]
+        if completed:
+            print(f"Skipping {len(reports) - len(pending)} reports already completed")
+
+        answers = [
+            completed[i]["raw_response"] if i in completed else ""
+            for i in range(len(reports))
+        ]
+        entity_list = self.get_entity_list()
+
+        def record(position: int, answer: str) -> None:
+            i = pending[position]
+            answers[i] = answer
+            if checkpoint is not None:
+                prediction, _ = process_llm_response(answer, reports[i], entity_list)
+                checkpoint.append(i, answer, prediction)
+
+        requests, cache_keys = self._build_prompt_requests(
+            prompt, [self.get_report_prompt(reports[i]) for i in pending]
+        )
+        self._generate_all(
+            requests,
+            concurrency,
+            timeout,
+            on_answer=record,
+            cache_keys=cache_keys,
+            report_ids=pending,
+        )
+        return answers
+
+    def extract_packed(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        pack_size: int = 4,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        """
+        Extract entities with `pack_size` reports answered per call.
+
+        Each packed response is split back into one JSON answer per report.
+        Reports whose answer is missing or malformed are re-queried one at a
+        time, so the returned list lines up with extract_with_known_entities.
+        """
+        prompt = self.compile_prompt(n_shots, include_guidelines)
+        reports = input_json[:n_prototype]
+        packs = self.split_into_packs(reports, pack_size)
+        requests, cache_keys = self._build_prompt_requests(
+            prompt,
+            [self.get_packed_reports_prompt(pack) for pack in packs],
+            [len(pack) for pack in packs],
+        )
+        responses = self._generate_all(
+            requests,
+            concurrency,
+            timeout,
+            cache_keys=cache_keys,
+            report_ids=[[report_id for report_id, _ in pack] for pack in packs],
+        )
+
+        entity_list = self.get_entity_list()
+        answers = [""] * len(reports)
+        missing = []
+        for pack, response in zip(packs, responses):
+            packed_answers, pack_missing = split_packed_llm_response(
+                response, [report_id for report_id, _ in pack], entity_list
+            )
+            for report_id, answer in packed_answers.items():
+                answers[report_id] = json.dumps(answer)
+            missing.extend(pack_missing)
+
+        self.n_requeried = len(missing)
+        if missing:
+            print(f"Re-querying {len(missing)} reports missing from packed answers")
+            requests, cache_keys = self._build_prompt_requests(
+                prompt,
+                [self.get_report_prompt(reports[report_id]) for report_id in missing],
+            )
+            requeried = self._generate_all(
+                requests,
+                concurrency,
+                timeout,
+                cache_keys=cache_keys,
+                report_ids=missing,
+            )
+            for report_id, answer in zip(missing, requeried):
+                answers[report_id] = answer
+
+        return answers
+
+    def repair_predictions(
+        self,
+        predictions: List[Dict[str, Any]],
+        include_guidelines: bool = True,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Re-query only the entities that are missing from each prediction.
+
+        Each report with missing entities gets one short prompt asking for
+        just those codes, and the answers are merged into its prediction.
+        """
+        missing = self.find_missing_entities(predictions)
+        repaired = copy.deepcopy(predictions)
+        if missing:
+            positions = list(missing)
+            answers = self._generate_all(
+                [
+                    self.build_request(
+                        self.create_repair_prompt(missing[i], include_guidelines),
+                        self.get_report_prompt(predictions[i]),
+                        entity_codes=missing[i],
+                    )
+                    for i in positions
+                ],
+                concurrency,
+                timeout,
+                report_ids=positions,
+            )
+            parse_results = []
+            for i, answer in zip(positions, answers):
+                repaired[i], result = process_llm_response(
+                    answer, predictions[i], missing[i]
+                )
+                parse_results.append(result)
+            self.record_parse_stats(count_parse_results(parse_results))
+        self._record_repair_stats(missing, repaired)
+        return repaired
+
+    def extract_by_entity_group(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract entities with one focused prompt per entity group and report.
+
+        Group prompts of all reports share the `concurrency` Ollama slots, and
+        each report's group answers are merged into one prediction.
+        """
+        reports = input_json[:n_prototype]
+        tasks = self.decompose_reports(reports, include_guidelines)
+        answers = self._generate_all(
+            [
+                self.build_request(task_prompt, user_prompt, entity_codes=entity_codes)
+                for _, entity_codes, task_prompt, user_prompt in tasks
+            ],
+            concurrency,
+            timeout,
+            report_ids=[i for i, _, _, _ in tasks],
+        )
+        predictions = copy.deepcopy(reports)
+        parse_results = []
+        for (i, entity_codes, _, _), answer in zip(tasks, answers):
+            predictions[i], result = process_llm_response(
+                answer, predictions[i], entity_codes
+            )
+            parse_results.append(result)
+        self.record_parse_stats(count_parse_results(parse_results))
+        return predictions
+
+    def _build_prompt_requests(
+        self,
+        prompt: PromptArtifact,
+        user_prompts: List[str],
+        n_reports: Optional[List[int]] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Build requests for a compiled task prompt and their response cache keys.
+
+        The keys use the prompt's fingerprint in place of its text.
+        """
+        n_reports = n_reports or [1] * len(user_prompts)
+        requests, cache_keys = [], []
+        for user_prompt, n in zip(user_prompts, n_reports):
+            request = self.build_request(prompt.task_prompt, user_prompt, n)
+            requests.append(request)
+            cache_keys.append(
+                ResponseCache.make_key(
+                    self.model_path,
+                    {
+                        "prompt": prompt.fingerprint,
+                        "report": user_prompt,
+                        "reuse_prefix": self.reuse_prefix,
+                        "format": request.get("format"),
+                    },
+                    self.cache_key_options(request["options"]),
+                )
+            )
+        return requests, cache_keys
+
+    def _generate_all(
+        self,
+        requests: List[Dict[str, Any]],
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+        on_answer: Optional[Callable[[int, str], None]] = None,
+        cache_keys: Optional[List[str]] = None,
+        report_ids: Optional[List[Any]] = None,
+    ) -> List[str]:
+        """
+        Generate answers for all requests, in order.
+
+        Cached answers are served without calling Ollama. `on_answer(position,
+        answer)` is called as each request completes successfully, in
+        completion order. `cache_keys` overrides the keys derived from the
+        request text. `report_ids` labels each request's telemetry with the
+        report(s) it answers (default: its position).
+        """
+        answers = [""] * len(requests)
+        keys = cache_keys or [self._cache_key(request) for request in requests]
+        pending = []
+        for position, key in enumerate(keys):
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is None:
+                pending.append(position)
+                continue
+            answers[position] = cached
+            if on_answer is not None:
+                on_answer(position, cached)
+
+        def record(pending_position: int, answer: str) -> None:
+            position = pending[pending_position]
+            if self.cache is not None:
+                self.cache.set(keys[position], answer)
+            if on_answer is not None:
+                on_answer(position, answer)
+
+        pending_requests = [requests[position] for position in pending]
+        pending_ids = [
+            position if report_ids is None else report_ids[position]
+            for position in pending
+        ]
+        if concurrency > 1:
+            generated = asyncio.run(
+                self._agenerate_all(
+                    pending_requests, concurrency, timeout, record, pending_ids
+                )
+            )
+        else:
+            generated = self._generate_serial(
+                pending_requests, timeout, record, pending_ids
+            )
+
+        for position, answer in zip(pending, generated):
+            answers[position] = answer
+        return answers
+
+    def _cache_key(self, request: Dict[str, Any]) -> str:
+        """Get the response cache key for a generate() request."""
+        prompt = {
+            k: v for k, v in request.items() if k not in ("keep_alive", "options")
+        }
+        return ResponseCache.make_key(
+            self.model_path, prompt, self.cache_key_options(request["options"])
+        )
+
+    def cache_key_options(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the generation options a response cache key is built from."""
+        return options
+
+    def _generate_serial(
+        self,
+        requests: List[Dict[str, Any]],
+        timeout: Optional[float] = None,
+        on_answer: Optional[Callable[[int, str], None]] = None,
+        report_ids: Optional[List[Any]] = None,
+    ) -> List[str]:
+        """
+        Generate answers one request at a time.
+
+        A request that times out or fails (e.g. ollama.ResponseError or a
+        dropped connection) gets an empty answer and the rest still run.
+        """
+        client = self._make_client(timeout)
         answers = []
         
-        for report in tqdm(input_json[:n_prototype],
-                          desc="Processing reports",
-                          ncols=100):
-            prompt = f"""
-            {task_prompt}
-            --- REAL REPORT ---
-            {self.get_report_string(report)}
-            """
-            response = ollama.generate(
-                model=self.model_path,
-                prompt=prompt,
-                options={'temperature': 0}
-            )
-            answers.append(response['response'])
+        for position, request in enumerate(tqdm(requests,
+                                                desc="Processing reports",
+                                                ncols=100)):
+            report_id = position if report_ids is None else report_ids[position]
+            try:
+                start_time = time.perf_counter()
+                response = client.generate(model=self.model_path, **request)
+                answer = self._finish_answer(
+                    response, time.perf_counter() - start_time, report_id
+                )
+            except httpx.TimeoutException:
+                print(f"Request timed out after {timeout}s")
+                answers.append("")
+                continue
+            except Exception as e:
+                print(f"Request for report {report_id} failed: {e!r}")
+                answers.append("")
+                continue
+            answers.append(answer)
+            if on_answer is not None:
+                on_answer(position, answer)
         
         return answers
 
+    async def _agenerate_all(
+        self,
+        requests: List[Dict[str, Any]],
+        concurrency: int,
+        timeout: Optional[float],
+        on_answer: Optional[Callable[[int, str], None]] = None,
+        report_ids: Optional[List[Any]] = None,
+    ) -> List[str]:
+        """Generate answers for all requests with bounded concurrency."""
+        client = self._make_async_client()
+
+        async def generate(position: int, request: Dict[str, Any]) -> str:
+            start_time = time.perf_counter()
+            response = await client.generate(model=self.model_path, **request)
+            answer = self._finish_answer(
+                response,
+                time.perf_counter() - start_time,
+                position if report_ids is None else report_ids[position],
+            )
+            if on_answer is not None:
+                on_answer(position, answer)
+            return answer
+
+        return await gather_bounded(
+            [partial(generate, i, request) for i, request in enumerate(requests)],
+            concurrency=concurrency,
+            timeout=timeout,
+            default="",
+        )
+
 
 class LlamaCppQA(QABase):
     """QA model using llama.cpp backend."""
+
+    backend = "llamacpp"
+
+    def __init__(
+        self,
+        model_path: str,
+        root_dir: str,
+        system_message: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        n_ctx: Union[int, str] = "auto",
+        n_threads: Optional[int] = None,
+        reuse_prefix: bool = False,
+        use_mmap: bool = True,
+        max_output_tokens: Optional[int] = None,
+        normalise_prompts: bool = False,
+        speculative: Optional[str] = None,
+        num_draft_tokens: int = 10,
+        n_batch: Optional[int] = None,
+    ):
+        """
+        Initialise llama.cpp QA model; weights are loaded lazily via the pool.
+
+        Args:
+            model_path: Path to the GGUF file
+            root_dir: Root directory for data modality
+            system_message: Optional system message override
+            cache: Optional response cache consulted before each completion
+            n_ctx: Context size, or "auto" to run with the smallest bucket in
+                CONTEXT_BUCKETS that fits the largest prompt
+            n_threads: Number of CPU threads (None uses llama.cpp's default)
+            reuse_prefix: Evaluate the static task prompt once and restore the
+                saved KV state for each report instead of re-evaluating it
+            use_mmap: Memory-map the GGUF so processes share its weights
+            max_output_tokens: Output token budget per report, also reserved
+                when checking that a prompt fits its context (default:
+                estimated from the entity types in the guidelines)
+            normalise_prompts: Strip indentation and redundant whitespace from
+                prompts and compact few-shot JSON
+            speculative: Speculative decoding draft: "prompt_lookup" to draft
+                tokens copied from the prompt, or the path to a small draft
+                GGUF sharing the model's vocabulary (None disables it)
+            num_draft_tokens: Number of tokens drafted per verification step
+            n_batch: Prompt tokens evaluated per batch (None uses llama.cpp's
+                default)
+        """
+        super().__init__(model_path, root_dir, system_message, cache, normalise_prompts)
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.reuse_prefix = reuse_prefix
+        self.use_mmap = use_mmap
+        self.max_output_tokens = (
+            max_output_tokens or self.entity_guidelines.estimate_output_tokens()
+        )
+        self.chat_format = "chatml"
+        self.speculative = speculative
+        self.num_draft_tokens = num_draft_tokens
+        self.n_batch = n_batch
+        self.n_requeried = 0
+        self.token_counts: Dict[int, Dict[str, Any]] = {}
+        self._prefix_states: Dict[Tuple[Any, ...], LlamaState] = {}
+        self._context_planner = ContextPlanner(
+            model_path,
+            buckets=CONTEXT_BUCKETS if n_ctx == "auto" else (n_ctx,),
+            max_output_tokens=self.max_output_tokens,
+        )
     
-    def _get_format_instructions(self) -> str:
+    def _get_format_instructions(self, entity_codes: Optional[List[str]] = None) -> str:
         """No template needed as using JSON schema."""
         return ""
     
@@ -289,50 +1328,805 @@ class LlamaCppQA(QABase):
         input_json: List[Dict[str, Any]],
         n_shots: int = 0,
         n_prototype: int = 2,
-        include_guidelines: bool = True
+        include_guidelines: bool = True,
+        checkpoint: Optional[RunCheckpoint] = None,
     ) -> List[Dict[str, Any]]:
-        """Extract entities using llama.cpp."""
-        task_prompt = self.create_task_prompt(n_shots, include_guidelines)
+        """
+        Extract entities using llama.cpp.
+
+        With a checkpoint, reports already in it are skipped and each new
+        prediction is appended to it as soon as it is produced.
+        """
+        prompt = self.compile_prompt(n_shots, include_guidelines)
         schema = self.get_schema()
-        answers = []
-        
-        for i, report in enumerate(input_json):
-            if i == n_prototype:
-                break
-                
-            messages = [
-                {"role": "assistant", "content": task_prompt},
-                {"role": "user", "content": f"""
-                --- REAL REPORT ---
-                {self.get_report_string(report)}
-                """},
-            ]
-            
-            llm = Llama(
-                model_path=self.model_path,
-                chat_format="chatml",
-                verbose=False,
-                n_ctx=3000,
-            )
-            
-            answer = llm.create_chat_completion(
-                messages=messages,
-                response_format=schema,
-                max_tokens=None,
-                temperature=0,
+        completed = checkpoint.load() if checkpoint is not None else {}
+        if completed:
+            print(f"Skipping {len(completed)} reports already completed")
+        reports = input_json[:n_prototype]
+        predictions = []
+
+        # Plan every prompt first so the model is loaded once, at the context
+        # size of the largest
+        planned = {}
+        for i, report in enumerate(reports):
+            if i not in completed:
+                messages = self.build_messages(
+                    prompt.task_prompt, self.get_report_prompt(report)
+                )
+                planned[i] = (messages, self.plan_context(i, messages))
+
+        for i, report in enumerate(reports):
+            if i in completed:
+                predictions.append(completed[i]["prediction"])
+                continue
+            messages, n_ctx = planned[i]
+            if n_ctx is None:
+                predictions.append(self.overflow_prediction(report))
+                continue
+
+            answer, prediction = self.extract_report(
+                messages,
+                schema,
+                report,
+                prompt.fingerprint,
+                self.context_size,
+                report_id=i,
             )
-            answers.append(answer)
+            predictions.append(prediction)
+            if checkpoint is not None:
+                checkpoint.append(i, answer, prediction)
         
+        return predictions
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens in text with the model's own tokenizer."""
+        return self._context_planner.count_text_tokens(text)
+
+    @property
+    def context_size(self) -> Optional[int]:
+        """Context size shared by the prompts planned so far."""
+        return self._context_planner.n_ctx
+
+    def pick_n_ctx(
+        self, n_prompt_tokens: int, n_output_tokens: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Pick the context size for a prompt, or None if it cannot fit.
+
+        When a prompt grows the run's context size, idle pooled instances at
+        the old size are dropped, so only one copy of the GGUF stays loaded.
+        """
+        previous = self._context_planner.n_ctx
+        n_ctx = self._context_planner.pick_n_ctx(n_prompt_tokens, n_output_tokens)
+        if previous is not None and n_ctx is not None and n_ctx != previous:
+            get_model_pool().discard(self.model_path, keep_n_ctx=n_ctx)
+        return n_ctx
+
+    def plan_context(self, index: int, messages: List[Dict[str, str]]) -> Optional[int]:
+        """
+        Pick the context size for a report's prompt and record its token count.
+
+        Returns:
+            Context size, or None if the prompt plus answer cannot fit
+        """
+        n_tokens = self._context_planner.count_tokens(messages)
+        n_ctx = self.pick_n_ctx(n_tokens)
+        self.token_counts[index] = {
+            "prompt_tokens": n_tokens,
+            "n_ctx": n_ctx,
+            "estimated": self.tokens_estimated,
+        }
+        if n_ctx is None:
+            print(
+                f"Report {index} needs {n_tokens} prompt tokens plus "
+                f"{self.max_output_tokens} for the answer, which exceeds n_ctx="
+                f"{self._context_planner.buckets[-1]}; skipping it"
+            )
+        return n_ctx
+
+    @staticmethod
+    def overflow_prediction(report: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the empty prediction for a report whose prompt does not fit."""
+        return {**copy.deepcopy(report), "context_overflow": True}
+
+    def extract_report(
+        self,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        report: Dict[str, Any],
+        prefix_key: str,
+        n_ctx: int,
+        report_id: Any = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Extract entities from one report, returning (raw answer, prediction).
+
+        `prefix_key` is the fingerprint of the task prompt in messages[0].
+        """
+        answer = self._create_chat_completion(
+            messages, schema, prefix_key, n_ctx, report_id=report_id
+        )
+        prediction = self.parse_completion(answer, report, self.get_entity_list())
+        return answer, prediction
+
+    def parse_completion(
+        self,
+        answer: Dict[str, Any],
+        template: Dict[str, Any],
+        entity_codes: List[str],
+    ) -> Dict[str, Any]:
+        """Fill a prediction from a chat completion, recording how it parsed."""
+        predictions, parse_results = process_llm_batch(
+            [answer], [template], entity_codes, 1, use_llama_cpp=True
+        )
+        self.record_parse_stats(count_parse_results(parse_results))
+        return predictions[0]
+
+    def extract_sharded(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        n_workers: int = 2,
+        n_threads: Optional[int] = None,
+        checkpoint: Optional[RunCheckpoint] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract entities across a pool of worker processes.
+
+        Each worker owns one memory-mapped model instance with `n_threads`
+        threads (default: CPU count split evenly across workers), so the
+        weights are shared through the page cache while the per-worker KV
+        caches are separate. Predictions are returned in input order.
+        """
+        return run_sharded_extraction(
+            self,
+            input_json[:n_prototype],
+            n_shots=n_shots,
+            include_guidelines=include_guidelines,
+            n_workers=n_workers,
+            n_threads=n_threads or max(1, (os.cpu_count() or 1) // n_workers),
+            checkpoint=checkpoint,
+        )
+
+    def worker_kwargs(self, n_threads: Optional[int]) -> Dict[str, Any]:
+        """Get constructor arguments for a copy of this model in a worker process."""
+        return {
+            "model_path": self.model_path,
+            "root_dir": self.root_dir,
+            "system_message": self.system_message,
+            "n_ctx": self.n_ctx,
+            "n_threads": n_threads,
+            "reuse_prefix": self.reuse_prefix,
+            "use_mmap": self.use_mmap,
+            "max_output_tokens": self.max_output_tokens,
+            "normalise_prompts": self.normalise_prompts,
+            "speculative": self.speculative,
+            "num_draft_tokens": self.num_draft_tokens,
+            "n_batch": self.n_batch,
+        }
+
+    def extract_packed(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        pack_size: int = 4,
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract entities with `pack_size` reports answered per call.
+
+        The packed response is constrained to a JSON array of answers and
+        split back into one prediction per report. Reports whose answer is
+        missing or malformed are re-queried one at a time.
+        """
+        prompt = self.compile_prompt(n_shots, include_guidelines)
+        task_prompt = prompt.task_prompt
+        schema = self.get_packed_schema()
+        reports = input_json[:n_prototype]
         entity_list = self.get_entity_list()
-        return process_llm_batch(
-            answers,
-            input_json,
-            entity_list,
-            n_prototype,
-            use_llama_cpp=True
+        predictions = copy.deepcopy(reports)
+        missing = []
+
+        for pack in tqdm(self.split_into_packs(reports, pack_size),
+                         desc="Processing report packs",
+                         ncols=100):
+            messages = self.build_messages(
+                task_prompt, self.get_packed_reports_prompt(pack)
+            )
+            n_ctx = self.pick_n_ctx(
+                self._context_planner.count_tokens(messages),
+                self.max_output_tokens * len(pack),
+            )
+            if n_ctx is None:
+                missing.extend(report_id for report_id, _ in pack)
+                continue
+            answer = self._create_chat_completion(
+                messages,
+                schema,
+                prompt.fingerprint,
+                n_ctx,
+                len(pack),
+                report_id=[report_id for report_id, _ in pack],
+            )
+            packed_answers, pack_missing = split_packed_llm_response(
+                answer["choices"][0]["message"]["content"],
+                [report_id for report_id, _ in pack],
+                entity_list,
+            )
+            for report_id, values in packed_answers.items():
+                predictions[report_id].update(values)
+            missing.extend(pack_missing)
+
+        self.n_requeried = len(missing)
+        if missing:
+            print(f"Re-querying {len(missing)} reports missing from packed answers")
+            single_schema = self.get_schema()
+            for report_id in missing:
+                report = reports[report_id]
+                messages = self.build_messages(
+                    task_prompt, self.get_report_prompt(report)
+                )
+                n_ctx = self.plan_context(report_id, messages)
+                if n_ctx is None:
+                    predictions[report_id] = self.overflow_prediction(report)
+                    continue
+                _, predictions[report_id] = self.extract_report(
+                    messages,
+                    single_schema,
+                    report,
+                    prompt.fingerprint,
+                    n_ctx,
+                    report_id=report_id,
+                )
+
+        return predictions
+
+    def repair_predictions(
+        self,
+        predictions: List[Dict[str, Any]],
+        include_guidelines: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Re-query only the entities that are missing from each prediction.
+
+        Each report with missing entities gets one short prompt, constrained
+        to a schema of just those codes, and the answer is merged into its
+        prediction.
+        """
+        missing = self.find_missing_entities(predictions)
+        repaired = copy.deepcopy(predictions)
+        for i, entity_codes in tqdm(missing.items(),
+                                    desc="Repairing missing entities",
+                                    ncols=100):
+            repair_prompt = self.create_repair_prompt(entity_codes, include_guidelines)
+            messages = self.build_messages(
+                repair_prompt, self.get_report_prompt(predictions[i])
+            )
+            n_ctx = self.pick_n_ctx(self._context_planner.count_tokens(messages))
+            if n_ctx is None:
+                continue
+            answer = self._create_chat_completion(
+                messages,
+                self.get_subset_schema(entity_codes),
+                fingerprint(repair_prompt),
+                n_ctx,
+                report_id=i,
+            )
+            repaired[i] = self.parse_completion(answer, predictions[i], entity_codes)
+        self._record_repair_stats(missing, repaired)
+        return repaired
+
+    def extract_by_entity_group(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract entities with one focused prompt per entity group and report.
+
+        Group prompts run one after another on the pooled model, each with a
+        schema of just its entities, and are merged into one prediction.
+        """
+        reports = input_json[:n_prototype]
+        predictions = copy.deepcopy(reports)
+        for i, entity_codes, task_prompt, user_prompt in tqdm(
+            self.decompose_reports(reports, include_guidelines),
+            desc="Processing entity groups",
+            ncols=100,
+        ):
+            messages = self.build_messages(task_prompt, user_prompt)
+            n_ctx = self.pick_n_ctx(self._context_planner.count_tokens(messages))
+            if n_ctx is None:
+                continue
+            answer = self._create_chat_completion(
+                messages,
+                self.get_subset_schema(entity_codes),
+                fingerprint(task_prompt),
+                n_ctx,
+                report_id=i,
+            )
+            predictions[i] = self.parse_completion(answer, predictions[i], entity_codes)
+        return predictions
+
+    def build_messages(
+        self, task_prompt: str, user_prompt: str
+    ) -> List[Dict[str, str]]:
+        """Build the chat messages for a task prompt and its report(s)."""
+        return [
+            {"role": "assistant", "content": task_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def completion_options(
+        self, response_format: Dict[str, Any], n_reports: int = 1
+    ) -> Dict[str, Any]:
+        """
+        Get the generation options passed to create_chat_completion.
+
+        Output is capped at the budget for `n_reports` answers; the JSON
+        schema grammar already ends generation once the top-level value closes.
+        """
+        return {
+            "response_format": response_format,
+            "max_tokens": self.max_output_tokens * n_reports,
+            "temperature": 0,
+        }
+
+    def completion_cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Dict[str, Any],
+        prefix_key: str,
+        n_reports: int = 1,
+    ) -> str:
+        """
+        Get the response cache key for a chat completion.
+
+        The task prompt in messages[0] is keyed by its fingerprint.
+        """
+        return ResponseCache.make_key(
+            self.model_path,
+            {"prompt": prefix_key, "messages": messages[1:]},
+            self.completion_options(response_format, n_reports),
+        )
+
+    def _create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Dict[str, Any],
+        prefix_key: str,
+        n_ctx: int,
+        n_reports: int = 1,
+        report_id: Any = None,
+    ) -> Dict[str, Any]:
+        """
+        Run one chat completion on a pooled model, or serve it from the cache.
+
+        `report_id` is the report (or list of packed reports) the call answers,
+        recorded in its telemetry.
+        """
+        options = self.completion_options(response_format, n_reports)
+        key = self.completion_cache_key(
+            messages, response_format, prefix_key, n_reports
         )
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        draft_model = self.get_draft_model()
+        llama_kwargs = {} if draft_model is None else {"draft_model": draft_model}
+        if self.n_batch is not None:
+            llama_kwargs["n_batch"] = self.n_batch
+        draft_before = draft_model.snapshot() if draft_model is not None else None
+
+        # Checking the model out of the pool loads it on first use
+        acquire_time = time.perf_counter()
+        with get_model_pool().acquire(
+            self.model_path,
+            n_ctx=n_ctx,
+            chat_format=self.chat_format,
+            n_threads=self.n_threads,
+            use_mmap=self.use_mmap,
+            **llama_kwargs,
+        ) as llm:
+            load_seconds = time.perf_counter() - acquire_time
+            if self.reuse_prefix:
+                self._restore_prefix_state(llm, messages[0], (n_ctx, prefix_key))
+            start_time = time.perf_counter()
+            answer = llm.create_chat_completion(messages=messages, **options)
+            seconds = time.perf_counter() - start_time
+
+        usage = answer.get("usage", {})
+        finish_reason = answer["choices"][0].get("finish_reason")
+        draft_stats = (
+            draft_model.completion_stats(draft_before, usage.get("completion_tokens"))
+            if draft_model is not None
+            else {}
+        )
+        self.call_stats.append(
+            {
+                "report": report_id,
+                "model": self.model_path,
+                "finished_at": round(time.time(), 3),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "total_tokens": usage.get("total_tokens"),
+                "n_ctx": n_ctx,
+                "seconds": round(seconds, 3),
+                "load_seconds": round(load_seconds, 3),
+                "done_reason": finish_reason,
+                "hit_budget": finish_reason == "length",
+                **draft_stats,
+            }
+        )
+
+        if self.cache is not None:
+            self.cache.set(key, answer)
+        return answer
     
+    def get_draft_model(self) -> Optional[CountingDraftModel]:
+        """Get the speculative decoding draft model, or None if disabled."""
+        if self.speculative is None:
+            return None
+        return get_draft_model(self.speculative, self.num_draft_tokens, self.n_threads)
+
+    def _restore_prefix_state(
+        self,
+        llm: Llama,
+        task_message: Dict[str, str],
+        key: Tuple[Any, ...],
+    ) -> None:
+        """
+        Load the KV state of the evaluated task prompt into `llm`.
+
+        The prefix is evaluated and saved the first time a key is seen. When
+        the chat completion is then created, llama.cpp matches the restored
+        tokens against the full prompt and only evaluates the report tail.
+        """
+        state = self._prefix_states.get(key)
+        if state is not None:
+            llm.load_state(state)
+            return
+
+        # format_chatml ends with the assistant generation prompt, which the
+        # full prompt does not have after the task message, so it is dropped
+        prefix = format_chatml(messages=[task_message]).prompt
+        generation_prompt = "<|im_start|>assistant\n"
+        if prefix.endswith(generation_prompt):
+            prefix = prefix[: -len(generation_prompt)]
+        tokens = llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        llm.reset()
+        llm.eval(tokens)
+        self._prefix_states[key] = llm.save_state()
+
+    def get_subset_schema(self, entity_codes: List[str]) -> Dict[str, Any]:
+        """Get JSON schema restricted to a subset of entities."""
+        schema = copy.deepcopy(self.get_schema())
+        properties = schema["schema"]["properties"]
+        schema["schema"]["properties"] = {
+            code: properties[code] for code in entity_codes
+        }
+        if "required" in schema["schema"]:
+            schema["schema"]["required"] = [
+                code for code in schema["schema"]["required"] if code in entity_codes
+            ]
+        return schema
+
+    def get_packed_schema(self) -> Dict[str, Any]:
+        """Get JSON schema for an array of answers carrying report IDs."""
+        item_schema = copy.deepcopy(self.get_schema()["schema"])
+        item_schema["properties"] = {
+            "report_id": {"type": "integer"},
+            **item_schema["properties"],
+        }
+        return {
+            "type": "json_object",
+            "schema": {"type": "array", "items": item_schema},
+        }
+
     @abstractmethod
     def get_schema(self) -> Dict[str, Any]:
         """Get JSON schema for output formatting."""
-        pass
\ No newline at end of file
+        pass
+
+
+class LlamaServerQA(LlamaCppQA):
+    """
+    QA model using a llama.cpp-compatible HTTP server, e.g. llama-server
+    started with --parallel N slots (llama_cpp.server also works but answers
+    one request at a time).
+
+    Prompts and JSON schemas are LlamaCppQA's. Reports are sent concurrently
+    so the server's continuous batching shares each weight read across the
+    reports decoding in its slots; the server's own prompt cache reuses the
+    shared task prompt.
+    """
+
+    backend = "llamaserver"
+
+    def __init__(
+        self,
+        model_path: str,
+        root_dir: str,
+        system_message: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        base_url: str = "http://127.0.0.1:8080",
+        n_ctx: int = 4096,
+        reuse_prefix: bool = False,
+        max_output_tokens: Optional[int] = None,
+        normalise_prompts: bool = False,
+        api_key: Optional[str] = None,
+    ):
+        """
+        Initialise llama.cpp server QA model.
+
+        Args:
+            model_path: Model name sent to the server
+            root_dir: Root directory for data modality
+            system_message: Optional system message override
+            cache: Optional response cache consulted before each completion
+            base_url: Server URL
+            n_ctx: Context size of one server slot (the server's context
+                divided by its parallel slots); prompts that do not fit are
+                skipped
+            reuse_prefix: Ignored; the server's prompt cache already reuses
+                the task prompt evaluated in each slot
+            max_output_tokens: Output token budget per report (default:
+                estimated from the entity types in the guidelines)
+            normalise_prompts: Strip indentation and redundant whitespace from
+                prompts and compact few-shot JSON
+            api_key: Optional API key the server was started with
+        """
+        super().__init__(
+            model_path,
+            root_dir,
+            system_message,
+            cache,
+            n_ctx=n_ctx,
+            max_output_tokens=max_output_tokens,
+            normalise_prompts=normalise_prompts,
+        )
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client: Optional[httpx.Client] = None
+        # There is no local GGUF to tokenize with, so the server counts tokens
+        self._context_planner = ContextPlanner(
+            model_path,
+            buckets=(n_ctx,),
+            max_output_tokens=self.max_output_tokens,
+            token_counter=self.count_tokens,
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens in text with the server's /tokenize endpoint."""
+        try:
+            response = self._get_client().post(
+                "/tokenize",
+                json={"content": text, "add_special": True, "parse_special": True},
+            )
+            response.raise_for_status()
+            return len(response.json()["tokens"])
+        except Exception as e:
+            # Including a malformed response, not only HTTP errors
+            return self.estimate_tokens(text, error=e)
+
+    def _get_client(self) -> httpx.Client:
+        """Get the synchronous client, creating it on first use."""
+        if self._client is None:
+            self._client = httpx.Client(
+                base_url=self.base_url, headers=self.headers, timeout=None
+            )
+        return self._client
+
+    def get_draft_model(self) -> Optional[CountingDraftModel]:
+        """Speculative decoding is configured on the server, if at all."""
+        return None
+
+    def extract_with_known_entities(
+        self,
+        input_json: List[Dict[str, Any]],
+        n_shots: int = 0,
+        n_prototype: int = 2,
+        include_guidelines: bool = True,
+        checkpoint: Optional[RunCheckpoint] = None,
+        concurrency: int = 1,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract entities with up to `concurrency` reports in flight.
+
+        Set concurrency to the server's number of parallel slots. Reports
+        whose request fails or times out keep an empty prediction.
+        """
+        prompt = self.compile_prompt(n_shots, include_guidelines)
+        reports = input_json[:n_prototype]
+        completed = checkpoint.load() if checkpoint is not None else {}
+        if completed:
+            print(f"Skipping {len(completed)} reports already completed")
+
+        predictions = [
+            completed[i]["prediction"] if i in completed else copy.deepcopy(report)
+            for i, report in enumerate(reports)
+        ]
+        pending = []
+        for i, report in enumerate(reports):
+            if i in completed:
+                continue
+            messages = self.build_messages(
+                prompt.task_prompt, self.get_report_prompt(report)
+            )
+            if self.plan_context(i, messages) is None:
+                predictions[i] = self.overflow_prediction(report)
+                continue
+            pending.append((i, messages))
+
+        if pending:
+            asyncio.run(
+                self._aextract_all(
+                    pending,
+                    reports,
+                    predictions,
+                    prompt.fingerprint,
+                    concurrency,
+                    timeout,
+                    checkpoint,
+                )
+            )
+        return predictions
+
+    async def _aextract_all(
+        self,
+        pending: List[Tuple[int, List[Dict[str, str]]]],
+        reports: List[Dict[str, Any]],
+        predictions: List[Dict[str, Any]],
+        prefix_key: str,
+        concurrency: int,
+        timeout: Optional[float],
+        checkpoint: Optional[RunCheckpoint] = None,
+    ) -> None:
+        """Fill in the predictions of pending (index, messages) reports concurrently."""
+        schema = self.get_schema()
+        entity_list = self.get_entity_list()
+
+        async with httpx.AsyncClient(
+            base_url=self.base_url, headers=self.headers, timeout=None
+        ) as client:
+
+            async def extract(i: int, messages: List[Dict[str, str]]) -> None:
+                try:
+                    answer = await self._acreate_chat_completion(
+                        client, messages, schema, prefix_key, self.n_ctx, report_id=i
+                    )
+                except Exception as e:
+                    # Including malformed responses, not only HTTP errors
+                    print(f"Request for report {i} failed: {e!r}")
+                    return
+                predictions[i] = self.parse_completion(answer, reports[i], entity_list)
+                if checkpoint is not None:
+                    checkpoint.append(i, answer, predictions[i])
+
+            await gather_bounded(
+                [partial(extract, i, messages) for i, messages in pending],
+                concurrency=concurrency,
+                timeout=timeout,
+            )
+
+    def _completion_payload(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Dict[str, Any],
+        n_reports: int = 1,
+    ) -> Dict[str, Any]:
+        """Get the /v1/chat/completions request body."""
+        return {
+            "model": self.model_path,
+            "messages": messages,
+            **self.completion_options(response_format, n_reports),
+        }
+
+    def _create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Dict[str, Any],
+        prefix_key: str,
+        n_ctx: int,
+        n_reports: int = 1,
+        report_id: Any = None,
+    ) -> Dict[str, Any]:
+        """Run one chat completion on the server, or serve it from the cache."""
+        key = self.completion_cache_key(
+            messages, response_format, prefix_key, n_reports
+        )
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        start_time = time.perf_counter()
+        response = self._get_client().post(
+            "/v1/chat/completions",
+            json=self._completion_payload(messages, response_format, n_reports),
+        )
+        response.raise_for_status()
+        answer = response.json()
+        self._record_completion(
+            answer, time.perf_counter() - start_time, n_ctx, report_id
+        )
+
+        if self.cache is not None:
+            self.cache.set(key, answer)
+        return answer
+
+    async def _acreate_chat_completion(
+        self,
+        client: httpx.AsyncClient,
+        messages: List[Dict[str, str]],
+        response_format: Dict[str, Any],
+        prefix_key: str,
+        n_ctx: int,
+        n_reports: int = 1,
+        report_id: Any = None,
+    ) -> Dict[str, Any]:
+        """Async version of _create_chat_completion."""
+        key = self.completion_cache_key(
+            messages, response_format, prefix_key, n_reports
+        )
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        start_time = time.perf_counter()
+        response = await client.post(
+            "/v1/chat/completions",
+            json=self._completion_payload(messages, response_format, n_reports),
+        )
+        response.raise_for_status()
+        answer = response.json()
+        self._record_completion(
+            answer, time.perf_counter() - start_time, n_ctx, report_id
+        )
+
+        if self.cache is not None:
+            self.cache.set(key, answer)
+        return answer
+
+    def _record_completion(
+        self,
+        answer: Dict[str, Any],
+        seconds: float,
+        n_ctx: int,
+        report_id: Any = None,
+    ) -> None:
+        """
+        Record a completion's telemetry; llama-server also reports prompt and
+        generation timings.
+        """
+        usage = answer.get("usage", {})
+        timings = answer.get("timings", {})
+        finish_reason = answer["choices"][0].get("finish_reason")
+        self.call_stats.append(
+            {
+                "report": report_id,
+                "model": self.model_path,
+                "finished_at": round(time.time(), 3),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "total_tokens": usage.get("total_tokens"),
+                "n_ctx": n_ctx,
+                "seconds": round(seconds, 3),
+                "prompt_eval_seconds": round(timings["prompt_ms"] / 1000, 3)
+                if "prompt_ms" in timings
+                else None,
+                "eval_seconds": round(timings["predicted_ms"] / 1000, 3)
+                if "predicted_ms" in timings
+                else None,
+                "done_reason": finish_reason,
+                "hit_budget": finish_reason == "length",
+            }
+        )
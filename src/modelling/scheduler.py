@@ -0,0 +1,183 @@
+"""
+Model-swap-aware scheduling for runs that use several models.
+On a host that cannot hold every model at once, interleaved calls make Ollama
+unload and reload models over and over. The scheduler runs all work for one
+model before moving on, loads and unloads models explicitly, and runs models
+side by side only when they fit in the memory budget together.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import ollama
+
+from src.modelling.llama_pool import get_model_pool
+
+Phase = Tuple[str, Callable[[], Any]]
+
+
+class ModelScheduler:
+    """Runs work grouped per model and logs model load/unload events."""
+
+    def __init__(
+        self,
+        backend: str = "ollama",
+        host: Optional[str] = None,
+        keep_alive: str = "30m",
+        memory_budget_gb: Optional[float] = None,
+    ):
+        """
+        Initialise scheduler.
+
+        Args:
+            backend: Model backend ('ollama', 'llamacpp', or 'fake' and
+                'llamaserver', which have nothing to load)
+            host: Ollama host (None uses OLLAMA_HOST or the default)
+            keep_alive: How long Ollama keeps a model loaded during its phase
+            memory_budget_gb: Memory available for models running side by
+                side (None never runs models concurrently)
+        """
+        self.backend = backend
+        self.host = host
+        self.keep_alive = keep_alive
+        self.memory_budget_gb = memory_budget_gb
+        self.events: List[Dict[str, Any]] = []
+        # llama.cpp pool load time per model when its phase started
+        self._pool_load_seconds: Dict[str, float] = {}
+
+    def run(
+        self,
+        phases: Sequence[Phase],
+        concurrent: bool = False,
+        backend: Optional[str] = None,
+    ) -> List[Any]:
+        """
+        Run each model's work as one uninterrupted phase.
+
+        Args:
+            phases: (model name, work) pairs; work takes no arguments
+            concurrent: Run the phases at the same time if their models fit in
+                the memory budget together, otherwise one after another
+            backend: Backend of these models, if not the scheduler's (e.g. an
+                Ollama judge in a llama.cpp run)
+
+        Returns:
+            Result of each phase's work, in order
+        """
+        backend = backend or self.backend
+        models = list(dict.fromkeys(model for model, _ in phases))
+        if concurrent and self.fits_in_memory(models, backend):
+            for model in models:
+                self.load(model, backend)
+            try:
+                with ThreadPoolExecutor(max_workers=len(phases)) as executor:
+                    futures = [executor.submit(work) for _, work in phases]
+                    results = [future.result() for future in futures]
+            finally:
+                for model in models:
+                    self.unload(model, backend)
+            return results
+
+        if concurrent:
+            print(
+                f"Models {models} do not fit in the memory budget; running them in turn"
+            )
+        results = []
+        for model, work in phases:
+            self.load(model, backend)
+            try:
+                results.append(work())
+            finally:
+                self.unload(model, backend)
+        return results
+
+    def fits_in_memory(self, models: List[str], backend: Optional[str] = None) -> bool:
+        """Check whether the models' total size is within the memory budget."""
+        if self.memory_budget_gb is None or (backend or self.backend) != "ollama":
+            return False
+        sizes = {
+            entry["model"]: entry["size"]
+            for entry in ollama.Client(host=self.host).list()["models"]
+        }
+        missing = [model for model in models if model not in sizes]
+        if missing:
+            print(f"Unknown model size for {missing}; running models in turn")
+            return False
+        return (
+            sum(sizes[model] for model in models) / 1024**3 <= self.memory_budget_gb
+        )
+
+    def load(self, model: str, backend: Optional[str] = None) -> None:
+        """
+        Load a model ahead of its phase.
+
+        llama.cpp models load on first use with the context size the phase's
+        prompts need, so their load is recorded from the pool's load time when the
+        phase ends.
+        """
+        backend = backend or self.backend
+        if backend == "llamacpp":
+            self._pool_load_seconds[model] = get_model_pool().load_seconds(model)
+        if backend != "ollama":
+            return
+        start_time = time.perf_counter()
+        response = ollama.Client(host=self.host).generate(
+            model=model, prompt="", keep_alive=self.keep_alive
+        )
+        self._record(
+            "load",
+            model,
+            time.perf_counter() - start_time,
+            (response.get("load_duration") or 0) / 1e9,
+        )
+
+    def unload(self, model: str, backend: Optional[str] = None) -> None:
+        """Unload a model once its phase is done."""
+        backend = backend or self.backend
+        if backend not in ("ollama", "llamacpp"):
+            return
+        if backend == "llamacpp":
+            started_at = self._pool_load_seconds.pop(model, 0)
+            load_seconds = get_model_pool().load_seconds(model) - started_at
+            if load_seconds > 0:
+                self._record("load", model, load_seconds, load_seconds)
+        start_time = time.perf_counter()
+        if backend == "ollama":
+            ollama.Client(host=self.host).generate(model=model, prompt="", keep_alive=0)
+        else:
+            get_model_pool().clear()
+        self._record("unload", model, time.perf_counter() - start_time)
+
+    def _record(
+        self,
+        event: str,
+        model: str,
+        seconds: float,
+        load_seconds: Optional[float] = None,
+    ) -> None:
+        self.events.append(
+            {
+                "event": event,
+                "model": model,
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "seconds": round(seconds, 3),
+                "load_seconds": None
+                if load_seconds is None
+                else round(load_seconds, 3),
+            }
+        )
+        print(f"{event.capitalize()}ed {model} in {seconds:.1f}s")
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarise load/unload events and time spent loading models."""
+        loads = [event for event in self.events if event["event"] == "load"]
+        return {
+            "n_loads": len(loads),
+            "n_unloads": len(self.events) - len(loads),
+            "load_seconds_total": round(
+                sum(event["load_seconds"] or 0 for event in loads), 2
+            ),
+            "events": self.events,
+        }
@@ -0,0 +1,327 @@
+"""
+Local extraction service.
+Reports posted over HTTP are queued and handed to a warm model in small
+batches, so they can be annotated as they arrive from the lab system instead
+of waiting for a batch run.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Union
+
+from src.modelling.qa_base import QABase
+from src.preprocessing.preprocessor_base import MedicalReportProcessor
+from src.utils.general import percentile
+
+
+class ServiceBusy(Exception):
+    """Raised when the request queue is full."""
+
+
+@dataclass
+class _Job:
+    """One queued report and, once processed, its prediction."""
+
+    report: Dict[str, Any]
+    enqueued: float = field(default_factory=time.perf_counter)
+    done: threading.Event = field(default_factory=threading.Event)
+    prediction: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class ExtractionService:
+    """Queues incoming reports and extracts them in micro-batches."""
+
+    def __init__(
+        self,
+        model: QABase,
+        processor: Optional[MedicalReportProcessor] = None,
+        n_shots: int = 0,
+        include_guidelines: bool = True,
+        max_batch_size: int = 8,
+        max_wait: float = 0.05,
+        max_queue: int = 1000,
+        latency_window: int = 1000,
+        extraction_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Initialise service; the model is kept for the service's lifetime.
+
+        Args:
+            model: QA model (or any object with extract_predictions and
+                get_entity_list), e.g. a fake backend for testing
+            processor: Segments raw report text; needed only for text input
+            n_shots: Number of few-shot examples in the prompt
+            include_guidelines: Whether to include guidelines in the prompt
+            max_batch_size: Maximum number of reports per backend call
+            max_wait: Seconds the first queued report waits for others to join
+                its batch
+            max_queue: Maximum number of queued reports before rejecting
+            latency_window: Number of recent latencies, and of the model's
+                per-call stats, kept
+            extraction_kwargs: Backend options (e.g. Ollama concurrency)
+        """
+        self.model = model
+        self.processor = processor
+        self.n_shots = n_shots
+        self.include_guidelines = include_guidelines
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.latency_window = latency_window
+        self.extraction_kwargs = extraction_kwargs or {}
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=max_queue)
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._batch_seconds: deque = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.started_at = time.time()
+        self.n_requests = 0
+        self.n_reports = 0
+        self.n_batches = 0
+        self.n_errors = 0
+
+    def start(self) -> None:
+        """Start the batching worker thread."""
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """Stop the worker once its current batch is finished."""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join()
+
+    def to_report(self, item: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Turn a raw report text, or a dictionary of its sections, into an
+        input report entry.
+        """
+        if isinstance(item, str):
+            if self.processor is None:
+                raise ValueError("Raw report text needs a processor to segment it")
+            return self.processor.create_report_entry_from_text(item)
+        if not isinstance(item, dict):
+            raise ValueError("Each report must be a string or an object of sections")
+        return {
+            **item,
+            **{code: "" for code in self.model.get_entity_list() if code not in item},
+        }
+
+    def submit(
+        self,
+        items: List[Union[str, Dict[str, Any]]],
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Queue reports and wait for their predictions.
+
+        Raises:
+            ValueError: If a report cannot be parsed
+            ServiceBusy: If the queue is full
+            TimeoutError: If predictions are not ready within timeout seconds
+            RuntimeError: If the backend failed on a report
+        """
+        jobs = [_Job(report=self.to_report(item)) for item in items]
+        with self._lock:
+            self.n_requests += 1
+        # Queue all of a request's reports or none of them. Only submit() adds
+        # to the queue, so free space cannot shrink between check and put
+        with self._submit_lock:
+            if self._queue.maxsize - self._queue.qsize() < len(jobs):
+                raise ServiceBusy("Request queue is full")
+            for job in jobs:
+                self._queue.put_nowait(job)
+
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for job in jobs:
+            remaining = (
+                None if deadline is None else max(0, deadline - time.perf_counter())
+            )
+            if not job.done.wait(remaining):
+                raise TimeoutError(f"Predictions not ready after {timeout}s")
+            if job.error is not None:
+                raise RuntimeError(job.error)
+        return [job.prediction for job in jobs]
+
+    def _run(self) -> None:
+        """Collect queued reports into batches and extract them."""
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: List[_Job]) -> None:
+        """Extract one batch and hand each prediction back to its request."""
+        start_time = time.perf_counter()
+        try:
+            predictions = self.model.extract_predictions(
+                [job.report for job in batch],
+                self.n_shots,
+                len(batch),
+                self.include_guidelines,
+                **self.extraction_kwargs,
+            )
+            for job, prediction in zip(batch, predictions):
+                job.prediction = prediction
+        except Exception as e:
+            print(f"Error extracting batch of {len(batch)} reports: {e}")
+            for job in batch:
+                job.error = str(e)
+
+        end_time = time.perf_counter()
+        with self._lock:
+            self.n_batches += 1
+            self.n_reports += len(batch)
+            self.n_errors += sum(job.error is not None for job in batch)
+            self._batch_seconds.append(end_time - start_time)
+            self._latencies.extend(end_time - job.enqueued for job in batch)
+        # Keep only recent per-call stats, so a long-running service does not
+        # grow them without bound
+        call_stats = getattr(self.model, "call_stats", None)
+        if call_stats is not None and len(call_stats) > self.latency_window:
+            del call_stats[: -self.latency_window]
+        for job in batch:
+            job.done.set()
+
+    def health(self) -> Dict[str, Any]:
+        """Get the service status."""
+        worker_alive = self._worker is not None and self._worker.is_alive()
+        return {
+            "status": "ok" if worker_alive else "stopped",
+            "model": getattr(self.model, "model_path", type(self.model).__name__),
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Get request counts, batch sizes and p50/p95 latencies."""
+        with self._lock:
+            latencies = list(self._latencies)
+            batch_seconds = list(self._batch_seconds)
+            counts = {
+                "n_requests": self.n_requests,
+                "n_reports": self.n_reports,
+                "n_batches": self.n_batches,
+                "n_errors": self.n_errors,
+            }
+        return {
+            **counts,
+            "mean_batch_size": round(counts["n_reports"] / counts["n_batches"], 2)
+            if counts["n_batches"]
+            else None,
+            "queue_depth": self._queue.qsize(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "latency_ms": self.latency(latencies),
+            "batch_ms": self.latency(batch_seconds),
+        }
+
+    def latency(self, seconds: Optional[List[float]] = None) -> Dict[str, Any]:
+        """Get p50/p95 of per-report latencies (or of the given durations) in ms."""
+        if seconds is None:
+            with self._lock:
+                seconds = list(self._latencies)
+        return {
+            "n": len(seconds),
+            "p50": round(percentile(seconds, 50) * 1000, 1) if seconds else None,
+            "p95": round(percentile(seconds, 95) * 1000, 1) if seconds else None,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes /extract, /health, /metrics and /latency to the service."""
+
+    server: "ExtractionServer"
+
+    def do_GET(self) -> None:
+        service = self.server.service
+        routes = {
+            "/health": service.health,
+            "/metrics": service.metrics,
+            "/latency": service.latency,
+        }
+        if self.path not in routes:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        self._send(200, routes[self.path]())
+
+    def do_POST(self) -> None:
+        if self.path != "/extract":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if "reports" in body:
+                items = body["reports"]
+            elif "text" in body:
+                items = [body["text"]]
+            else:
+                raise ValueError("body needs 'reports' or 'text'")
+            if not isinstance(items, list):
+                raise TypeError("reports must be a list")
+            predictions = self.server.service.submit(items, self.server.request_timeout)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            self._send(400, {"error": f"Bad request: {e}"})
+        except ServiceBusy as e:
+            self._send(503, {"error": str(e)})
+        except TimeoutError as e:
+            self._send(504, {"error": str(e)})
+        except RuntimeError as e:
+            self._send(500, {"error": str(e)})
+        else:
+            self._send(200, {"predictions": predictions})
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Keep per-request access logs out of the console."""
+
+
+class ExtractionServer(ThreadingHTTPServer):
+    """HTTP server exposing an ExtractionService."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        service: ExtractionService,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        request_timeout: Optional[float] = 300,
+    ):
+        """
+        Initialise server (port 0 picks a free port).
+
+        Args:
+            service: Extraction service handling the requests
+            host: Interface to bind
+            port: Port to bind
+            request_timeout: Seconds an /extract request waits for predictions
+        """
+        super().__init__((host, port), _Handler)
+        self.service = service
+        self.request_timeout = request_timeout
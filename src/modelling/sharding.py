@@ -0,0 +1,154 @@
+"""
+Multi-process llama.cpp extraction.
+A single llama.cpp instance leaves cores idle on short reports, so reports are
+spread across worker processes that each hold their own memory-mapped model.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from src.utils.checkpoint import RunCheckpoint
+
+# Model owned by the current worker process
+_WORKER_MODEL = None
+
+
+def _init_worker(model_class: type, model_kwargs: Dict[str, Any]) -> None:
+    """Build the worker's model; responses are cached by the parent only."""
+    global _WORKER_MODEL
+    _WORKER_MODEL = model_class(**model_kwargs)
+
+
+def _run_report(
+    index: int,
+    messages: List[Dict[str, str]],
+    report: Dict[str, Any],
+    prefix_key: str,
+    n_ctx: int,
+) -> Tuple[int, Dict[str, Any], Dict[str, Any], List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Extract one report in a worker.
+
+    Returns:
+        Tuple of (index, raw answer, prediction, generation stats of the call,
+        answer parsing counts)
+    """
+    _WORKER_MODEL.call_stats.clear()
+    _WORKER_MODEL.parse_stats.clear()
+    answer, prediction = _WORKER_MODEL.extract_report(
+        messages, _WORKER_MODEL.get_schema(), report, prefix_key, n_ctx, report_id=index
+    )
+    return (
+        index,
+        answer,
+        prediction,
+        list(_WORKER_MODEL.call_stats),
+        dict(_WORKER_MODEL.parse_stats),
+    )
+
+
+def run_sharded_extraction(
+    model,
+    reports: List[Dict[str, Any]],
+    n_shots: int,
+    include_guidelines: bool,
+    n_workers: int,
+    n_threads: int,
+    checkpoint: Optional[RunCheckpoint] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Extract entities from reports with a pool of llama.cpp worker processes.
+
+    Reports are handed out one at a time, so a worker that finishes a short
+    report picks up the next one straight away. Context planning, cache
+    lookups and checkpoint writes stay in this process.
+
+    Args:
+        model: LlamaCppQA model whose settings the workers copy
+        reports: Reports to extract
+        n_shots: Number of few-shot examples in the prompt
+        include_guidelines: Whether to include guidelines in the prompt
+        n_workers: Number of worker processes
+        n_threads: CPU threads per worker
+        checkpoint: Optional checkpoint; completed reports are skipped
+
+    Returns:
+        Predictions in the same order as the reports
+    """
+    prompt = model.compile_prompt(n_shots, include_guidelines)
+    schema = model.get_schema()
+    entity_list = model.get_entity_list()
+    completed = checkpoint.load() if checkpoint is not None else {}
+    if completed:
+        print(f"Skipping {len(completed)} reports already completed")
+
+    predictions: List[Optional[Dict[str, Any]]] = [None] * len(reports)
+    cache_keys: Dict[int, str] = {}
+    pending = {}
+
+    def record(index: int, answer: Dict[str, Any], prediction: Dict[str, Any]):
+        predictions[index] = prediction
+        if checkpoint is not None:
+            checkpoint.append(index, answer, prediction)
+
+    for i, report in enumerate(reports):
+        if i in completed:
+            predictions[i] = completed[i]["prediction"]
+            continue
+        messages = model.build_messages(
+            prompt.task_prompt, model.get_report_prompt(report)
+        )
+        n_ctx = model.plan_context(i, messages)
+        if n_ctx is None:
+            predictions[i] = model.overflow_prediction(report)
+            continue
+        if model.cache is not None:
+            cache_keys[i] = model.completion_cache_key(
+                messages, schema, prompt.fingerprint
+            )
+            answer = model.cache.get(cache_keys[i])
+            if answer is not None:
+                prediction = model.parse_completion(answer, report, entity_list)
+                record(i, answer, prediction)
+                continue
+        pending[i] = messages
+
+    if not pending:
+        return predictions
+
+    # Every prompt is planned before any runs, so workers load the model once,
+    # at the context size of the largest
+    with ProcessPoolExecutor(
+        max_workers=min(n_workers, len(pending)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(type(model), model.worker_kwargs(n_threads)),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _run_report,
+                i,
+                messages,
+                reports[i],
+                prompt.fingerprint,
+                model.context_size,
+            )
+            for i, messages in pending.items()
+        ]
+        for future in tqdm(
+            as_completed(futures),
+            total=len(futures),
+            desc=f"Processing reports ({n_workers} workers)",
+            ncols=100,
+        ):
+            index, answer, prediction, call_stats, parse_stats = future.result()
+            model.call_stats.extend(call_stats)
+            model.record_parse_stats(parse_stats)
+            if model.cache is not None:
+                model.cache.set(cache_keys[index], answer)
+            record(index, answer, prediction)
+
+    return predictions
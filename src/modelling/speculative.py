@@ -0,0 +1,135 @@
+"""
+Speculative decoding drafts for llama.cpp.
+Answers are short JSON whose values are mostly copied from the report, so
+draft tokens looked up in the prompt (or proposed by a small draft model) are
+often accepted, and the large model verifies several tokens per forward pass.
+"""
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+from src.modelling.context import CONTEXT_BUCKETS
+
+PROMPT_LOOKUP = "prompt_lookup"
+
+
+class SmallModelDraft(LlamaDraftModel):
+    """Drafts tokens greedily with a small model sharing the target's vocabulary."""
+
+    def __init__(
+        self,
+        model_path: str,
+        num_pred_tokens: int = 10,
+        n_ctx: int = max(CONTEXT_BUCKETS),
+        n_threads: Optional[int] = None,
+    ):
+        """
+        Initialise draft model.
+
+        Args:
+            model_path: Path to the draft GGUF
+            num_pred_tokens: Number of tokens drafted per step
+            n_ctx: Context size, enough for the largest prompt bucket
+            n_threads: Number of CPU threads (None uses llama.cpp's default)
+        """
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(
+            model_path=str(model_path), n_ctx=n_ctx, n_threads=n_threads, verbose=False
+        )
+        self._lock = threading.Lock()
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:
+        # generate() reuses the KV cache of the longest shared prefix, so only
+        # tokens added since the previous step are evaluated
+        draft = []
+        with self._lock:
+            for token in self.llm.generate(input_ids.tolist(), top_k=1, temp=0.0):
+                draft.append(token)
+                if len(draft) == self.num_pred_tokens:
+                    break
+        return np.array(draft, dtype=np.intc)
+
+
+class CountingDraftModel(LlamaDraftModel):
+    """
+    Wraps a draft model and counts the tokens it proposes.
+
+    The instance is shared by every pooled model in the process, but a
+    completion drafts in the thread that runs it, so counters are kept per
+    thread and concurrent completions do not count each other's drafts.
+    """
+
+    def __init__(self, draft_model: LlamaDraftModel):
+        self.draft_model = draft_model
+        self._counters = threading.local()
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:
+        draft = self.draft_model(input_ids, **kwargs)
+        n_calls, n_proposed = self.snapshot()
+        self._counters.n_calls = n_calls + 1
+        self._counters.n_proposed = n_proposed + len(draft)
+        return draft
+
+    def snapshot(self) -> Tuple[int, int]:
+        """Get the calling thread's counters, to diff against after a completion."""
+        return (
+            getattr(self._counters, "n_calls", 0),
+            getattr(self._counters, "n_proposed", 0),
+        )
+
+    def completion_stats(
+        self, before: Tuple[int, int], completion_tokens: Optional[int]
+    ) -> Dict[str, Any]:
+        """
+        Get draft statistics of one completion.
+
+        llama.cpp does not report accepted drafts. Each verification step
+        samples one token of its own plus the drafts it accepts, and the draft
+        model is called once per step after the first, so accepted drafts are
+        estimated as completion tokens - draft calls - 1.
+        """
+        n_calls, n_proposed = self.snapshot()
+        n_calls -= before[0]
+        n_proposed -= before[1]
+        n_accepted = min(n_proposed, max(0, (completion_tokens or 0) - n_calls - 1))
+        return {
+            "draft_proposed": n_proposed,
+            "draft_accepted": n_accepted,
+        }
+
+
+_DRAFT_MODELS: Dict[Tuple[Any, ...], CountingDraftModel] = {}
+_DRAFT_LOCK = threading.Lock()
+
+
+def get_draft_model(
+    speculative: str,
+    num_pred_tokens: int = 10,
+    n_threads: Optional[int] = None,
+) -> CountingDraftModel:
+    """
+    Get the process-wide draft model for a speculative decoding option.
+
+    The same instance is returned for the same options, so pooled models
+    built with it are reused.
+
+    Args:
+        speculative: PROMPT_LOOKUP, or the path to a small draft GGUF
+        num_pred_tokens: Number of tokens drafted per step
+        n_threads: CPU threads of a draft GGUF
+    """
+    key = (speculative, num_pred_tokens, n_threads)
+    with _DRAFT_LOCK:
+        if key not in _DRAFT_MODELS:
+            if speculative == PROMPT_LOOKUP:
+                draft_model = LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens)
+            else:
+                draft_model = SmallModelDraft(
+                    speculative, num_pred_tokens, n_threads=n_threads
+                )
+            _DRAFT_MODELS[key] = CountingDraftModel(draft_model)
+        return _DRAFT_MODELS[key]
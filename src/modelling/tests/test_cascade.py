@@ -0,0 +1,41 @@
+"""
+Tests of the model cascade.
+Run from the repository root: python -m pytest src/modelling/tests
+"""
+
+from types import SimpleNamespace
+
+from src.modelling.cascade import ModelCascade
+
+
+def make_cascade():
+    guidelines = SimpleNamespace(
+        entity_to_info_map={
+            "transplant": ("Transplant?", "boolean"),
+            "n_total": ("Total glomeruli", "numerical"),
+            "diagnosis": ("Diagnosis", "string-complex"),
+        }
+    )
+    model = SimpleNamespace(entity_guidelines=guidelines)
+    return ModelCascade(model, model, rule_check=False)
+
+
+def test_none_is_a_valid_free_text_answer():
+    cascade = make_cascade()
+    prediction = {"transplant": "false", "n_total": "12", "diagnosis": "None"}
+    assert cascade.find_invalid_entities(prediction) == []
+
+
+def test_empty_and_mistyped_values_are_invalid():
+    cascade = make_cascade()
+    prediction = {"transplant": "null", "n_total": "none", "diagnosis": None}
+    assert cascade.find_invalid_entities(prediction) == [
+        "transplant",
+        "n_total",
+        "diagnosis",
+    ]
+    assert cascade.find_invalid_entities({"n_total": " "}) == [
+        "transplant",
+        "n_total",
+        "diagnosis",
+    ]
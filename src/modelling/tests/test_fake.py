@@ -0,0 +1,51 @@
+"""
+Tests of the fake backend.
+Run from the repository root: python -m pytest src/modelling/tests
+"""
+
+import json
+import shutil
+from pathlib import Path
+
+from src.modelling.cache import ResponseCache
+from src.renal_biopsy.qa import RenalBiopsyFakeQA
+
+GUIDELINES = Path(__file__).parents[2] / "project_files" / "guidelines.xlsx"
+
+
+def test_cached_answers_follow_behaviour(tmp_path):
+    (tmp_path / "data").mkdir()
+    shutil.copy(GUIDELINES, tmp_path / "data" / "guidelines.xlsx")
+    cache = ResponseCache(tmp_path / "cache")
+    reports = [
+        {
+            "microscopy_section": f"Core of renal tissue, sample {i}.",
+            "conclusion_section": f"Conclusion {i}.",
+        }
+        for i in range(2)
+    ]
+
+    def run(malformed_rate):
+        model = RenalBiopsyFakeQA(
+            "fake",
+            str(tmp_path),
+            cache=cache,
+            latency_ms=1,
+            latency_sigma=0,
+            malformed_rate=malformed_rate,
+        )
+        return model.extract_with_known_entities(reports, n_prototype=len(reports))
+
+    def is_valid_json(answer):
+        try:
+            json.loads(answer)
+        except json.JSONDecodeError:
+            return False
+        return True
+
+    clean = run(0.0)
+    misses = cache.misses
+    malformed = run(1.0)
+    assert cache.misses == misses + len(reports)
+    assert all(is_valid_json(answer) for answer in clean)
+    assert not any(is_valid_json(answer) for answer in malformed)
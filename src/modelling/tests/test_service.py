@@ -0,0 +1,134 @@
+"""
+Tests of the extraction service against the fake backend.
+Run from the repository root: python -m pytest src/modelling/tests
+"""
+
+import json
+import shutil
+import threading
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from src.modelling.service import ExtractionServer, ExtractionService, ServiceBusy
+from src.renal_biopsy.qa import RenalBiopsyFakeQA
+
+GUIDELINES = Path(__file__).parents[2] / "project_files" / "guidelines.xlsx"
+
+ANNOTATIONS = [
+    {
+        "cortex_present": "True",
+        "medulla_present": "False",
+        "n_total": "12",
+        "n_segmental": "0",
+        "n_global": "2",
+        "abnormal_glomeruli": "False",
+        "chronic_change": "mild",
+        "transplant": "True",
+        "diagnosis": "No rejection",
+    },
+    {
+        "cortex_present": "True",
+        "medulla_present": "True",
+        "n_total": "30",
+        "n_segmental": "1",
+        "n_global": "4",
+        "abnormal_glomeruli": "True",
+        "chronic_change": "20%",
+        "transplant": "False",
+        "diagnosis": "IgA nephropathy",
+    },
+]
+
+
+@pytest.fixture
+def model(tmp_path):
+    (tmp_path / "data").mkdir()
+    shutil.copy(GUIDELINES, tmp_path / "data" / "guidelines.xlsx")
+    model = RenalBiopsyFakeQA("fake", str(tmp_path), latency_ms=5, latency_sigma=0)
+    return model
+
+
+def make_report(model, index):
+    return {
+        "microscopy_section": f"Core of renal tissue, sample {index}.",
+        "conclusion_section": f"Conclusion {index}.",
+        **{code: "" for code in model.get_entity_list()},
+    }
+
+
+def test_concurrent_requests_get_their_own_predictions(model):
+    reports = [make_report(model, i) for i in range(6)]
+    annotations = [ANNOTATIONS[i % 2] for i in range(6)]
+    model.register_reports(reports, annotations)
+    service = ExtractionService(
+        model,
+        include_guidelines=False,
+        max_batch_size=4,
+        extraction_kwargs={"concurrency": 4},
+    )
+    service.start()
+    predictions = [None] * len(reports)
+
+    def submit(i):
+        [predictions[i]] = service.submit([reports[i]], timeout=30)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(6)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        service.stop()
+
+    for prediction, annotation in zip(predictions, annotations):
+        assert {code: prediction[code] for code in annotation} == annotation
+    metrics = service.metrics()
+    assert metrics["n_reports"] == 6
+    assert metrics["n_errors"] == 0
+    assert metrics["n_batches"] < 6
+
+
+def test_full_queue_rejects_whole_request(model):
+    service = ExtractionService(model, max_queue=2)  # not started, nothing drains
+    with pytest.raises(ServiceBusy):
+        service.submit([make_report(model, i) for i in range(3)], timeout=0)
+    assert service.metrics()["queue_depth"] == 0
+
+
+def test_call_stats_are_bounded(model):
+    service = ExtractionService(model, include_guidelines=False, latency_window=3)
+    service.start()
+    try:
+        for i in range(5):
+            service.submit([make_report(model, i)], timeout=30)
+    finally:
+        service.stop()
+    assert len(model.call_stats) == 3
+
+
+def test_http_extract(model):
+    report = make_report(model, 0)
+    model.register_reports([report], ANNOTATIONS[:1])
+    service = ExtractionService(model, include_guidelines=False)
+    service.start()
+    server = ExtractionServer(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        request = urllib.request.Request(
+            f"{url}/extract", data=json.dumps({"reports": [report]}).encode("utf-8")
+        )
+        with urllib.request.urlopen(request) as response:
+            [prediction] = json.loads(response.read())["predictions"]
+        with urllib.request.urlopen(f"{url}/health") as response:
+            health = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+
+    assert prediction["diagnosis"] == "No rejection"
+    assert health == {"status": "ok", "model": "fake", "queue_depth": 0}
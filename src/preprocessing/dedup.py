@@ -0,0 +1,200 @@
+"""
+Report deduplication before inference.
+Re-issued reports and reports made of the same boilerplate text get the same
+answers, so each group of duplicates is extracted once and the prediction is
+copied to every member of the group.
+"""
+
+import copy
+import hashlib
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+DEDUP_FIELDS = ("microscopy_section", "conclusion_section")
+
+# Mersenne prime used for the MinHash permutations
+_PRIME = (1 << 61) - 1
+
+
+def normalise_report_text(
+    report: Dict[str, Any], fields: Sequence[str] = DEDUP_FIELDS
+) -> str:
+    """Join a report's sections, lower-cased with runs of whitespace collapsed."""
+    text = " | ".join(str(report.get(field) or "") for field in fields)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class MinHasher:
+    """Pure-Python MinHash signatures of word shingles."""
+
+    def __init__(self, n_perm: int = 64, shingle_size: int = 3, seed: int = 0):
+        """
+        Initialise hasher.
+
+        Args:
+            n_perm: Number of hash permutations in a signature
+            shingle_size: Number of words per shingle
+            seed: Seed for the permutations, fixed so signatures are reproducible
+        """
+        rng = random.Random(seed)
+        self.shingle_size = shingle_size
+        self.permutations = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(n_perm)
+        ]
+
+    def signature(self, text: str) -> List[int]:
+        """Get the MinHash signature of text."""
+        words = text.split()
+        n = self.shingle_size
+        shingles = {
+            " ".join(words[i : i + n]) for i in range(max(1, len(words) - n + 1))
+        }
+        hashes = [
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"
+            )
+            for s in shingles
+        ]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self.permutations]
+
+    @staticmethod
+    def similarity(signature_1: List[int], signature_2: List[int]) -> float:
+        """Estimate the Jaccard similarity of two signatures."""
+        return sum(x == y for x, y in zip(signature_1, signature_2)) / len(signature_1)
+
+
+@dataclass
+class ReportGroups:
+    """Groups of duplicate reports, each answered by its first member."""
+
+    representatives: List[int]
+    group_of: List[int]
+
+    @property
+    def n_reports(self) -> int:
+        return len(self.group_of)
+
+    @property
+    def n_unique(self) -> int:
+        return len(self.representatives)
+
+    def unique(self, items: List[Any]) -> List[Any]:
+        """Select one item (e.g. report) per group."""
+        return [items[i] for i in self.representatives]
+
+    def expand(self, items: List[Any]) -> List[Any]:
+        """Copy one item per group (e.g. raw answers) back to every report."""
+        return [copy.deepcopy(items[group]) for group in self.group_of]
+
+    def expand_predictions(
+        self,
+        predictions: List[Dict[str, Any]],
+        reports: List[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Copy one prediction per group back to every report.
+
+        Members keep their own report fields; only the values the model filled
+        in for the representative are copied.
+        """
+        expanded = []
+        for report, group in zip(reports, self.group_of):
+            template = reports[self.representatives[group]]
+            filled = {
+                key: value
+                for key, value in predictions[group].items()
+                if template.get(key) != value
+            }
+            expanded.append({**copy.deepcopy(report), **copy.deepcopy(filled)})
+        return expanded
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarise how many reports were collapsed."""
+        return {
+            "n_reports": self.n_reports,
+            "n_unique": self.n_unique,
+            "dedupe_ratio": round(self.n_reports / self.n_unique, 3)
+            if self.n_unique
+            else None,
+        }
+
+
+def group_reports(
+    reports: List[Dict[str, Any]],
+    near_duplicates: bool = False,
+    threshold: float = 0.9,
+    n_perm: int = 64,
+    n_bands: int = 16,
+    fields: Sequence[str] = DEDUP_FIELDS,
+) -> ReportGroups:
+    """
+    Group reports whose normalised sections are identical, or near-identical.
+
+    Near-duplicates are found with MinHash and LSH banding, and are only merged
+    if they contain exactly the same numbers, so reports differing in e.g. a
+    glomerular count are never given each other's answers.
+
+    Args:
+        reports: Input report templates
+        near_duplicates: Also merge reports with MinHash similarity >= threshold
+        threshold: Minimum estimated Jaccard similarity of word shingles
+        n_perm: Number of MinHash permutations
+        n_bands: Number of LSH bands (must divide n_perm)
+        fields: Report fields the comparison is based on
+
+    Returns:
+        Report groups, in order of each group's first report
+    """
+    texts = [normalise_report_text(report, fields) for report in reports]
+    parent = list(range(len(reports)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    first_by_hash: Dict[str, int] = {}
+    for i, text in enumerate(texts):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        union(first_by_hash.setdefault(digest, i), i)
+
+    if near_duplicates:
+        if n_perm % n_bands:
+            raise ValueError("n_bands must divide n_perm")
+        hasher = MinHasher(n_perm=n_perm)
+        rows = n_perm // n_bands
+        unique = sorted(set(first_by_hash.values()))
+        signatures = {i: hasher.signature(texts[i]) for i in unique}
+        numbers = {i: re.findall(r"\d+(?:\.\d+)?", texts[i]) for i in unique}
+        buckets: Dict[Any, List[int]] = {}
+        for i in unique:
+            for band in range(n_bands):
+                key = (band, tuple(signatures[i][band * rows : (band + 1) * rows]))
+                for j in buckets.setdefault(key, []):
+                    if (
+                        find(i) != find(j)
+                        and numbers[i] == numbers[j]
+                        and MinHasher.similarity(signatures[i], signatures[j])
+                        >= threshold
+                    ):
+                        union(i, j)
+                buckets[key].append(i)
+
+    representatives: List[int] = []
+    group_by_root: Dict[int, int] = {}
+    group_of = []
+    for i in range(len(reports)):
+        root = find(i)
+        if root not in group_by_root:
+            group_by_root[root] = len(representatives)
+            representatives.append(root)
+        group_of.append(group_by_root[root])
+    return ReportGroups(representatives=representatives, group_of=group_of)
@@ -1,5 +1,7 @@
+import hashlib
+import math
 import pandas as pd
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
 
 class EntityGuidelines:
@@ -11,6 +13,14 @@ class EntityGuidelines:
     - A DataFrame of guidelines for prompts
     - A JSON schema for LLaMA-cpp format
     """
+
+    # Estimated answer length in tokens for one value of each entity type
+    OUTPUT_TOKENS_PER_TYPE = {
+        "boolean": 2,
+        "numerical": 4,
+        "numerical/string-complex": 24,
+        "string-complex": 64,
+    }
     
     def __init__(self, path: str):
         """
@@ -20,6 +30,8 @@ class EntityGuidelines:
             path: Path to the Excel file containing entity guidelines
         """
         self.path = path
+        with open(path, "rb") as f:
+            self.file_hash = hashlib.sha256(f.read()).hexdigest()
         self.entity_to_info_map = self.create_entity_to_info_map()
         self.prompt_df = self.get_guidelines_info_for_prompt()
         self.json_schema = self.create_llama_cpp_json_schema()
@@ -66,6 +78,23 @@ class EntityGuidelines:
         prompt_df = df[['Entity Code', 'Combined Prompt Question', 'Combined Guidelines']]
         return prompt_df.dropna(how='all')
     
+    def get_entity_groups(self) -> Dict[str, List[str]]:
+        """
+        Group entities that share a combined prompt question.
+
+        Each non-null combined question starts a group that the following rows
+        with a null combined question belong to.
+
+        Returns:
+            Dictionary mapping each group's first entity code to its entity codes
+        """
+        df = self.prompt_df
+        group_ids = df['Combined Prompt Question'].notna().cumsum()
+        groups: Dict[str, List[str]] = {}
+        for codes in df.groupby(group_ids, sort=False)['Entity Code'].agg(list):
+            groups[codes[0]] = codes
+        return groups
+
     def create_llama_cpp_json_schema(self) -> dict:
         """
         Create a JSON schema in LLaMA-cpp format.
@@ -83,4 +112,62 @@ class EntityGuidelines:
                 }
             }
         }
-        return json_schema
\ No newline at end of file
+        return json_schema
+
+    def create_output_json_schema(
+        self, entity_codes: Optional[List[str]] = None
+    ) -> dict:
+        """
+        Create a standard JSON schema for one report's answer.
+
+        Booleans and numericals are typed so they match the annotations once
+        converted to strings ("True", "45"); every other entity is free text.
+        All entities are required and no other keys are allowed.
+
+        Args:
+            entity_codes: Optional subset of entities to include (default: all)
+
+        Returns:
+            JSON schema dictionary (e.g. for Ollama's structured `format`)
+        """
+        value_types = {"boolean": "boolean", "numerical": "integer"}
+        entity_codes = entity_codes or list(self.entity_to_info_map)
+        return {
+            "type": "object",
+            "properties": {
+                k: {"type": value_types.get(self.entity_to_info_map[k][1], "string")}
+                for k in entity_codes
+            },
+            "required": list(entity_codes),
+            "additionalProperties": False,
+        }
+
+    def estimate_output_tokens(
+        self,
+        margin: float = 1.5,
+        tokens_per_type: Optional[Dict[str, int]] = None,
+        entity_codes: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Estimate the maximum number of tokens in a JSON answer for one report.
+
+        Each entity costs its key (about 3 characters per token), the JSON
+        punctuation around it, and the expected value length for its type;
+        unknown types are budgeted as free text.
+
+        Args:
+            margin: Multiplier applied to the estimate as headroom
+            tokens_per_type: Optional override of OUTPUT_TOKENS_PER_TYPE
+            entity_codes: Optional subset of entities in the answer (default: all)
+
+        Returns:
+            Token budget for one answer
+        """
+        tokens_per_type = tokens_per_type or self.OUTPUT_TOKENS_PER_TYPE
+        free_text_tokens = max(tokens_per_type.values())
+        total = 2  # opening and closing braces
+        for entity_code in entity_codes or self.entity_to_info_map:
+            entity_type = self.entity_to_info_map[entity_code][1]
+            total += math.ceil(len(entity_code) / 3) + 4  # key, quotes, colon, comma
+            total += tokens_per_type.get(entity_type, free_text_tokens)
+        return math.ceil(total * margin)
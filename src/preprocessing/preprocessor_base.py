@@ -54,6 +54,21 @@ class MedicalReportProcessor(ABC):
                 
         return input_json
     
+    def create_report_entry_from_text(self, text: str) -> Dict[str, Any]:
+        """
+        Segment one raw report and create its input entry.
+
+        Args:
+            text: Full report text
+
+        Returns:
+            Report entry in the same format as create_input_json
+        """
+        return self._create_report_entry(
+            report=self.segment_report(text),
+            entity_to_info_map=self.guidelines.entity_to_info_map
+        )
+
     def extract_valid_sections(
         self,
         reports: List[Dict[str, str]],
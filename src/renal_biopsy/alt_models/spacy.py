@@ -358,3 +358,60 @@ def process_reports(reports, n_prototype=2):
         all_docs.append(doc)
 
     return all_results, all_docs
+
+
+# spaCy labels that resolve each entity, and whether a match means present
+PRESENCE_LABELS = {
+    "cortex_present": {"cortex": True, "cortex_absent": False},
+    "medulla_present": {"medulla": True, "medulla_absent": False},
+}
+COUNT_LABELS = {
+    "n_total": ["n_total"],
+    "n_segmental": ["n_segmental", "n_segmental_relative"],
+    "n_global": ["n_global", "n_global_relative"],
+}
+NEGATION_WORDS = {"no", "not", "without", "nor"}
+
+
+def resolve_confident_entities(reports, n_prototype=2):
+    """
+    Get the entities the rules resolve unambiguously in each report.
+
+    A count is kept only if every match for it gives the same number (and
+    segmental/global counts do not exceed the total); cortex and medulla are
+    kept only if all mentions agree and none is preceded by a negation.
+
+    Returns:
+        List of {entity code: value} dictionaries, one per report
+    """
+    _, docs = process_reports(reports, n_prototype=n_prototype)
+    all_resolved = []
+
+    for doc in docs:
+        resolved = {}
+        for code, labels in PRESENCE_LABELS.items():
+            values = set()
+            for ent in doc.ents:
+                if ent.label_ not in labels:
+                    continue
+                window = doc[max(0, ent.start - 3) : ent.start]
+                preceding = {token.lower_ for token in window}
+                values.add(None if preceding & NEGATION_WORDS else labels[ent.label_])
+            if len(values) == 1 and None not in values:
+                resolved[code] = values.pop()
+
+        for code, labels in COUNT_LABELS.items():
+            numbers = {
+                extract_number(ent.text) for ent in doc.ents if ent.label_ in labels
+            }
+            if len(numbers) == 1 and None not in numbers:
+                resolved[code] = numbers.pop()
+
+        n_total = resolved.get("n_total")
+        for code in ("n_segmental", "n_global"):
+            if code in resolved and (n_total is None or resolved[code] > n_total):
+                del resolved[code]
+
+        all_resolved.append(resolved)
+
+    return all_resolved
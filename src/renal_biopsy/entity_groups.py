@@ -0,0 +1,24 @@
+# Entity groups asked for together when extracting by entity group
+entity_groups = {
+    "presence": ["cortex_present", "medulla_present"],
+    "glomeruli": ["n_total", "n_segmental", "n_global", "abnormal_glomeruli"],
+    "chronic_change": ["chronic_change"],
+    "diagnosis": ["transplant", "diagnosis"],
+}
+
+# Word prefixes picking each group's relevant sentences (None: full report,
+# as transplant and diagnosis are read from the whole conclusion)
+group_keywords = {
+    "presence": ["cortex", "cortical", "medulla", "medullary"],
+    "glomeruli": [
+        "glom",
+        "sclero",
+        "segmental",
+        "global",
+        "bowman",
+        "mesangi",
+        "capillar",
+    ],
+    "chronic_change": ["chronic", "fibros", "atroph", "scar", "%", "percent"],
+    "diagnosis": None,
+}
@@ -1,6 +1,8 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-from src.modelling.qa_base import OllamaQA, LlamaCppQA
+from src.modelling.fake import FakeQA
+from src.modelling.qa_base import OllamaQA, LlamaCppQA, LlamaServerQA
+from src.renal_biopsy.entity_groups import entity_groups, group_keywords
 from src.renal_biopsy.few_shots import few_shots_list
 
 
@@ -15,6 +17,12 @@ class RenalBiopsyOllamaQA(OllamaQA):
     def get_few_shot_list(self) -> List[str]:
         return few_shots_list
 
+    def get_entity_groups(self) -> Dict[str, List[str]]:
+        return entity_groups
+
+    def get_group_keywords(self) -> Dict[str, Optional[List[str]]]:
+        return group_keywords
+
 
 class RenalBiopsyLlamaCppQA(LlamaCppQA):
     """QA model for renal biopsy analysis using LlamaCpp backend."""
@@ -27,6 +35,12 @@ class RenalBiopsyLlamaCppQA(LlamaCppQA):
     def get_few_shot_list(self) -> List[str]:
         return few_shots_list
 
+    def get_entity_groups(self) -> Dict[str, List[str]]:
+        return entity_groups
+
+    def get_group_keywords(self) -> Dict[str, Optional[List[str]]]:
+        return group_keywords
+
     def get_schema(self) -> Dict[str, Any]:
         return {
             "type": "json_object",
@@ -45,3 +59,11 @@ class RenalBiopsyLlamaCppQA(LlamaCppQA):
                 },
             },
         }
+
+
+class RenalBiopsyFakeQA(FakeQA, RenalBiopsyOllamaQA):
+    """Fake renal biopsy QA model answering from annotations, for load tests."""
+
+
+class RenalBiopsyLlamaServerQA(LlamaServerQA, RenalBiopsyLlamaCppQA):
+    """QA model for renal biopsy analysis using a llama.cpp server."""
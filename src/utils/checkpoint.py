@@ -0,0 +1,115 @@
+"""
+Append-only checkpoint log so that long annotation runs can be resumed.
+Each completed report is written as one JSON line as soon as it is produced,
+with a hash of the report so a resumed run only reuses its own results.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+
+def report_hash(report: Dict[str, Any]) -> str:
+    """Hash a report's contents."""
+    payload = json.dumps(report, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class RunCheckpoint:
+    """JSON-lines log of per-report raw responses and parsed predictions."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        reports: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        Initialise checkpoint log.
+
+        Args:
+            path: Path to the .jsonl checkpoint file (created on first append)
+            reports: Reports of the run, indexed as in the records; each record
+                stores its report's hash and is checked against it on load
+        """
+        self.path = Path(path)
+        self.reports = reports
+        self._lock = threading.Lock()
+        self._tail_checked = False
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Load completed reports from the checkpoint.
+
+        A truncated final line (e.g. from a crash mid-write) is ignored, so
+        that report is simply run again.
+
+        Returns:
+            Dictionary mapping report index to its checkpoint record
+
+        Raises:
+            ValueError: If a record does not match the report now at its index
+        """
+        completed = {}
+        if not self.path.exists():
+            return completed
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._check_record(record)
+                completed[record["index"]] = record
+        return completed
+
+    def append(self, index: int, raw_response: Any, prediction: Dict[str, Any]) -> None:
+        """
+        Append one completed report and flush it to disk.
+
+        Args:
+            index: Position of the report in the input JSON
+            raw_response: Raw LLM response (must be JSON-serializable)
+            prediction: Parsed prediction for the report
+        """
+        record = {
+            "index": index,
+            "raw_response": raw_response,
+            "prediction": prediction,
+        }
+        if self.reports is not None:
+            record["report_hash"] = report_hash(self.reports[index])
+        line = json.dumps(record)
+        with self._lock:
+            if not self._tail_checked:
+                self._terminate_truncated_line()
+                self._tail_checked = True
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _check_record(self, record: Dict[str, Any]) -> None:
+        """Raise if a record was written for a different report than this run's."""
+        if self.reports is None:
+            return
+        index = record["index"]
+        if index >= len(self.reports) or record.get("report_hash") != report_hash(
+            self.reports[index]
+        ):
+            raise ValueError(
+                f"Checkpoint {self.path} has a result for report {index} that does "
+                "not match this run's report at that index; start a new run instead"
+            )
+
+    def _terminate_truncated_line(self) -> None:
+        """Make sure a partially written last line doesn't swallow the next one."""
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
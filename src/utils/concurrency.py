@@ -0,0 +1,54 @@
+"""
+Helpers for running many LLM requests concurrently with a bounded number
+of requests in flight at once.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+from tqdm.asyncio import tqdm_asyncio
+
+
+async def gather_bounded(
+    task_factories: Sequence[Callable[[], Awaitable[Any]]],
+    concurrency: int,
+    timeout: Optional[float] = None,
+    default: Any = None,
+    desc: str = "Processing reports",
+) -> List[Any]:
+    """
+    Run awaitables with at most `concurrency` in flight, keeping input order.
+
+    Args:
+        task_factories: Zero-argument callables that each create one awaitable
+        concurrency: Maximum number of awaitables running at once
+        timeout: Per-task timeout in seconds (None for no timeout)
+        default: Result used for a task that times out or raises
+        desc: Progress bar description
+
+    Returns:
+        Results in the same order as `task_factories`
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i: int, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(factory(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Request {i} timed out after {timeout}s")
+                return default
+            except Exception as e:
+                # One failed request (e.g. a server error or dropped
+                # connection) must not abort the rest of the batch
+                print(f"Request {i} failed: {e!r}")
+                return default
+
+    return await tqdm_asyncio.gather(
+        *(run(i, factory) for i, factory in enumerate(task_factories)),
+        desc=desc,
+        ncols=100,
+    )
@@ -1,10 +1,13 @@
 """
 Text processing utility functions for handling long text content and metadata.
-Provides functionality for text wrapping, line insertion, and metadata writing.
+Provides functionality for text wrapping, line insertion, metadata writing and
+latency percentiles.
 """
 
+import ast
+import math
 import textwrap
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Sequence
 from pathlib import Path
 
 
@@ -64,4 +67,46 @@ def write_metadata_file(metadata_path: str | Path, metadata: Dict[str, Any]) ->
     """
     with open(metadata_path, "w", encoding="utf-8") as f:
         for key, value in metadata.items():
-            f.write(f"{key}: {value}\n")
\ No newline at end of file
+            f.write(f"{key}: {value}\n")
+
+
+def read_metadata_file(metadata_path: str | Path) -> Dict[str, Any]:
+    """
+    Read a metadata file written by write_metadata_file.
+
+    Args:
+        metadata_path: Path to metadata file
+
+    Returns:
+        Metadata dictionary, with values parsed back into Python literals
+        where possible and kept as strings otherwise
+    """
+    metadata = {}
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        for line in f:
+            key, separator, value = line.rstrip("\n").partition(": ")
+            if not separator:
+                continue
+            try:
+                metadata[key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                metadata[key] = value
+    return metadata
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """
+    Get the q-th percentile of values (nearest-rank method).
+
+    Args:
+        values: Sample values, in any order
+        q: Percentile between 0 and 100
+
+    Returns:
+        Percentile value, or None if there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
@@ -7,9 +7,11 @@ particularly focused on processing LLM-generated outputs.
 import json
 import copy
 import re
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 from pathlib import Path
 
+from src.utils.tolerant_json import JSONParseResult, parse_tolerant_json
+
 
 def load_json(file_path: Union[str, Path]) -> Any:
     """
@@ -46,6 +48,19 @@ def save_json(data: Any, path: Union[str, Path], indent: int = 4) -> None:
         json.dump(data, f, indent=indent)
 
 
+def save_jsonl(records: List[Any], path: Union[str, Path]) -> None:
+    """
+    Save records to a JSON Lines file, one record per line.
+
+    Args:
+        records: Records to save (each must be JSON-serializable)
+        path: Output file path
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
 def parse_json_string(input_string: str) -> Dict[str, Any]:
     """
     Parse a string containing a JSON dictionary, handling common formatting issues.
@@ -78,11 +93,93 @@ def parse_json_string(input_string: str) -> Dict[str, Any]:
         raise ValueError(f"Failed to parse JSON string: {str(e)}") from e
 
 
+def parse_failure_rate(answers: List[str]) -> Optional[float]:
+    """
+    Get the fraction of raw LLM answers no JSON object can be recovered from,
+    even after parse_tolerant_json's repairs.
+
+    Args:
+        answers: Raw LLM answer strings
+
+    Returns:
+        Failure rate, or None if there are no answers
+    """
+    if not answers:
+        return None
+    n_failed = sum(
+        not parse_tolerant_json(answer, expect=dict).ok for answer in answers
+    )
+    return round(n_failed / len(answers), 3)
+
+
+def count_parse_results(results: List[JSONParseResult]) -> Dict[str, int]:
+    """
+    Count the answers that needed repairs or could not be parsed, and how
+    often each kind of repair was made.
+
+    Args:
+        results: Parse results of LLM answers
+
+    Returns:
+        Counts keyed by "n_answers", "n_repaired", "n_failed" and repair kind
+    """
+    counts = {"n_answers": len(results), "n_repaired": 0, "n_failed": 0}
+    for result in results:
+        if not result.ok:
+            counts["n_failed"] += 1
+        elif result.repairs:
+            counts["n_repaired"] += 1
+        for repair in result.repairs:
+            counts[repair] = counts.get(repair, 0) + 1
+    return counts
+
+
+def split_packed_llm_response(
+    response_text: str,
+    report_ids: List[int],
+    keys_to_extract: List[str],
+    id_key: str = "report_id",
+) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    """
+    Split a packed multi-report LLM response into per-report answers.
+
+    An item counts as answered only if it is a dictionary carrying one of the
+    expected report IDs and every key in `keys_to_extract`.
+
+    Args:
+        response_text: Raw LLM response containing a JSON array of answers
+        report_ids: IDs of the reports packed into the prompt
+        keys_to_extract: Keys every answer must contain
+        id_key: Key holding the report ID in each answer
+
+    Returns:
+        Tuple of (answers by report ID, report IDs that need re-querying)
+    """
+    answers = {}
+    result = parse_tolerant_json(response_text, expect=list)
+    if not result.ok:
+        print(f"Error processing packed LLM response: {result.error}")
+    items = result.value if result.ok else []
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            report_id = int(item.get(id_key))
+        except (TypeError, ValueError):
+            continue
+        if report_id in report_ids and all(key in item for key in keys_to_extract):
+            answers[report_id] = {key: item[key] for key in keys_to_extract}
+
+    missing = [report_id for report_id in report_ids if report_id not in answers]
+    return answers, missing
+
+
 def process_llm_response(
     generated_report: Union[Dict[str, Any], str],
     report_template: Dict[str, Any],
     keys_to_extract: List[str],
-) -> Dict[str, Any]:
+) -> Tuple[Dict[str, Any], JSONParseResult]:
     """
     Process a single LLM response and extract specified keys.
 
@@ -93,9 +190,11 @@ def process_llm_response(
         keys_to_extract: Keys to extract from the LLM response
 
     Returns:
-        Updated report with extracted values
+        Tuple of (updated report with extracted values, parse result with
+        the repairs made or the error)
     """
     processed_report = copy.deepcopy(report_template)
+    result = JSONParseResult(error="No response")
 
     try:
         # Handle both string and dictionary inputs
@@ -104,16 +203,18 @@ def process_llm_response(
             if isinstance(generated_report, dict)
             else generated_report
         )
-        response_content = parse_json_string(response_text)
+        result = parse_tolerant_json(response_text, expect=dict)
+        if not result.ok:
+            raise ValueError(result.error)
 
         for key in keys_to_extract:
-            if key in response_content:
-                processed_report[key] = str(response_content[key])
+            if key in result.value:
+                processed_report[key] = str(result.value[key])
     except (KeyError, ValueError) as e:
         print(f"Error processing LLM response: {e}")
         print(f"Raw response: {generated_report}")
 
-    return processed_report
+    return processed_report, result
 
 
 def process_llm_batch(
@@ -122,7 +223,7 @@ def process_llm_batch(
     keys_to_extract: List[str],
     batch_size: int = 2,
     use_llama_cpp: bool = True,
-) -> List[Dict[str, Any]]:
+) -> Tuple[List[Dict[str, Any]], List[JSONParseResult]]:
     """
     Process a batch of LLM responses and extract specified keys.
 
@@ -134,24 +235,32 @@ def process_llm_batch(
         use_llama_cpp: Whether to use llama.cpp response format
 
     Returns:
-        List of processed reports
+        Tuple of (processed reports, parse result of each response)
     """
     results = copy.deepcopy(input_template[:batch_size])
+    parse_results = []
 
     for i, (answer, template) in enumerate(zip(generated_answers, results)):
+        if not use_llama_cpp:
+            results[i], result = process_llm_response(answer, template, keys_to_extract)
+            parse_results.append(result)
+            continue
         try:
-            if use_llama_cpp:
-                content = json.loads(answer["choices"][0]["message"]["content"])
-                for key in keys_to_extract:
-                    if key in content:
-                        template[key] = content[key]
-            else:
-                template = process_llm_response(answer, template, keys_to_extract)
-                results[i] = template
-        except (KeyError, json.JSONDecodeError, ValueError) as e:
-            print(f"Error processing batch item {i}: {e}")
-
-    return results
+            # Schema-constrained, but cut short if it hits the token budget
+            result = parse_tolerant_json(
+                answer["choices"][0]["message"]["content"], expect=dict
+            )
+        except (KeyError, IndexError, TypeError) as e:
+            result = JSONParseResult(error=f"Malformed completion: {e}")
+        parse_results.append(result)
+        if not result.ok:
+            print(f"Error processing batch item {i}: {result.error}")
+            continue
+        for key in keys_to_extract:
+            if key in result.value:
+                template[key] = result.value[key]
+
+    return results, parse_results
 
 
 def convert_to_strings(all_jsons):
@@ -0,0 +1,313 @@
+"""
+Tolerant single-pass JSON parser for LLM answers.
+Small models wrap answers in prose or markdown fences, quote with apostrophes,
+write Python literals, leave trailing or doubled commas and stop mid-object.
+The parser starts at the first opening bracket, repairs these as it scans and
+stops at the bracket that balances it, so text after the answer is ignored
+whatever it contains. Failures are returned in the result instead of raised.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"\s*")
+_NUMBER = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+# Unquoted keys run to the colon, unquoted values to the end of their line
+_BARE_KEY = re.compile(r"[^:,{}\[\]\"'\n]+")
+_BARE_VALUE = re.compile(r"[^,{}\[\]\n]+")
+_STRING_CHUNK = {'"': re.compile(r'[^"\\]*'), "'": re.compile(r"[^'\\]*")}
+_ESCAPES = {
+    '"': '"',
+    "'": "'",
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+_LITERALS = {"true": True, "false": False, "null": None}
+_PYTHON_LITERALS = {"True": True, "False": False, "None": None}
+# A quote ends its string only if followed by one of these (or a line break)
+_STRING_END_FOLLOWERS = ",:}]\n\r"
+
+
+@dataclass
+class JSONParseResult:
+    """Outcome of parsing one LLM answer."""
+
+    value: Any = None
+    error: Optional[str] = None
+    repairs: List[str] = field(default_factory=list)
+    start: int = -1
+    end: int = -1
+
+    @property
+    def ok(self) -> bool:
+        """Whether a value was recovered."""
+        return self.error is None
+
+
+class _ParseError(Exception):
+    """Raised inside the parser when a candidate cannot be repaired."""
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+class _Parser:
+    """Recursive-descent parser over one candidate, repairing as it goes."""
+
+    def __init__(self, text: str, position: int):
+        self.text = text
+        self.pos = position
+        self.repairs: List[str] = []
+
+    def repair(self, kind: str) -> None:
+        if kind not in self.repairs:
+            self.repairs.append(kind)
+
+    def at_end(self) -> bool:
+        """Skip whitespace and check whether the text has run out."""
+        self.pos = _WHITESPACE.match(self.text, self.pos).end()
+        if self.pos >= len(self.text):
+            self.repair("closed truncated output")
+            return True
+        return False
+
+    def parse_value(self, in_object: bool) -> Tuple[Any, bool]:
+        """
+        Parse the value at the current position.
+
+        Returns:
+            Tuple of (value, whether it was complete); a value cut off by the
+            end of the text is incomplete
+        """
+        if self.at_end():
+            return None, False
+        char = self.text[self.pos]
+        if char == "{":
+            return self.parse_object()
+        if char == "[":
+            return self.parse_array()
+        if char in _STRING_CHUNK:
+            return self.parse_string()
+        return self.parse_bare_value(in_object)
+
+    def parse_object(self) -> Tuple[Dict[str, Any], bool]:
+        self.pos += 1
+        result: Dict[str, Any] = {}
+        while not self.at_end():
+            char = self.text[self.pos]
+            if char == "}":
+                self.pos += 1
+                return result, True
+            if char == ",":
+                self.pos += 1
+                self.repair("removed extra comma")
+                continue
+            if char == "]":
+                self.pos += 1
+                self.repair("replaced mismatched bracket")
+                return result, True
+
+            key, complete = self.parse_key()
+            if not complete or self.at_end():
+                break
+            if self.text[self.pos] != ":":
+                raise _ParseError(f"Expected ':' after key {key!r}", self.pos)
+            self.pos += 1
+            value, complete = self.parse_value(in_object=True)
+            if not complete:
+                break
+            result[key] = value
+            if self.after_member("}"):
+                break
+        return result, False
+
+    def parse_array(self) -> Tuple[List[Any], bool]:
+        self.pos += 1
+        result: List[Any] = []
+        while not self.at_end():
+            char = self.text[self.pos]
+            if char == "]":
+                self.pos += 1
+                return result, True
+            if char == ",":
+                self.pos += 1
+                self.repair("removed extra comma")
+                continue
+            if char == "}":
+                self.pos += 1
+                self.repair("replaced mismatched bracket")
+                return result, True
+
+            value, complete = self.parse_value(in_object=False)
+            if not complete:
+                break
+            result.append(value)
+            if self.after_member("]"):
+                break
+        return result, False
+
+    def after_member(self, closer: str) -> bool:
+        """
+        Consume the separator after an object member or array item.
+
+        Returns:
+            Whether the text ran out
+        """
+        if self.at_end():
+            return True
+        char = self.text[self.pos]
+        if char == ",":
+            self.pos += 1
+            if self.at_end():
+                return True
+            if self.text[self.pos] == closer:
+                self.repair("removed trailing comma")
+        elif char not in "}]":
+            # Next member on its own line, without a comma
+            self.repair("inserted missing comma")
+        return False
+
+    def parse_key(self) -> Tuple[str, bool]:
+        if self.text[self.pos] in _STRING_CHUNK:
+            return self.parse_string()
+        match = _BARE_KEY.match(self.text, self.pos)
+        key = match.group(0).strip() if match else ""
+        if not key:
+            raise _ParseError(f"Unexpected {self.text[self.pos]!r}", self.pos)
+        self.pos = match.end()
+        self.repair("quoted bare key")
+        return key, True
+
+    def parse_string(self) -> Tuple[str, bool]:
+        text = self.text
+        quote = text[self.pos]
+        if quote == "'":
+            self.repair("replaced single quotes")
+        chunk = _STRING_CHUNK[quote]
+        self.pos += 1
+        parts = []
+        while True:
+            match = chunk.match(text, self.pos)
+            parts.append(match.group(0))
+            self.pos = match.end()
+            if self.pos >= len(text):
+                self.repair("closed truncated output")
+                return "".join(parts), False
+            if text[self.pos] == "\\":
+                parts.append(self.parse_escape())
+                continue
+            # A quote inside the string (e.g. an apostrophe) is kept as text
+            self.pos += 1
+            follower = _WHITESPACE.match(text, self.pos)
+            if (
+                follower.end() >= len(text)
+                or text[follower.end()] in _STRING_END_FOLLOWERS
+                or "\n" in follower.group(0)
+            ):
+                return "".join(parts), True
+            self.repair("escaped inner quote")
+            parts.append(quote)
+
+    def parse_escape(self) -> str:
+        text = self.text
+        escaped = text[self.pos + 1 : self.pos + 2]
+        if escaped == "u":
+            code = text[self.pos + 2 : self.pos + 6]
+            if len(code) == 4 and all(c in "0123456789abcdefABCDEF" for c in code):
+                self.pos += 6
+                return chr(int(code, 16))
+        self.pos += 2
+        if escaped in _ESCAPES:
+            return _ESCAPES[escaped]
+        self.repair("kept invalid escape")
+        return escaped
+
+    def parse_bare_value(self, in_object: bool) -> Tuple[Any, bool]:
+        match = _BARE_VALUE.match(self.text, self.pos)
+        token = match.group(0).rstrip() if match else ""
+        if not token:
+            raise _ParseError(f"Unexpected {self.text[self.pos]!r}", self.pos)
+        start = self.pos
+        self.pos += len(token)
+        complete = self.pos < len(self.text)
+        if not complete:
+            self.repair("closed truncated output")
+        if token in _LITERALS:
+            return _LITERALS[token], complete
+        if token in _PYTHON_LITERALS:
+            self.repair("replaced Python literal")
+            return _PYTHON_LITERALS[token], complete
+        number = _NUMBER.fullmatch(token)
+        if number:
+            if number.group(0)[0] == "+" or number.group(0)[-1] == ".":
+                self.repair("normalised number")
+            value = float(token) if any(c in token for c in ".eE") else int(token)
+            return value, complete
+        if not in_object:
+            # Only object values may be unquoted text; in an array it is prose
+            raise _ParseError(f"Unquoted text {token[:20]!r}", start)
+        self.repair("quoted bare value")
+        return token, complete
+
+
+def parse_tolerant_json(text: str, expect: Optional[type] = None) -> JSONParseResult:
+    """
+    Parse the first JSON object or array in an LLM answer.
+
+    Each opening bracket is tried in turn, so braces in prose before the
+    answer are skipped. Valid JSON is handed to the standard library decoder;
+    otherwise the tolerant parser repairs single quotes, Python literals,
+    bare keys and values, trailing, doubled or missing commas, unescaped inner
+    quotes and truncated output (a value cut off mid-way is dropped, the rest
+    is kept; output cut off before its first complete member is an error).
+
+    Args:
+        text: Raw LLM answer
+        expect: dict or list to accept only that type (None accepts either)
+
+    Returns:
+        Result holding the value and any repairs made, or the error of the
+        first candidate if none could be parsed
+    """
+    openers = {dict: "{", list: "["}.get(expect, "{[")
+    first_error = None
+    position = _find_opener(text, openers, 0)
+    while position != -1:
+        try:
+            # Fast path: valid JSON, with anything after it ignored
+            value, end = _DECODER.raw_decode(text, position)
+            return JSONParseResult(value=value, start=position, end=end)
+        except json.JSONDecodeError:
+            pass
+        parser = _Parser(text, position)
+        try:
+            value, complete = parser.parse_value(in_object=False)
+            if not complete and not value:
+                raise _ParseError("Truncated before any complete member", position)
+            return JSONParseResult(
+                value=value, repairs=parser.repairs, start=position, end=parser.pos
+            )
+        except _ParseError as e:
+            first_error = first_error or str(e)
+        except RecursionError:
+            first_error = first_error or f"Nesting too deep at position {position}"
+        position = _find_opener(text, openers, position + 1)
+
+    kind = {dict: "object", list: "array"}.get(expect, "object or array")
+    return JSONParseResult(error=first_error or f"No JSON {kind} found")
+
+
+def _find_opener(text: str, openers: str, start: int) -> int:
+    """Get the position of the next opening bracket, or -1."""
+    positions = [text.find(opener, start) for opener in openers]
+    positions = [position for position in positions if position != -1]
+    return min(positions) if positions else -1